@@ -1,6 +1,14 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_migrate
 
 
 class SnippetsConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "snippets"
+
+    def ready(self):
+        # Queries are timed on connections opened from now on.
+        from . import instrumentation, signals  # noqa: F401
+        from . import triggers
+
+        post_migrate.connect(triggers.repair_after_migrate, sender=self)
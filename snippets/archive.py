@@ -0,0 +1,127 @@
+"""
+Retention of the audit log.
+
+Entries older than the retention window are moved out of the database into
+gzipped JSON lines segments, one per UTC day: ``audit-YYYY-MM-DD.jsonl.gz``.
+Segments are append only; every archiving batch is appended as a new gzip
+member, which `gzip` reads back as one stream. A batch is written and synced
+before its rows are deleted, so an interrupted run at worst archives some
+entries twice, and `read_archive` skips those repeats.
+"""
+import gzip
+import json
+import os
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .conf import get_setting
+from .models import AuditLog
+
+SEGMENT_PREFIX = "audit-"
+SEGMENT_SUFFIX = ".jsonl.gz"
+
+ARCHIVED_FIELDS = ("id", "timestamp", "action", "user_id", "user__username", "model_name", "model_id")
+
+
+def archive_dir():
+    return get_setting("AUDIT_ARCHIVE_DIR") or os.path.join(settings.BASE_DIR, "audit_archive")
+
+
+def retention_cutoff(days=None):
+    if days is None:
+        days = get_setting("AUDIT_RETENTION_DAYS")
+    return timezone.now() - timedelta(days=days)
+
+
+def segment_path(directory, day):
+    return os.path.join(directory, f"{SEGMENT_PREFIX}{day.isoformat()}{SEGMENT_SUFFIX}")
+
+
+def segment_day(filename):
+    if not (filename.startswith(SEGMENT_PREFIX) and filename.endswith(SEGMENT_SUFFIX)):
+        return None
+    try:
+        return datetime.strptime(
+            filename[len(SEGMENT_PREFIX):-len(SEGMENT_SUFFIX)], "%Y-%m-%d"
+        ).date()
+    except ValueError:
+        return None
+
+
+def _append(path, records):
+    with open(path, "ab") as raw:
+        with gzip.GzipFile(fileobj=raw, mode="wb") as segment:
+            for record in records:
+                segment.write(json.dumps(record, cls=DjangoJSONEncoder).encode("utf-8"))
+                segment.write(b"\n")
+        raw.flush()
+        os.fsync(raw.fileno())
+
+
+def archive_audit_log(before, directory=None, batch_size=1000):
+    """
+    Move audit log entries with a timestamp before `before` into day
+    segments under `directory`, `batch_size` rows at a time. Returns the
+    number of entries archived and the set of segment paths written.
+    """
+    directory = directory or archive_dir()
+    os.makedirs(directory, exist_ok=True)
+    queryset = AuditLog.objects.filter(timestamp__lt=before).order_by("id")
+    archived = 0
+    segments = set()
+    while True:
+        batch = list(queryset.values(*ARCHIVED_FIELDS)[:batch_size])
+        if not batch:
+            break
+        by_day = {}
+        for record in batch:
+            record["username"] = record.pop("user__username")
+            day = record["timestamp"].astimezone(dt_timezone.utc).date()
+            # DjangoJSONEncoder would cut the timestamp to milliseconds.
+            record["timestamp"] = record["timestamp"].isoformat()
+            by_day.setdefault(day, []).append(record)
+        for day, records in by_day.items():
+            path = segment_path(directory, day)
+            _append(path, records)
+            segments.add(path)
+        # Ids only grow, so the batch is exactly the old rows in this range.
+        queryset.filter(id__gte=batch[0]["id"], id__lte=batch[-1]["id"]).delete()
+        archived += len(batch)
+    return archived, segments
+
+
+def read_archive(directory=None, start=None, end=None):
+    """
+    Yield archived entries with `start <= timestamp < end` as dicts, oldest
+    segment first. Either bound may be None. Only segments for days in range
+    are opened, and they are streamed rather than loaded.
+    """
+    directory = directory or archive_dir()
+    if not os.path.isdir(directory):
+        return
+    first_day = start.astimezone(dt_timezone.utc).date() if start else None
+    last_day = end.astimezone(dt_timezone.utc).date() if end else None
+    days = sorted(filter(None, map(segment_day, os.listdir(directory))))
+    for day in days:
+        if (first_day and day < first_day) or (last_day and day > last_day):
+            continue
+        last_id = 0
+        with gzip.open(segment_path(directory, day), "rt", encoding="utf-8") as segment:
+            for line in segment:
+                record = json.loads(line)
+                # Entries re-archived after an interrupted run repeat ids.
+                if record["id"] <= last_id:
+                    continue
+                last_id = record["id"]
+                # Segments written before microseconds were kept end in "Z",
+                # which fromisoformat() only reads from Python 3.11.
+                record["timestamp"] = parse_datetime(record["timestamp"])
+                if start and record["timestamp"] < start:
+                    continue
+                if end and record["timestamp"] >= end:
+                    continue
+                yield record
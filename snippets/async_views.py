@@ -0,0 +1,199 @@
+"""
+Async versions of the read endpoints, served under ``async/``.
+
+REST framework views are synchronous, so under ASGI every request to them
+runs in a worker thread. These views run on the event loop and only leave it
+for database queries, through Django's async ORM. They return the same JSON
+as their REST framework counterparts, without the browsable API, format
+suffixes or cursor pagination.
+"""
+import math
+
+from asgiref.sync import sync_to_async
+from django.http import HttpResponse, JsonResponse
+from django.views import View
+from rest_framework.exceptions import (
+    APIException,
+    AuthenticationFailed,
+    NotAuthenticated,
+    PermissionDenied,
+    ValidationError,
+)
+from rest_framework.pagination import PageNumberPagination
+from rest_framework.request import Request
+from rest_framework.reverse import reverse
+from rest_framework.settings import api_settings
+from rest_framework.utils.encoders import JSONEncoder
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+from .filters import AuditLogFilter
+from .highlight import FRAGMENT, document_parts
+from .models import RENDER_READY, AuditLog, Snippet
+from .serializers import AuditLogSerializer, SnippetSerializer, UserSerializer
+from .softdelete import include_deactivated
+from .views import (
+    RENDER_PLACEHOLDERS,
+    SNIPPET_HIGHLIGHT_FIELDS,
+    SNIPPET_SERIALIZER_FIELDS,
+    users_with_snippets,
+)
+
+
+def json_response(data, status=200):
+    return JsonResponse(data, status=status, encoder=JSONEncoder, safe=False)
+
+
+def error_response(status, detail):
+    return json_response({"detail": detail}, status=status)
+
+
+def _authenticate(request):
+    return Request(
+        request,
+        authenticators=[auth() for auth in api_settings.DEFAULT_AUTHENTICATION_CLASSES],
+    ).user
+
+
+async def get_user(request):
+    """
+    Authenticate like the REST framework views do. Token and Basic auth run
+    the configured authenticators in a thread; sessions are read natively.
+    """
+    if "HTTP_AUTHORIZATION" in request.META:
+        return await sync_to_async(_authenticate)(request)
+    return await request.auser()
+
+
+async def visible_snippets(request):
+    """
+    The manager of the snippets `request` may see, as
+    `snippets.views.visible_snippets` picks it.
+    """
+    # Only requests asking for them are authenticated.
+    if "include_deactivated" in request.GET and include_deactivated(await get_user(request), request.GET):
+        return Snippet.all_objects
+    return Snippet.objects
+
+
+class AsyncAPIView(View):
+    """
+    Turns REST framework exceptions into JSON error responses, challenging
+    unauthenticated requests like REST framework views do.
+    """
+
+    async def dispatch(self, request, *args, **kwargs):
+        try:
+            return await super().dispatch(request, *args, **kwargs)
+        except APIException as exc:
+            detail = exc.detail if isinstance(exc.detail, (list, dict)) else {"detail": exc.detail}
+            response = json_response(detail, status=exc.status_code)
+            if isinstance(exc, (NotAuthenticated, AuthenticationFailed)):
+                authenticator = api_settings.DEFAULT_AUTHENTICATION_CLASSES[0]()
+                header = authenticator.authenticate_header(request)
+                if header:
+                    response["WWW-Authenticate"] = header
+                else:
+                    response.status_code = 403
+            return response
+
+    def context(self, request):
+        return {"request": request}
+
+    async def paginate(self, request, queryset, serializer_class):
+        """
+        Return a page of `queryset` in the shape PageNumberPagination uses.
+        """
+        page_size = PageNumberPagination.page_size
+        count = await queryset.acount()
+        last = max(1, math.ceil(count / page_size))
+        page = request.GET.get("page", "1")
+        page = last if page == "last" else page
+        try:
+            page = int(page)
+        except ValueError:
+            page = 0
+        if not 1 <= page <= last:
+            return error_response(404, "Invalid page.")
+        offset = (page - 1) * page_size
+        objects = [obj async for obj in queryset[offset:offset + page_size]]
+        url = request.build_absolute_uri()
+        previous = None
+        if page > 1:
+            previous = remove_query_param(url, "page") if page == 2 else replace_query_param(url, "page", page - 1)
+        return json_response({
+            "count": count,
+            "next": replace_query_param(url, "page", page + 1) if page < last else None,
+            "previous": previous,
+            "results": serializer_class(objects, many=True, context=self.context(request)).data,
+        })
+
+
+class AsyncSnippetList(AsyncAPIView):
+    async def get(self, request):
+        snippets = await visible_snippets(request)
+        queryset = snippets.select_related("owner").only(*SNIPPET_SERIALIZER_FIELDS)
+        owner = request.GET.get("owner")
+        if owner is not None:
+            if not owner.isdigit():
+                raise ValidationError({"owner": "Expected a user id."})
+            queryset = queryset.filter(owner_id=owner)
+        return await self.paginate(request, queryset, SnippetSerializer)
+
+
+class AsyncSnippetDetail(AsyncAPIView):
+    async def get(self, request, pk):
+        snippets = await visible_snippets(request)
+        snippet = await (
+            snippets.select_related("owner")
+            .only(*SNIPPET_SERIALIZER_FIELDS)
+            .filter(pk=pk)
+            .afirst()
+        )
+        if snippet is None:
+            return error_response(404, "Not found.")
+        return json_response(SnippetSerializer(snippet, context=self.context(request)).data)
+
+
+class AsyncSnippetHighlight(AsyncAPIView):
+    async def get(self, request, pk):
+        snippets = await visible_snippets(request)
+        snippet = await (
+            snippets.select_related("highlighted_blob")
+            .only(*SNIPPET_HIGHLIGHT_FIELDS)
+            .filter(pk=pk)
+            .afirst()
+        )
+        if snippet is None:
+            return error_response(404, "Not found.")
+        if snippet.render_state != RENDER_READY:
+            response = HttpResponse(RENDER_PLACEHOLDERS[snippet.render_state], status=202)
+            response["Retry-After"] = "1"
+            return response
+        content = snippet.highlighted
+        if snippet.highlighted_format == FRAGMENT:
+            css_url = reverse("snippet-style-sheet", kwargs={"style": snippet.style}, request=request)
+            header, footer = document_parts(snippet.title, css_url)
+            content = header + content + footer
+        return HttpResponse(content, content_type="text/html; charset=utf-8")
+
+
+class AsyncUserList(AsyncAPIView):
+    async def get(self, request):
+        snippets = await visible_snippets(request)
+        queryset = users_with_snippets(snippets)
+        if snippets is Snippet.objects:
+            queryset = queryset.filter(is_active=True)
+        return await self.paginate(request, queryset, UserSerializer)
+
+
+class AsyncAuditLogList(AsyncAPIView):
+    async def get(self, request):
+        user = await get_user(request)
+        if not user.is_authenticated:
+            raise NotAuthenticated
+        if not user.is_staff:
+            raise PermissionDenied
+        queryset = AuditLog.objects.select_related("user").filter(
+            **AuditLogFilter().get_lookups(request.GET)
+        )
+        return await self.paginate(request, queryset, AuditLogSerializer)
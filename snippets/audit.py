@@ -0,0 +1,136 @@
+"""
+Where audit log entries are written.
+
+The "sync" sink inserts every entry as it is recorded, inside the request's
+transaction. The "buffered" sink queues entries once their transaction
+commits, so a rolled back change is never audited, and inserts them with
+`bulk_create` when the request finishes. Outside requests they are written
+when AUDIT_BUFFER_SIZE entries are queued, once the oldest has waited
+AUDIT_FLUSH_INTERVAL seconds, and at process exit. Entries are timestamped
+when they are recorded, not when they are written.
+"""
+import atexit
+import logging
+import threading
+from functools import partial
+
+from django.core.signals import request_finished
+from django.db import close_old_connections, transaction
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .conf import get_setting, on_settings_changed
+from .instrumentation import timed
+from .models import AuditLog
+
+logger = logging.getLogger(__name__)
+
+
+class SyncAuditSink:
+    def record(self, **fields):
+        AuditLog.objects.create(**fields)
+
+    def record_many(self, entries):
+        AuditLog.objects.bulk_create([AuditLog(**fields) for fields in entries])
+
+    def flush(self):
+        return 0
+
+
+class BufferedAuditSink:
+    def __init__(self, size, interval):
+        self.size = size
+        self.interval = interval
+        self._entries = []
+        self._lock = threading.Lock()
+        self._timer = None
+
+    def record(self, **fields):
+        self.record_many([fields])
+
+    def record_many(self, entries):
+        now = timezone.now()
+        entries = [AuditLog(timestamp=now, **fields) for fields in entries]
+        transaction.on_commit(partial(self._enqueue, entries))
+
+    def _enqueue(self, entries):
+        with self._lock:
+            self._entries.extend(entries)
+            full = len(self._entries) >= self.size
+            if not full and self._timer is None:
+                self._timer = threading.Timer(self.interval, self._flush_on_timer)
+                self._timer.daemon = True
+                self._timer.start()
+        if full:
+            self._flush_logged()
+
+    def flush(self):
+        """
+        Insert every queued entry. Returns the number of entries written.
+        """
+        with self._lock:
+            entries, self._entries = self._entries, []
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+        if entries:
+            with timed("audit"):
+                AuditLog.objects.bulk_create(entries, batch_size=self.size)
+        return len(entries)
+
+    def _flush_logged(self):
+        try:
+            self.flush()
+        except Exception:
+            logger.exception("Writing buffered audit log entries failed")
+
+    def _flush_on_timer(self):
+        try:
+            self._flush_logged()
+        finally:
+            close_old_connections()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+_sink = None
+_sink_lock = threading.Lock()
+
+
+def get_audit_sink():
+    global _sink
+    if _sink is None:
+        with _sink_lock:
+            if _sink is None:
+                kind = get_setting("AUDIT_SINK")
+                if kind == "sync":
+                    _sink = SyncAuditSink()
+                elif kind == "buffered":
+                    _sink = BufferedAuditSink(
+                        size=get_setting("AUDIT_BUFFER_SIZE"),
+                        interval=get_setting("AUDIT_FLUSH_INTERVAL"),
+                    )
+                else:
+                    raise ValueError(f"Unknown AUDIT_SINK {kind!r}")
+    return _sink
+
+
+@receiver(request_finished)
+def _flush_after_request(**kwargs):
+    # The request's committed changes are audited before the worker moves
+    # on, so a worker that dies later loses none of their entries.
+    if isinstance(_sink, BufferedAuditSink) and len(_sink):
+        _sink._flush_logged()
+
+
+@atexit.register
+@on_settings_changed
+def _reset_audit_sink():
+    global _sink
+    if _sink is not None:
+        try:
+            _sink.flush()
+        except Exception:
+            logger.exception("Writing buffered audit log entries failed")
+    _sink = None
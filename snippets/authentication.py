@@ -0,0 +1,127 @@
+"""
+REST framework authenticators that remember recent successful logins.
+
+Looking up a token costs a Token/User join per request, and checking a Basic
+auth password a full PBKDF2 hash. Both authenticators here keep successful
+results in a bounded, per-process cache for a few seconds. Entries for a user
+are dropped in this process when the user is saved (deactivated, password
+changed) or a token is deleted; other processes notice within the TTL.
+"""
+import copy
+import threading
+import time
+from collections import OrderedDict
+
+from django.utils.crypto import salted_hmac
+from rest_framework.authentication import BasicAuthentication, TokenAuthentication
+
+from .conf import get_setting, on_settings_changed
+
+
+class TTLCache:
+    """
+    A thread safe, bounded LRU whose entries expire `ttl` seconds after they
+    were stored. Values are (user, auth) pairs.
+    """
+
+    def __init__(self, maxsize, ttl):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires, value = entry
+            if expires < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        if self.maxsize <= 0 or self.ttl <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def evict_user(self, user_id):
+        with self._lock:
+            for key in [k for k, (_, (user, _)) in self._entries.items() if user.pk == user_id]:
+                del self._entries[key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+def get_auth_cache(name):
+    """
+    Return the "token" or "basic" authentication cache.
+    """
+    if name not in _caches:
+        with _caches_lock:
+            if name not in _caches:
+                prefix = name.upper()
+                _caches[name] = TTLCache(
+                    maxsize=get_setting(f"{prefix}_AUTH_CACHE_SIZE"),
+                    ttl=get_setting(f"{prefix}_AUTH_CACHE_TTL"),
+                )
+    return _caches[name]
+
+
+@on_settings_changed
+def _reset_auth_caches():
+    _caches.clear()
+
+
+def evict_user(user_id):
+    for auth_cache in list(_caches.values()):
+        auth_cache.evict_user(user_id)
+
+
+def evict_token(key):
+    if "token" in _caches:
+        _caches["token"].delete(key)
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    def authenticate_credentials(self, key):
+        auth_cache = get_auth_cache("token")
+        cached = auth_cache.get(key)
+        if cached is None:
+            cached = super().authenticate_credentials(key)
+            auth_cache.set(key, cached)
+        user, token = cached
+        # Each request gets its own copy of the shared user.
+        return copy.copy(user), token
+
+
+class CachedBasicAuthentication(BasicAuthentication):
+    def authenticate_credentials(self, userid, password, request=None):
+        auth_cache = get_auth_cache("basic")
+        # Keyed on a keyed hash, so the cache never holds passwords.
+        key = salted_hmac("snippets.basic-auth", f"{userid}\0{password}").hexdigest()
+        cached = auth_cache.get(key)
+        if cached is None:
+            cached = super().authenticate_credentials(userid, password, request)
+            auth_cache.set(key, cached)
+        user, auth = cached
+        return copy.copy(user), auth
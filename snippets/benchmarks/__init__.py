@@ -0,0 +1,46 @@
+"""
+Performance benchmarks, run with ``python manage.py benchmark <name>``.
+
+Every module in this package is a benchmark. It defines
+``add_arguments(parser)`` for its options and ``run(options)``, which returns
+a JSON serialisable dict of results. Benchmarks that need data should run
+inside `isolated_database` so they never touch the configured database.
+"""
+import pkgutil
+import time
+from contextlib import contextmanager
+from importlib import import_module
+
+from django.db import connection
+
+
+def discover():
+    """
+    Return a dict of benchmark name to module.
+    """
+    return {
+        info.name: import_module(f"{__name__}.{info.name}")
+        for info in pkgutil.iter_modules(__path__)
+        if not info.name.startswith("_")
+    }
+
+
+@contextmanager
+def isolated_database():
+    """
+    Point the default connection at a freshly migrated test database for the
+    duration of the block, and destroy it afterwards.
+    """
+    old_name = connection.settings_dict["NAME"]
+    connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+    try:
+        yield
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+
+
+@contextmanager
+def timer(results, name):
+    start = time.perf_counter()
+    yield
+    results[name] = time.perf_counter() - start
@@ -0,0 +1,127 @@
+"""
+Concurrent throughput of the sync and async read views under ASGI.
+
+Drives the project's ASGI application in process, with `--concurrency`
+requests in flight at a time, and reports requests per second and latency
+percentiles of each read endpoint in its REST framework and async form.
+"""
+import asyncio
+import statistics
+import time
+
+from django.contrib.auth.models import User
+from django.core.handlers.asgi import ASGIHandler
+from django.test import override_settings
+from django.urls import reverse
+from rest_framework.authtoken.models import Token
+
+from snippets.benchmarks import isolated_database
+from snippets.models import AuditLog, Snippet
+
+
+def add_arguments(parser):
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--snippets", type=int, default=200)
+
+
+async def request(app, path, headers):
+    """
+    Perform one GET through `app` and return its status code.
+    """
+    path, _, query = path.partition("?")
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "GET",
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode(),
+        "query_string": query.encode(),
+        "root_path": "",
+        "headers": [(b"host", b"testserver"), *headers],
+        "client": ("127.0.0.1", 0),
+        "server": ("testserver", 80),
+    }
+    disconnected = asyncio.Event()
+    sent = []
+
+    async def receive():
+        if not sent:
+            sent.append(None)
+            return {"type": "http.request", "body": b"", "more_body": False}
+        # Never disconnect; the handler cancels this wait when it is done.
+        await disconnected.wait()
+
+    messages = []
+
+    async def send(message):
+        messages.append(message)
+
+    await app(scope, receive, send)
+    return messages[0]["status"]
+
+
+async def measure(app, path, headers, requests, concurrency):
+    semaphore = asyncio.Semaphore(concurrency)
+    timings = []
+
+    async def one():
+        async with semaphore:
+            start = time.perf_counter()
+            status = await request(app, path, headers)
+            timings.append(time.perf_counter() - start)
+            if status != 200:
+                raise RuntimeError(f"GET {path} returned {status}")
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(requests)))
+    elapsed = time.perf_counter() - start
+    quantiles = statistics.quantiles(timings, n=100)
+    return {
+        "requests_per_second": requests / elapsed,
+        "p50_ms": quantiles[49] * 1000,
+        "p95_ms": quantiles[94] * 1000,
+        "p99_ms": quantiles[98] * 1000,
+    }
+
+
+def run(options):
+    with isolated_database(), override_settings(ALLOWED_HOSTS=["testserver"]):
+        user = User.objects.create(username="bench", is_staff=True)
+        Snippet.objects.bulk_create(
+            Snippet(code=f"x = {i}", owner=user, highlighted="") for i in range(options["snippets"])
+        )
+        AuditLog.objects.bulk_create(
+            AuditLog(action="create", user=user, model_name="Snippet", model_id=i)
+            for i in range(options["snippets"])
+        )
+        pk = Snippet.objects.values_list("pk", flat=True).first()
+        staff = [(b"authorization", f"Token {Token.objects.create(user=user).key}".encode())]
+        endpoints = [
+            ("snippet-list", {}, []),
+            ("snippet-detail", {"pk": pk}, []),
+            ("user-list", {}, []),
+            ("audit-log", {}, staff),
+        ]
+        app = ASGIHandler()
+        results = {}
+        for name, kwargs, headers in endpoints:
+            results[name] = {}
+            for kind, view_name in (("sync", name), ("async", f"async-{name}")):
+                path = reverse(view_name, kwargs=kwargs)
+                # Warm up imports and caches before measuring.
+                asyncio.run(measure(app, path, headers, 20, options["concurrency"]))
+                results[name][kind] = asyncio.run(
+                    measure(app, path, headers, options["requests"], options["concurrency"])
+                )
+            results[name]["speedup"] = (
+                results[name]["async"]["requests_per_second"]
+                / results[name]["sync"]["requests_per_second"]
+            )
+    return {
+        "requests": options["requests"],
+        "concurrency": options["concurrency"],
+        "endpoints": results,
+    }
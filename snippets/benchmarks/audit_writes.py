@@ -0,0 +1,50 @@
+"""
+Throughput of the synchronous and buffered audit log sinks.
+
+Records `--entries` audit log entries through each sink, one committed
+transaction per entry as a write request would, and reports entries per
+second including the final flush.
+"""
+import time
+
+from django.contrib.auth.models import User
+from django.db import transaction
+
+from snippets.audit import BufferedAuditSink, SyncAuditSink
+from snippets.benchmarks import isolated_database
+from snippets.models import AuditLog
+
+
+def add_arguments(parser):
+    parser.add_argument("--entries", type=int, default=20_000)
+    parser.add_argument("--buffer-size", type=int, default=100)
+
+
+def measure(sink, user, entries):
+    start = time.perf_counter()
+    for i in range(entries):
+        with transaction.atomic():
+            sink.record(user=user, action="create", model_name="Snippet", model_id=i)
+    sink.flush()
+    seconds = time.perf_counter() - start
+    return {"seconds": seconds, "entries_per_second": entries / seconds}
+
+
+def run(options):
+    entries = options["entries"]
+    with isolated_database():
+        user = User.objects.create(username="bench")
+        results = {
+            "entries": entries,
+            "sync": measure(SyncAuditSink(), user, entries),
+            # A long interval so only the size threshold triggers flushes.
+            "buffered": measure(
+                BufferedAuditSink(size=options["buffer_size"], interval=3600), user, entries
+            ),
+        }
+        if AuditLog.objects.count() != 2 * entries:
+            raise RuntimeError("Audit log entries were lost")
+    results["speedup"] = (
+        results["buffered"]["entries_per_second"] / results["sync"]["entries_per_second"]
+    )
+    return results
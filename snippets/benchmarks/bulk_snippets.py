@@ -0,0 +1,62 @@
+"""
+Throughput of creating snippets one request at a time versus in bulk.
+
+Creates `--items` snippets through POST /snippets/ one by one and through
+POST /snippets/bulk/ in batches of `--batch-size`, and reports snippets per
+second for both. Every snippet has distinct code so neither path is helped
+by the highlight cache.
+"""
+import time
+
+from django.contrib.auth.models import User
+from django.test import override_settings
+from rest_framework.reverse import reverse
+from rest_framework.test import APIClient
+
+from snippets import highlight
+from snippets.benchmarks import isolated_database
+from snippets.models import Snippet
+
+
+def add_arguments(parser):
+    parser.add_argument("--items", type=int, default=2000)
+    parser.add_argument("--batch-size", type=int, default=500)
+
+
+def item(n):
+    return {"title": f"snippet {n}", "code": f"def f{n}(x):\n    return x * {n}\n"}
+
+
+def check(response, expected):
+    if response.status_code != expected:
+        raise RuntimeError(f"Expected {expected}, got {response.status_code}: {response.data}")
+
+
+def run(options):
+    items = options["items"]
+    batch_size = options["batch_size"]
+    with isolated_database(), override_settings(ALLOWED_HOSTS=["testserver"]):
+        client = APIClient()
+        client.force_authenticate(user=User.objects.create(username="bench"))
+        highlight.get_render_cache().clear()
+
+        start = time.perf_counter()
+        for n in range(items):
+            check(client.post(reverse("snippet-list"), item(n), format="json"), 201)
+        single = time.perf_counter() - start
+
+        start = time.perf_counter()
+        for offset in range(items, 2 * items, batch_size):
+            batch = [item(n) for n in range(offset, min(offset + batch_size, 2 * items))]
+            check(client.post(reverse("snippet-bulk"), batch, format="json"), 201)
+        bulk = time.perf_counter() - start
+
+        if Snippet.objects.count() != 2 * items:
+            raise RuntimeError("Snippets were lost")
+    return {
+        "items": items,
+        "batch_size": batch_size,
+        "single": {"seconds": single, "snippets_per_second": items / single},
+        "bulk": {"seconds": bulk, "snippets_per_second": items / bulk},
+        "speedup": single / bulk,
+    }
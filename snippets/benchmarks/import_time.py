@@ -0,0 +1,63 @@
+"""
+Startup cost of importing snippets.models, with a lazy or eager catalog.
+
+Each sample runs ``django.setup()`` in a fresh interpreter. The "eager"
+variant also builds the language and style catalog, which is what importing
+snippets.models used to cost before the catalog became lazy.
+"""
+import json
+import statistics
+import subprocess
+import sys
+
+from django.conf import settings
+
+from snippets import catalog
+
+SCRIPT = """
+import json, os, resource, sys, time
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "tutorial.settings")
+start = time.perf_counter()
+import django
+django.setup()
+import snippets.models
+if sys.argv[1] == "eager":
+    from snippets import catalog
+    catalog.languages()
+    catalog.styles()
+print(json.dumps({
+    "seconds": time.perf_counter() - start,
+    "max_rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+}))
+"""
+
+
+def add_arguments(parser):
+    parser.add_argument("--repeat", type=int, default=5)
+
+
+def sample(variant):
+    output = subprocess.run(
+        [sys.executable, "-c", SCRIPT, variant],
+        cwd=settings.BASE_DIR,
+        capture_output=True,
+        check=True,
+        text=True,
+    ).stdout
+    return json.loads(output)
+
+
+def run(options):
+    results = {"precomputed_catalog": catalog.catalog_data is not None}
+    for variant in ("lazy", "eager"):
+        samples = [sample(variant) for _ in range(options["repeat"])]
+        seconds = [s["seconds"] for s in samples]
+        results[variant] = {
+            "median_seconds": statistics.median(seconds),
+            "min_seconds": min(seconds),
+            "max_rss_kb": max(s["max_rss_kb"] for s in samples),
+        }
+    results["saved_seconds"] = (
+        results["eager"]["median_seconds"] - results["lazy"]["median_seconds"]
+    )
+    return results
@@ -0,0 +1,79 @@
+"""
+Edit latency of incremental re-highlighting against full renders.
+
+For each of `--sizes` lines of generated Python, applies `--edits` random
+single line edits and times re-highlighting each edited snippet in full and
+incrementally from the render before the edit. Reports the median latency of
+both per size. Every incremental result is checked against the full render.
+"""
+import random
+import statistics
+import time
+
+from snippets import highlight, incremental
+
+WORDS = [
+    "append", "buffer", "cache", "config", "decode", "encode", "fetch", "flush",
+    "format", "handler", "index", "items", "join", "load", "merge", "parse",
+]
+INPUTS = ("python", "friendly", False, "")
+
+
+def add_arguments(parser):
+    parser.add_argument("--sizes", default="500,2000,8000,32000")
+    parser.add_argument("--edits", type=int, default=20)
+
+
+def generate(rng, lines):
+    code = []
+    while len(code) < lines:
+        name, arg = rng.sample(WORDS, 2)
+        code += [
+            f"def {name}_{len(code)}({arg}, *args):",
+            f'    """Return the {name} of {arg}."""',
+            f"    result = {arg}.{rng.choice(WORDS)}({rng.randrange(1000)}, 'text')",
+            "    # " + " ".join(rng.sample(WORDS, 4)),
+            "    return result",
+            "",
+        ]
+    return "\n".join(code[:lines]) + "\n"
+
+
+def edit(rng, code):
+    lines = code.split("\n")
+    line = rng.randrange(len(lines) - 1)
+    lines[line] += f" + {rng.choice(WORDS)}"
+    return "\n".join(lines)
+
+
+def measure(size, edits):
+    rng = random.Random(size)
+    code = generate(rng, size)
+    html, checkpoints = incremental.render(code, *INPUTS)
+    full, partial = [], []
+    for _ in range(edits):
+        edited = edit(rng, code)
+        start = time.perf_counter()
+        expected = highlight.render(edited, *INPUTS)
+        full.append(time.perf_counter() - start)
+
+        previous = incremental.Previous(code, *INPUTS, False, html, checkpoints)
+        start = time.perf_counter()
+        html, checkpoints = incremental.rerender(previous, edited, *INPUTS)
+        partial.append(time.perf_counter() - start)
+        if html != expected:
+            raise RuntimeError(f"Incremental render of {size} lines differs from a full render")
+        code = edited
+    return statistics.median(full) * 1000, statistics.median(partial) * 1000
+
+
+def run(options):
+    results = {}
+    for size in (int(size) for size in options["sizes"].split(",")):
+        full_ms, incremental_ms = measure(size, options["edits"])
+        results[size] = {
+            "full_ms": full_ms,
+            "incremental_ms": incremental_ms,
+            "speedup": full_ms / incremental_ms,
+        }
+    return {"edits": options["edits"], "median_by_lines": results}
@@ -0,0 +1,53 @@
+"""
+Overhead of the per-request instrumentation.
+
+Requests a page of the snippet list `--requests` times with instrumentation
+switched on and off and reports the median latency of each.
+"""
+import statistics
+import time
+
+from django.contrib.auth.models import User
+from django.test import override_settings
+from rest_framework.reverse import reverse
+from rest_framework.test import APIClient
+
+from snippets.benchmarks import isolated_database
+from snippets.models import Snippet
+
+
+def add_arguments(parser):
+    parser.add_argument("--requests", type=int, default=500)
+
+
+def measure(client, url, requests, enabled):
+    timings = []
+    with override_settings(SNIPPETS={"INSTRUMENTATION": enabled}):
+        for _ in range(requests):
+            start = time.perf_counter()
+            response = client.get(url)
+            timings.append(time.perf_counter() - start)
+            if response.status_code != 200:
+                raise RuntimeError(f"GET {url} returned {response.status_code}")
+    return statistics.median(timings) * 1000
+
+
+def run(options):
+    with isolated_database(), override_settings(ALLOWED_HOSTS=["testserver"]):
+        user = User.objects.create(username="bench")
+        Snippet.objects.bulk_create(
+            Snippet(code=f"x = {i}", owner=user, highlighted="") for i in range(50)
+        )
+        client = APIClient()
+        client.force_authenticate(user=user)
+        url = reverse("snippet-list")
+        # Warm up imports and caches before measuring.
+        measure(client, url, 20, True)
+        off = measure(client, url, options["requests"], False)
+        on = measure(client, url, options["requests"], True)
+    return {
+        "requests": options["requests"],
+        "median_ms": {"off": off, "on": on},
+        "overhead_ms": on - off,
+        "overhead_ratio": on / off - 1,
+    }
@@ -0,0 +1,180 @@
+"""
+Load test of the API endpoints through the real URL routes.
+
+Seeds `--users` users, `--snippets` snippets and `--audit-entries` audit log
+entries, then sends `--requests` requests to each endpoint scenario through
+the test client, which runs the full middleware and URL stack in process.
+Reports requests per second, latency percentiles and queries per request for
+every scenario. Pass the JSON of an earlier run as `--baseline` to list the
+scenarios that got slower (by more than `--tolerance`) or run more queries.
+"""
+import json
+import random
+import statistics
+import time
+
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.reverse import reverse
+from rest_framework.test import APIClient
+
+from snippets import highlight
+from snippets.benchmarks import isolated_database
+from snippets.models import AuditLog, Snippet, store_highlights
+
+SAMPLES = [
+    "def add(a, b):\n    return a + b\n",
+    "for i in range(10):\n    print(i * i)\n" * 5,
+    "class Point:\n    def __init__(self, x, y):\n        self.x, self.y = x, y\n" * 10,
+]
+
+
+def add_arguments(parser):
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--snippets", type=int, default=5000)
+    parser.add_argument("--audit-entries", type=int, default=50_000)
+    parser.add_argument("--requests", type=int, default=200, help="Requests per scenario.")
+    parser.add_argument("--scenario", action="append", help="Only run these scenarios.")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--baseline", help="Results of an earlier run to compare against.")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+
+
+def seed(options):
+    users = User.objects.bulk_create(
+        User(username=f"user{i}", is_staff=i == 0) for i in range(options["users"])
+    )
+    rendered = [highlight.render(code, "python", "friendly", False, "") for code in SAMPLES]
+    snippets = []
+    for i in range(options["snippets"]):
+        n = i % len(SAMPLES)
+        snippets.append(Snippet(
+            title=f"snippet {i}", code=SAMPLES[n], owner=users[i % len(users)],
+            highlighted=rendered[n],
+            render_key=highlight.render_key(SAMPLES[n], "python", "friendly", False, f"snippet {i}"),
+        ))
+    store_highlights(snippets)
+    Snippet.objects.bulk_create(snippets, batch_size=2000)
+    AuditLog.objects.bulk_create(
+        (
+            AuditLog(user=users[i % len(users)], action="create", model_name="Snippet", model_id=i)
+            for i in range(options["audit_entries"])
+        ),
+        batch_size=5000,
+    )
+    return users
+
+
+def scenarios(users, rng):
+    """
+    Return {name: (client, make_request)} where make_request(client) sends
+    one request and returns the response.
+    """
+    anonymous = APIClient()
+    staff = APIClient()
+    staff.force_authenticate(user=users[0])
+    owner = APIClient()
+    owner.force_authenticate(user=users[1])
+    snippet_ids = list(Snippet.objects.values_list("id", flat=True))
+    user_ids = [user.pk for user in users]
+    pages = max(1, len(snippet_ids) // 10)
+
+    def pick(ids):
+        return ids[rng.randrange(len(ids))]
+
+    return {
+        "snippet-list": lambda: anonymous.get(reverse("snippet-list")),
+        "snippet-list-deep-page": lambda: anonymous.get(reverse("snippet-list"), {"page": pages}),
+        "snippet-list-cursor": lambda: anonymous.get(reverse("snippet-list"), {"pagination": "cursor"}),
+        "snippet-detail": lambda: anonymous.get(reverse("snippet-detail", kwargs={"pk": pick(snippet_ids)})),
+        "snippet-highlight": lambda: anonymous.get(
+            reverse("snippet-highlight", kwargs={"pk": pick(snippet_ids)})
+        ),
+        "snippet-create": lambda: owner.post(
+            reverse("snippet-list"), {"code": f"x = {rng.random()}"}, format="json"
+        ),
+        "snippet-bulk-create": lambda: owner.post(
+            reverse("snippet-bulk"), [{"code": f"x = {rng.random()}"} for _ in range(50)], format="json"
+        ),
+        "user-list": lambda: staff.get(reverse("user-list")),
+        "user-detail": lambda: staff.get(reverse("user-detail", kwargs={"pk": pick(user_ids)})),
+        "audit-log": lambda: staff.get(reverse("audit-log")),
+        "audit-log-filtered": lambda: staff.get(reverse("audit-log"), {"user": pick(user_ids)}),
+    }
+
+
+def percentile(sorted_values, fraction):
+    return sorted_values[min(len(sorted_values) - 1, int(fraction * len(sorted_values)))]
+
+
+def measure(make_request, requests):
+    latencies = []
+    queries = []
+    errors = 0
+    start = time.perf_counter()
+    for _ in range(requests):
+        with CaptureQueriesContext(connection) as captured:
+            request_start = time.perf_counter()
+            response = make_request()
+            if getattr(response, "streaming", False):
+                b"".join(response.streaming_content)
+            latencies.append(time.perf_counter() - request_start)
+        queries.append(len(captured))
+        if response.status_code >= 400:
+            errors += 1
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    return {
+        "requests": requests,
+        "errors": errors,
+        "requests_per_second": requests / elapsed,
+        "latency_ms": {
+            "p50": percentile(latencies, 0.50) * 1000,
+            "p95": percentile(latencies, 0.95) * 1000,
+            "p99": percentile(latencies, 0.99) * 1000,
+            "max": latencies[-1] * 1000,
+        },
+        "queries": {"mean": statistics.fmean(queries), "max": max(queries)},
+    }
+
+
+def compare(results, baseline, tolerance):
+    regressions = []
+    for name, result in results.items():
+        before = baseline.get("scenarios", {}).get(name)
+        if before is None:
+            continue
+        p50, old_p50 = result["latency_ms"]["p50"], before["latency_ms"]["p50"]
+        if p50 > old_p50 * (1 + tolerance):
+            regressions.append({"scenario": name, "metric": "p50_ms", "baseline": old_p50, "now": p50})
+        queries, old_queries = result["queries"]["mean"], before["queries"]["mean"]
+        # Buffered writes add the odd query, so only flag a whole query more.
+        if queries >= old_queries + 1:
+            regressions.append(
+                {"scenario": name, "metric": "queries", "baseline": old_queries, "now": queries}
+            )
+    return regressions
+
+
+def run(options):
+    rng = random.Random(options["seed"])
+    with isolated_database(), override_settings(ALLOWED_HOSTS=["testserver"]):
+        users = seed(options)
+        available = scenarios(users, rng)
+        names = options["scenario"] or list(available)
+        unknown = set(names) - set(available)
+        if unknown:
+            raise ValueError(f"Unknown scenarios {sorted(unknown)}, choose from {sorted(available)}")
+        results = {name: measure(available[name], options["requests"]) for name in names}
+    report = {
+        "users": options["users"],
+        "snippets": options["snippets"],
+        "audit_entries": options["audit_entries"],
+        "scenarios": results,
+    }
+    if options["baseline"]:
+        with open(options["baseline"]) as f:
+            report["regressions"] = compare(results, json.load(f), options["tolerance"])
+    return report
@@ -0,0 +1,86 @@
+"""
+Latency of shallow and deep pages with page number and cursor pagination.
+
+Seeds the audit log (200k rows by default) and requests the first page and a
+page at `--depth` through the API with both pagination modes. Page numbers
+pay for a COUNT(*) and an OFFSET that grows with depth; cursor pages are
+keyset queries and should cost the same at any depth.
+"""
+import time
+
+from django.contrib.auth.models import User
+from django.test import override_settings
+from rest_framework.pagination import Cursor, CursorPagination
+from rest_framework.reverse import reverse
+from rest_framework.test import APIClient
+
+from snippets.benchmarks import isolated_database
+from snippets.models import AuditLog
+from snippets.views import AuditLogList
+
+
+def add_arguments(parser):
+    parser.add_argument("--rows", type=int, default=200_000)
+    parser.add_argument(
+        "--depth", type=float, default=0.9,
+        help="Position of the deep page as a fraction of the table.",
+    )
+    parser.add_argument("--repeat", type=int, default=20)
+
+
+def seed(rows, user):
+    batch = []
+    for i in range(rows):
+        batch.append(AuditLog(user=user, action="create", model_name="Snippet", model_id=i))
+        if len(batch) == 10_000:
+            AuditLog.objects.bulk_create(batch)
+            batch = []
+    AuditLog.objects.bulk_create(batch)
+
+
+def cursor_at(url, position):
+    # Forge the cursor a client would hold after paging to `position`.
+    paginator = CursorPagination()
+    paginator.ordering = AuditLogList.cursor_ordering
+    paginator.base_url = url
+    return paginator.encode_cursor(Cursor(offset=0, reverse=False, position=str(position)))
+
+
+def measure(client, url, params, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        response = client.get(url, params)
+        timings.append(time.perf_counter() - start)
+        if response.status_code != 200:
+            raise RuntimeError(f"GET {url} returned {response.status_code}")
+    timings.sort()
+    return {"median": timings[len(timings) // 2], "max": timings[-1]}
+
+
+def run(options):
+    with isolated_database(), override_settings(ALLOWED_HOSTS=["testserver"]):
+        user = User.objects.create(username="bench", is_staff=True)
+        seed(options["rows"], user)
+        client = APIClient()
+        client.force_authenticate(user=user)
+        url = reverse("audit-log")
+        page_size = 10
+        deep_page = max(1, int(options["rows"] * options["depth"]) // page_size)
+        # The id just above the first row of `deep_page` in "-id" order.
+        top_id = AuditLog.objects.order_by("-id").values_list("id", flat=True)[0]
+        deep_position = top_id - (deep_page - 1) * page_size + 1
+        repeat = options["repeat"]
+        results = {
+            "rows": options["rows"],
+            "deep_page": deep_page,
+            "page_number": {
+                "first": measure(client, url, {}, repeat),
+                "deep": measure(client, url, {"page": deep_page}, repeat),
+            },
+            "cursor": {
+                "first": measure(client, url, {"pagination": "cursor"}, repeat),
+                "deep": measure(client, cursor_at(url, deep_position), {}, repeat),
+            },
+        }
+    return results
@@ -0,0 +1,98 @@
+"""
+Snippet search with the FTS5 index against an ``icontains`` scan.
+
+Seeds `--rows` snippets of generated code, then runs the same queries
+through both search backends: the first page of results, ranked and
+highlighted, with and without a language filter. Reports the median
+latency of each and the time spent indexing while seeding.
+"""
+import random
+import statistics
+import time
+
+from django.contrib.auth.models import User
+from django.db import connection
+
+from snippets.benchmarks import isolated_database, timer
+from snippets.models import Snippet
+from snippets.search import FTS5Backend, ScanBackend
+
+WORDS = [
+    "append", "buffer", "cache", "config", "decode", "encode", "fetch", "flush",
+    "format", "handler", "index", "items", "join", "load", "merge", "parse",
+    "query", "reader", "render", "request", "result", "session", "split",
+    "stream", "token", "update", "value", "worker", "writer", "yield",
+]
+LANGUAGES = ["python", "javascript", "rust", "go"]
+PAGE_SIZE = 10
+
+
+def add_arguments(parser):
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--queries", type=int, default=20)
+    parser.add_argument("--batch-size", type=int, default=10_000)
+
+
+def generate(rng, owner, count):
+    for _ in range(count):
+        lines = [
+            f"{rng.choice(WORDS)} = {rng.choice(WORDS)}({rng.choice(WORDS)}, {rng.randrange(1000)})"
+            for _ in range(rng.randint(2, 8))
+        ]
+        yield Snippet(
+            title=f"{rng.choice(WORDS)} {rng.choice(WORDS)}",
+            code="\n".join(lines),
+            language=rng.choice(LANGUAGES),
+            owner=owner,
+            highlighted="",
+            render_key="x",
+        )
+
+
+def seed(rows, batch_size):
+    rng = random.Random(0)
+    owner = User.objects.create(username="bench")
+    for start in range(0, rows, batch_size):
+        Snippet.objects.bulk_create(generate(rng, owner, min(batch_size, rows - start)))
+
+
+def measure(backend, queries, **filters):
+    queryset = Snippet.objects.select_related("owner").filter(**filters)
+    timings = []
+    for terms in queries:
+        start = time.perf_counter()
+        results = backend.search(queryset, terms)
+        results.count()
+        page = list(results[:PAGE_SIZE])
+        backend.highlight(page, terms)
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings) * 1000
+
+
+def run(options):
+    rng = random.Random(1)
+    # Mostly rare combinations, as people search, plus a common prefix.
+    queries = [rng.sample(WORDS, 2) + [str(rng.randrange(1000))] for _ in range(options["queries"])]
+    queries += [["pars"]]
+    results = {}
+    with isolated_database():
+        with timer(results, "seed_with_index_s"):
+            seed(options["rows"], options["batch_size"])
+        with connection.cursor() as cursor:
+            FTS5Backend.uninstall(cursor)
+        with timer(results, "build_index_s"):
+            with connection.cursor() as cursor:
+                FTS5Backend.install(cursor)
+        median_ms = {}
+        for name, backend in (("fts5", FTS5Backend()), ("scan", ScanBackend())):
+            median_ms[name] = {
+                "all": measure(backend, queries),
+                "language": measure(backend, queries, language="python"),
+            }
+    return {
+        "rows": options["rows"],
+        "queries": len(queries),
+        **results,
+        "median_ms": median_ms,
+        "speedup": median_ms["scan"]["all"] / median_ms["fts5"]["all"],
+    }
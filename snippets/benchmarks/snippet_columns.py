@@ -0,0 +1,84 @@
+"""
+Bytes and time spent reading the snippet list with and without deferring columns.
+
+Seeds a table of snippets (100k by default) and reads it with the columns the
+views used to select (every column) and with the deferred column lists they
+use now, counting the bytes of every value fetched.
+"""
+import time
+
+from django.contrib.auth.models import User
+from django.db import connection
+
+from snippets import highlight, views
+from snippets.benchmarks import isolated_database
+from snippets.models import Snippet, store_highlights
+
+SAMPLES = [
+    "def add(a, b):\n    return a + b\n",
+    "for i in range(10):\n    print(i * i)\n" * 5,
+    "class Point:\n    def __init__(self, x, y):\n        self.x, self.y = x, y\n" * 10,
+]
+
+
+def add_arguments(parser):
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument(
+        "--storage",
+        choices=(highlight.FRAGMENT, highlight.DOCUMENT),
+        default=highlight.DOCUMENT,
+        help="How the seeded highlighted HTML is stored.",
+    )
+
+
+def seed(rows, storage):
+    owner = User.objects.create(username="bench")
+    full = storage == highlight.DOCUMENT
+    rendered = [highlight.render(code, "python", "friendly", False, "", full) for code in SAMPLES]
+    batch = []
+    for i in range(rows):
+        n = i % len(SAMPLES)
+        batch.append(Snippet(
+            title=f"snippet {i}", code=SAMPLES[n], owner=owner,
+            highlighted=rendered[n], highlighted_format=storage,
+        ))
+        if len(batch) == 5000:
+            store_highlights(batch)
+            Snippet.objects.bulk_create(batch)
+            batch = []
+    store_highlights(batch)
+    Snippet.objects.bulk_create(batch)
+
+
+def read(queryset):
+    sql, params = queryset.query.sql_with_params()
+    start = time.perf_counter()
+    total = 0
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        for row in cursor.fetchall():
+            for value in row:
+                if isinstance(value, str):
+                    total += len(value.encode("utf-8"))
+                elif isinstance(value, bytes):
+                    total += len(value)
+                elif value is not None:
+                    total += 8
+    return {"bytes": total, "seconds": time.perf_counter() - start}
+
+
+def run(options):
+    with isolated_database():
+        seed(options["rows"], options["storage"])
+        everything = Snippet.objects.select_related("owner", "highlighted_blob").all()
+        deferred = Snippet.objects.select_related("owner").only(*views.SNIPPET_SERIALIZER_FIELDS)
+        results = {
+            "rows": options["rows"],
+            "storage": options["storage"],
+            "all_columns": read(everything),
+            "deferred_columns": read(deferred),
+        }
+    results["bytes_saved_ratio"] = 1 - (
+        results["deferred_columns"]["bytes"] / results["all_columns"]["bytes"]
+    )
+    return results
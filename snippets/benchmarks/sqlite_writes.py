@@ -0,0 +1,110 @@
+"""
+Concurrent write throughput and lock errors of SQLite, stock and tuned.
+
+Runs `--threads` writers against a fresh database file, each committing
+`--writes` transactions that read the owner and then insert a snippet and
+an audit log entry, as creating a snippet does. The database is configured
+once like Django's SQLite backend out of the box (rollback journal,
+deferred transactions) and once with the defaults of
+`tutorial.backends.sqlite3` (WAL, immediate transactions). Reports commits
+per second and the writes that failed with "database is locked". The tuned
+configuration must have none.
+"""
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+from django.contrib.auth.models import User
+from django.db import DEFAULT_DB_ALIAS, OperationalError, connections, transaction
+
+from snippets.benchmarks import isolated_database
+from snippets.models import AuditLog, Snippet
+from tutorial.backends.sqlite3.base import DEFAULT_PRAGMAS
+
+CONFIGS = {
+    "stock": {"pragmas": dict.fromkeys(DEFAULT_PRAGMAS), "transaction_mode": "DEFERRED"},
+    "tuned": {"transaction_mode": "IMMEDIATE"},
+}
+
+
+def add_arguments(parser):
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--writes", type=int, default=200)
+
+
+def write(alias, owner_pk, writes, start, errors):
+    try:
+        start.wait()
+        for i in range(writes):
+            try:
+                with transaction.atomic(using=alias):
+                    owner = User.objects.using(alias).get(pk=owner_pk)
+                    Snippet.objects.using(alias).bulk_create([Snippet(code=f"x = {i}", owner=owner)])
+                    AuditLog.objects.using(alias).create(
+                        user=owner, action="create", model_name="Snippet", model_id=i
+                    )
+            except OperationalError as exc:
+                if "locked" not in str(exc):
+                    raise
+                errors.append(exc)
+    finally:
+        connections[alias].close()
+
+
+def measure(name, options, directory, threads, writes):
+    alias = f"sqlite_writes_{name}"
+    path = str(Path(directory) / f"{name}.sqlite3")
+    # The data migrations only write to the default database, so copy its
+    # freshly migrated schema, triggers included, instead of migrating.
+    with connections[DEFAULT_DB_ALIAS].cursor() as cursor:
+        cursor.execute("VACUUM INTO %s", [path])
+    connections.settings[alias] = connections.configure_settings({
+        DEFAULT_DB_ALIAS: connections.settings[DEFAULT_DB_ALIAS],
+        alias: {
+            "ENGINE": "tutorial.backends.sqlite3",
+            "NAME": path,
+            "OPTIONS": options,
+        },
+    })[alias]
+    try:
+        owner = User.objects.using(alias).create(username="bench")
+        connections[alias].close()
+        start, errors = threading.Barrier(threads + 1), []
+        workers = [
+            threading.Thread(target=write, args=(alias, owner.pk, writes, start, errors))
+            for _ in range(threads)
+        ]
+        for worker in workers:
+            worker.start()
+        start.wait()
+        started = time.perf_counter()
+        for worker in workers:
+            worker.join()
+        seconds = time.perf_counter() - started
+        committed = threads * writes - len(errors)
+        if Snippet.all_objects.using(alias).count() != committed:
+            raise RuntimeError(f"Commits of the {name} configuration were lost")
+        return {
+            "seconds": seconds,
+            "commits": committed,
+            "commits_per_second": committed / seconds,
+            "lock_errors": len(errors),
+        }
+    finally:
+        connections[alias].close()
+        del connections.settings[alias]
+
+
+def run(options):
+    threads, writes = options["threads"], options["writes"]
+    results = {"threads": threads, "writes_per_thread": writes}
+    with isolated_database(), tempfile.TemporaryDirectory() as directory:
+        for name, database_options in CONFIGS.items():
+            results[name] = measure(name, database_options, directory, threads, writes)
+    if results["tuned"]["lock_errors"]:
+        raise RuntimeError("The tuned configuration failed writes with lock errors")
+    results["speedup"] = (
+        results["tuned"]["commits_per_second"] / results["stock"]["commits_per_second"]
+    )
+    return results
@@ -0,0 +1,86 @@
+"""
+Rows per second serialized by the list serializers and their values() paths.
+
+Seeds `--rows` snippets over `--users` users and serializes all of them, and
+all users, with SnippetSerializer and UserSerializer over model instances
+and with SnippetValuesSerializer and UserValuesSerializer over values()
+rows. Database reads are included in both. The outputs are checked to be
+identical.
+"""
+import time
+
+from django.contrib.auth.models import User
+from django.test import override_settings
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from snippets import views
+from snippets.benchmarks import isolated_database
+from snippets.models import Snippet
+from snippets.serializers import (
+    SnippetSerializer,
+    SnippetValuesSerializer,
+    UserSerializer,
+    UserValuesSerializer,
+)
+
+
+def add_arguments(parser):
+    parser.add_argument("--rows", type=int, default=20_000)
+    parser.add_argument("--users", type=int, default=2_000)
+    parser.add_argument("--repeat", type=int, default=3)
+
+
+def seed(rows, users):
+    owners = User.objects.bulk_create(User(username=f"user{i}") for i in range(users))
+    Snippet.objects.bulk_create(
+        (
+            Snippet(title=f"snippet {i}", code=f"x = {i}\n", owner=owners[i % users], linenos=i % 2 == 0)
+            for i in range(rows)
+        ),
+        batch_size=2000,
+    )
+
+
+def measure(repeat, rows, serialize):
+    best, output = float("inf"), None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        output = serialize()
+        best = min(best, time.perf_counter() - start)
+    return {"seconds": best, "rows_per_second": rows / best}, output
+
+
+def compare(name, repeat, rows, instances, values):
+    instance_result, expected = measure(repeat, rows, instances)
+    values_result, output = measure(repeat, rows, values)
+    if output != expected:
+        raise RuntimeError(f"The values() path of {name} differs from the serializer")
+    return {
+        "serializer": instance_result,
+        "values": values_result,
+        "speedup": instance_result["seconds"] / values_result["seconds"],
+    }
+
+
+def run(options):
+    repeat = options["repeat"]
+    context = {"request": Request(APIRequestFactory().get("/snippets/")), "format": None}
+    with isolated_database(), override_settings(ALLOWED_HOSTS=["testserver"]):
+        seed(options["rows"], options["users"])
+        snippets = Snippet.objects.select_related("owner").only(*views.SNIPPET_SERIALIZER_FIELDS)
+        users = views.users_with_snippets(Snippet.objects)
+        snippet_values = SnippetValuesSerializer(context)
+        user_values = UserValuesSerializer(context)
+        return {
+            "snippets": compare(
+                "SnippetSerializer", repeat, options["rows"],
+                lambda: SnippetSerializer(snippets.all(), many=True, context=context).data,
+                lambda: snippet_values.serialize(snippet_values.values(snippets)),
+            ),
+            "users": compare(
+                "UserSerializer", repeat, options["users"],
+                lambda: UserSerializer(users.all(), many=True, context=context).data,
+                lambda: user_values.serialize(user_values.values(users)),
+            ),
+        }
@@ -0,0 +1,114 @@
+"""
+Content addressed storage of highlighted HTML.
+
+Identical snippets render to identical HTML, so rather than a copy per row
+the HTML is stored once in a `Blob` keyed on its sha256, and snippets point
+at it. Blobs of at least BLOB_COMPRESS_MIN_SIZE bytes are zlib compressed
+when that makes them smaller.
+
+Each blob counts the snippets referencing it. On SQLite triggers on the
+snippets table keep the counts, whichever way rows are written, and delete
+a blob when its last snippet stops using it. Like the search index triggers
+they are lost when a migration rebuilds the table; `snippets.triggers`
+reinstalls them after ``migrate`` and refuses other databases, which have
+none. ``python manage.py blob_storage --repair`` reinstalls them, recounts
+and drops unreferenced blobs.
+"""
+import hashlib
+import zlib
+
+from django.db.models import Count, F, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce, Length
+
+from .conf import get_setting
+
+SCHEMA = [
+    """CREATE TRIGGER IF NOT EXISTS snippets_blob_ref_insert AFTER INSERT ON snippets_snippet
+    WHEN new.highlighted_blob_id IS NOT NULL BEGIN
+        UPDATE snippets_blob SET refcount = refcount + 1 WHERE hash = new.highlighted_blob_id;
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS snippets_blob_ref_delete AFTER DELETE ON snippets_snippet
+    WHEN old.highlighted_blob_id IS NOT NULL BEGIN
+        UPDATE snippets_blob SET refcount = refcount - 1 WHERE hash = old.highlighted_blob_id;
+        DELETE FROM snippets_blob WHERE hash = old.highlighted_blob_id AND refcount = 0;
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS snippets_blob_ref_update AFTER UPDATE OF highlighted_blob_id
+    ON snippets_snippet WHEN old.highlighted_blob_id IS NOT new.highlighted_blob_id BEGIN
+        UPDATE snippets_blob SET refcount = refcount + 1 WHERE hash = new.highlighted_blob_id;
+        UPDATE snippets_blob SET refcount = refcount - 1 WHERE hash = old.highlighted_blob_id;
+        DELETE FROM snippets_blob WHERE hash = old.highlighted_blob_id AND refcount = 0;
+    END""",
+]
+DROP = [
+    "DROP TRIGGER IF EXISTS snippets_blob_ref_insert",
+    "DROP TRIGGER IF EXISTS snippets_blob_ref_delete",
+    "DROP TRIGGER IF EXISTS snippets_blob_ref_update",
+]
+
+
+def install(connection):
+    if connection.vendor == "sqlite":
+        with connection.cursor() as cursor:
+            for statement in SCHEMA:
+                cursor.execute(statement)
+
+
+def uninstall(connection):
+    if connection.vendor == "sqlite":
+        with connection.cursor() as cursor:
+            for statement in DROP:
+                cursor.execute(statement)
+
+
+def encode(text):
+    """
+    Return the (hash, data, compressed, size) a blob of `text` is stored as.
+    """
+    raw = text.encode("utf-8")
+    data, compressed = raw, False
+    threshold = get_setting("BLOB_COMPRESS_MIN_SIZE")
+    if threshold is not None and len(raw) >= threshold:
+        packed = zlib.compress(raw)
+        if len(packed) < len(raw):
+            data, compressed = packed, True
+    return hashlib.sha256(raw).hexdigest(), data, compressed, len(raw)
+
+
+def decode(data, compressed):
+    data = bytes(data)
+    return (zlib.decompress(data) if compressed else data).decode("utf-8")
+
+
+def recount(blob_model, snippet_model):
+    """
+    Recompute every blob's refcount from the snippets referencing it and
+    delete unreferenced blobs. Works with historical models so migrations
+    can use it. Returns the number of blobs deleted.
+    """
+    references = (
+        snippet_model._base_manager.filter(highlighted_blob=OuterRef("pk"))
+        .order_by()
+        .values("highlighted_blob")
+        .annotate(count=Count("pk"))
+        .values("count")
+    )
+    blob_model.objects.update(refcount=Coalesce(Subquery(references), 0))
+    deleted, _ = blob_model.objects.filter(refcount=0).delete()
+    return deleted
+
+
+def report(blob_model, snippet_model):
+    """
+    Return how much storage blobs take compared to a copy of the HTML per
+    snippet: a dict of row counts and byte totals.
+    """
+    blobs = blob_model.objects.aggregate(
+        blobs=Count("pk"),
+        # What a copy of the HTML in every referencing row would take.
+        logical_bytes=Coalesce(Sum(F("size") * F("refcount")), 0),
+        unique_bytes=Coalesce(Sum("size"), 0),
+        stored_bytes=Coalesce(Sum(Length("data")), 0),
+    )
+    blobs["snippets"] = snippet_model._base_manager.filter(highlighted_blob__isnull=False).count()
+    blobs["saved_bytes"] = blobs["logical_bytes"] - blobs["stored_bytes"]
+    return blobs
@@ -0,0 +1,74 @@
+"""
+The pygments languages and styles a snippet can use.
+
+Enumerating every lexer and style walks all pygments plugins, which is far
+too slow to do at import time in every process. The catalog is built on first
+use and cached for the life of the process. Running
+``python manage.py build_catalog`` precomputes it into `catalog_data.py` so
+that even the first use is only a module import.
+"""
+from functools import lru_cache
+
+import pygments
+
+try:
+    from . import catalog_data
+except ImportError:
+    catalog_data = None
+
+
+class ChoiceTable:
+    """
+    Sorted ``(value, label)`` choices plus lookup tables derived from them.
+    """
+
+    def __init__(self, choices):
+        self.choices = choices
+        self.labels = dict(choices)
+        self.values = frozenset(self.labels)
+        self.strings_to_values = {str(value): value for value in self.labels}
+
+    def __contains__(self, value):
+        return value in self.values
+
+    def __len__(self):
+        return len(self.choices)
+
+
+def _precomputed(name):
+    # A catalog generated for another pygments release may be stale.
+    if catalog_data is None or catalog_data.PYGMENTS_VERSION != pygments.__version__:
+        return None
+    return [tuple(choice) for choice in getattr(catalog_data, name)]
+
+
+def build_language_choices():
+    from pygments.lexers import get_all_lexers
+
+    return sorted(
+        (aliases[0], name) for name, aliases, *_ in get_all_lexers() if aliases
+    )
+
+
+def build_style_choices():
+    from pygments.styles import get_all_styles
+
+    return sorted((style, style) for style in get_all_styles())
+
+
+@lru_cache(maxsize=None)
+def languages():
+    return ChoiceTable(_precomputed("LANGUAGE_CHOICES") or build_language_choices())
+
+
+@lru_cache(maxsize=None)
+def styles():
+    return ChoiceTable(_precomputed("STYLE_CHOICES") or build_style_choices())
+
+
+def language_choices():
+    return languages().choices
+
+
+def style_choices():
+    return styles().choices
@@ -0,0 +1,99 @@
+"""
+Settings for the snippets app.
+
+All options live in a single ``SNIPPETS`` dictionary in the project settings,
+mirroring how REST framework reads ``REST_FRAMEWORK``. For example:
+
+    SNIPPETS = {
+        "HIGHLIGHT_CACHE_SIZE": 512,
+        "HIGHLIGHT_CACHE_ALIAS": "default",
+    }
+
+Values are read on every call so ``override_settings`` works in tests.
+"""
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+
+DEFAULTS = {
+    # Number of rendered highlight documents kept in the in-process LRU.
+    "HIGHLIGHT_CACHE_SIZE": 256,
+    # Optional Django cache alias used as a second, shared cache tier.
+    "HIGHLIGHT_CACHE_ALIAS": None,
+    "HIGHLIGHT_CACHE_TIMEOUT": 60 * 60 * 24,
+    # "sync" renders inside Snippet.save(); "async" commits the row as pending
+    # and renders on a worker once the transaction commits.
+    "HIGHLIGHT_MODE": "sync",
+    # Worker used in async mode: "thread", "process" or "local" (inline).
+    "HIGHLIGHT_EXECUTOR": "thread",
+    "HIGHLIGHT_WORKERS": 2,
+    # "fragment" stores only the highlighted body, "document" a full HTML
+    # document with the style sheet inlined.
+    "HIGHLIGHT_STORAGE": "fragment",
+    # Maximum number of snippet links embedded per user by UserSerializer,
+    # None for all of them. `snippets_url` links to the full, paginated list.
+    "USER_SNIPPET_LINKS_LIMIT": None,
+    # "buffered" queues audit log entries on commit and bulk inserts them
+    # when the request finishes, "sync" inserts each entry as it is recorded.
+    "AUDIT_SINK": "buffered",
+    "AUDIT_BUFFER_SIZE": 100,
+    # Seconds a queued audit log entry recorded outside a request may wait
+    # before it is written.
+    "AUDIT_FLUSH_INTERVAL": 1.0,
+    # Audit log entries older than this many days are moved to the archive
+    # by ``python manage.py archive_audit_log``.
+    "AUDIT_RETENTION_DAYS": 90,
+    # Directory of archived audit log segments, BASE_DIR/audit_archive if None.
+    "AUDIT_ARCHIVE_DIR": None,
+    # Maximum number of snippets per request to the bulk endpoint.
+    "BULK_MAX_ITEMS": 1000,
+    # Cache alias for the payloads of anonymous snippet reads, None to
+    # disable. See `snippets.response_cache`.
+    "RESPONSE_CACHE_ALIAS": None,
+    "RESPONSE_CACHE_TIMEOUT": 300,
+    # Successful token and Basic auth lookups are remembered per process for
+    # this many seconds by `snippets.authentication`; 0 disables caching.
+    "TOKEN_AUTH_CACHE_TTL": 60,
+    "TOKEN_AUTH_CACHE_SIZE": 1024,
+    "BASIC_AUTH_CACHE_TTL": 30,
+    "BASIC_AUTH_CACHE_SIZE": 256,
+    # Per-request timings in Server-Timing headers and at /metrics/, see
+    # `snippets.instrumentation`.
+    "INSTRUMENTATION": True,
+    # "fts5", "scan" or the dotted path of a search backend, see
+    # `snippets.search`. None picks "fts5" on SQLite and "scan" elsewhere.
+    "SEARCH_BACKEND": None,
+    # Highlighted HTML of at least this many bytes is zlib compressed in its
+    # blob, see `snippets.blobs`. None disables compression.
+    "BLOB_COMPRESS_MIN_SIZE": 1024,
+    # Snippets of at least this many lines keep lexer checkpoints so edits
+    # only re-highlight the lines around them, see `snippets.incremental`.
+    # None disables incremental rendering.
+    "INCREMENTAL_RENDER_MIN_LINES": 500,
+    # Admin changelists count at most this many rows and show an estimate
+    # past it, see `snippets.admin`. None always counts exactly.
+    "ADMIN_EXACT_COUNT_LIMIT": 10000,
+}
+
+_reset_callbacks = []
+
+
+def get_setting(name):
+    user_settings = getattr(settings, "SNIPPETS", None) or {}
+    return user_settings.get(name, DEFAULTS[name])
+
+
+def on_settings_changed(func):
+    """
+    Register `func` to be called whenever the ``SNIPPETS`` setting changes,
+    so module level singletons built from settings can be discarded.
+    """
+    _reset_callbacks.append(func)
+    return func
+
+
+@receiver(setting_changed)
+def _reload_settings(*, setting, **kwargs):
+    if setting == "SNIPPETS":
+        for callback in _reset_callbacks:
+            callback()
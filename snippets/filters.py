@@ -0,0 +1,81 @@
+from datetime import datetime, time
+
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from rest_framework.exceptions import ValidationError
+from rest_framework.filters import BaseFilterBackend
+
+from .softdelete import include_deactivated
+
+
+def parse_moment(value):
+    """
+    Parse an ISO date or datetime query parameter into an aware datetime,
+    or return None if it is neither.
+    """
+    try:
+        moment = parse_datetime(value)
+        if moment is None:
+            day = parse_date(value)
+            if day is None:
+                return None
+            moment = datetime.combine(day, time.min)
+    except ValueError:
+        return None
+    if timezone.is_naive(moment):
+        moment = timezone.make_aware(moment)
+    return moment
+
+
+class AuditLogFilter(BaseFilterBackend):
+    """
+    Filters the audit log on ``?user=<id>``, ``?model_name=``, ``?model_id=``,
+    ``?action=`` and a ``?since=`` (inclusive) / ``?until=`` (exclusive)
+    timestamp range. Every filter is served by one of the AuditLog indexes.
+    """
+    exact_params = ("model_name", "action")
+    id_params = {"user": "user_id", "model_id": "model_id"}
+    range_params = {"since": "timestamp__gte", "until": "timestamp__lt"}
+
+    def filter_queryset(self, request, queryset, view):
+        return queryset.filter(**self.get_lookups(request.query_params))
+
+    def get_lookups(self, params):
+        """
+        Return the queryset lookups for the query parameters `params`, or
+        raise ValidationError.
+        """
+        lookups = {}
+        errors = {}
+        for param in self.exact_params:
+            if param in params:
+                lookups[param] = params[param]
+        for param, field in self.id_params.items():
+            if param in params:
+                value = params[param]
+                if not value.isdigit():
+                    errors[param] = ["A valid integer is required."]
+                else:
+                    lookups[field] = int(value)
+        for param, lookup in self.range_params.items():
+            if param in params:
+                moment = parse_moment(params[param])
+                if moment is None:
+                    errors[param] = ["A valid ISO 8601 date or datetime is required."]
+                else:
+                    lookups[lookup] = moment
+        if errors:
+            raise ValidationError(errors)
+        return lookups
+
+
+class ActiveUserFilter(BaseFilterBackend):
+    """
+    Excludes deactivated users, unless staff ask for them with
+    ``?include_deactivated=1``.
+    """
+
+    def filter_queryset(self, request, queryset, view):
+        if include_deactivated(request.user, request.query_params):
+            return queryset
+        return queryset.filter(is_active=True)
@@ -0,0 +1,320 @@
+"""
+Rendering of snippets to highlighted HTML.
+
+Rendering is content addressed: the output only depends on the render inputs
+(code, language, style, linenos and title), so results are cached under a hash
+of those inputs. The first cache tier is a bounded in-process LRU, the second
+an optional Django cache backend shared between processes.
+
+By default only the highlighted body fragment is stored per snippet. The
+document around it is assembled when serving, linking to a per-style style
+sheet that is shared by all snippets instead of being copied into every row.
+"""
+import hashlib
+import threading
+from collections import OrderedDict
+from concurrent import futures
+from functools import lru_cache
+
+from django.core.cache import caches
+from django.db import transaction
+
+from .conf import get_setting, on_settings_changed
+from .instrumentation import timed
+
+CACHE_KEY_PREFIX = "snippets:highlight:"
+
+# How `Snippet.highlighted` is stored: a complete HTML document with the
+# style sheet inlined, or only the highlighted body.
+DOCUMENT = "document"
+FRAGMENT = "fragment"
+
+
+def render_key(code, language, style, linenos, title):
+    """
+    Return the content address of a render, a sha256 hex digest of its inputs.
+    """
+    digest = hashlib.sha256()
+    for value in (language, style, "1" if linenos else "0", title, code):
+        encoded = value.encode("utf-8")
+        # Length prefix every part so ("ab", "c") and ("a", "bc") differ.
+        digest.update(b"%d:" % len(encoded))
+        digest.update(encoded)
+    return digest.hexdigest()
+
+
+@lru_cache(maxsize=64)
+def get_formatter(style, linenos, title, full):
+    # Building an HtmlFormatter renders the whole style sheet, so reuse
+    # formatters between renders; they hold no per-render state.
+    from pygments.formatters.html import HtmlFormatter
+
+    options = {"title": title} if title else {}
+    return HtmlFormatter(
+        style=style, linenos="table" if linenos else False, full=full, **options
+    )
+
+
+def render(code, language, style, linenos, title, full=False):
+    """
+    Highlight `code` without consulting the cache. Returns the body fragment,
+    or with `full=True` a complete HTML document with the style sheet inlined.
+    """
+    # pygments is imported on first render to keep it out of process startup.
+    from pygments import highlight
+    from pygments.lexers import get_lexer_by_name
+
+    with timed("highlight"):
+        lexer = get_lexer_by_name(language)
+        # The title only appears in the document wrapper.
+        title = title if full else ""
+        return highlight(code, lexer, get_formatter(style, linenos, title, full))
+
+
+def storage_format():
+    return get_setting("HIGHLIGHT_STORAGE")
+
+
+def _embedded_header(style, title):
+    from pygments.formatters.html import DOC_HEADER
+
+    formatter = get_formatter(style, False, title, True)
+    return DOC_HEADER % dict(
+        title=formatter.title,
+        styledefs=formatter.get_style_defs("body"),
+        encoding=formatter.encoding,
+    )
+
+
+def wrap_document(fragment, style, title):
+    """
+    Turn a stored fragment back into the document `render(full=True)` returns.
+    """
+    from pygments.formatters.html import DOC_FOOTER
+
+    return _embedded_header(style, title) + fragment + DOC_FOOTER
+
+
+def unwrap_document(document, style, title):
+    """
+    Return the body fragment of a full document, or None if `document` was
+    not produced by the current pygments with this style and title.
+    """
+    from pygments.formatters.html import DOC_FOOTER
+
+    header = _embedded_header(style, title)
+    if document.startswith(header) and document.endswith(DOC_FOOTER):
+        return document[len(header):-len(DOC_FOOTER)]
+    return None
+
+
+def document_parts(title, css_url):
+    """
+    Return the (header, footer) that wrap a fragment into a document linking
+    to a shared style sheet rather than embedding it.
+    """
+    from pygments.formatters.html import DOC_FOOTER, DOC_HEADER_EXTERNALCSS
+
+    header = DOC_HEADER_EXTERNALCSS % dict(title=title, cssfile=css_url, encoding="utf-8")
+    return header, DOC_FOOTER
+
+
+@lru_cache(maxsize=None)
+def style_sheet(style):
+    """
+    Return the (css, etag) of the shared style sheet for `style`.
+    """
+    from pygments.formatters.html import CSSFILE_TEMPLATE
+
+    css = CSSFILE_TEMPLATE % {"styledefs": get_formatter(style, False, "", False).get_style_defs("body")}
+    return css, hashlib.sha256(css.encode("utf-8")).hexdigest()[:32]
+
+
+def compact_documents(model, batch_size=500, dry_run=False):
+    """
+    Rewrite rows of `model` that store full documents to store fragments.
+    Works with historical models so migrations can use it. Returns a
+    (rows, bytes_before, bytes_after) report.
+    """
+    rows = bytes_before = bytes_after = 0
+    # Before blob storage the HTML was a column of the snippets table.
+    inline = any(field.name == "highlighted" for field in model._meta.concrete_fields)
+    column = "highlighted" if inline else "highlighted_blob"
+    queryset = model._base_manager.filter(highlighted_format=DOCUMENT).order_by("pk")
+    if not inline:
+        queryset = queryset.select_related("highlighted_blob")
+    last_pk = 0
+    while True:
+        batch = list(
+            queryset.filter(pk__gt=last_pk).only(
+                "pk", "code", "language", "style", "linenos", "title", column
+            )[:batch_size]
+        )
+        if not batch:
+            break
+        last_pk = batch[-1].pk
+        for snippet in batch:
+            fragment = unwrap_document(snippet.highlighted, snippet.style, snippet.title)
+            if fragment is None:
+                # Rendered by another pygments release; render it again.
+                fragment = render(
+                    snippet.code, snippet.language, snippet.style, snippet.linenos, ""
+                )
+            bytes_before += len(snippet.highlighted.encode("utf-8"))
+            bytes_after += len(fragment.encode("utf-8"))
+            snippet.highlighted = fragment
+            snippet.highlighted_format = FRAGMENT
+        rows += len(batch)
+        if not dry_run:
+            with transaction.atomic():
+                if not inline:
+                    from .models import store_highlights
+
+                    store_highlights(batch)
+                model._base_manager.bulk_update(batch, [column, "highlighted_format"])
+    return rows, bytes_before, bytes_after
+
+
+class RenderCache:
+    """
+    A thread safe, bounded LRU of rendered HTML keyed on `render_key`, backed
+    by an optional Django cache alias.
+    """
+
+    def __init__(self, maxsize, alias=None, timeout=None):
+        self.maxsize = maxsize
+        self.alias = alias
+        self.timeout = timeout
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return value
+        if self.alias is not None:
+            value = caches[self.alias].get(CACHE_KEY_PREFIX + key)
+            if value is not None:
+                self._store_local(key, value)
+                self.hits += 1
+                return value
+        self.misses += 1
+        return None
+
+    def set(self, key, value):
+        self._store_local(key, value)
+        if self.alias is not None:
+            caches[self.alias].set(CACHE_KEY_PREFIX + key, value, self.timeout)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.misses = 0
+
+    def _store_local(self, key, value):
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def __len__(self):
+        return len(self._entries)
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_render_cache():
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = RenderCache(
+                    maxsize=get_setting("HIGHLIGHT_CACHE_SIZE"),
+                    alias=get_setting("HIGHLIGHT_CACHE_ALIAS"),
+                    timeout=get_setting("HIGHLIGHT_CACHE_TIMEOUT"),
+                )
+    return _cache
+
+
+@on_settings_changed
+def _reset_render_cache():
+    global _cache
+    _cache = None
+
+
+def is_async():
+    return get_setting("HIGHLIGHT_MODE") == "async"
+
+
+def cache_key(key, full):
+    return f"{key}:{DOCUMENT if full else FRAGMENT}"
+
+
+def render_cached(key, code, language, style, linenos, title, full=False):
+    """
+    Return the HTML for `key`, rendering and caching it on a miss.
+    """
+    cache = get_render_cache()
+    html = cache.get(cache_key(key, full))
+    if html is None:
+        html = render(code, language, style, linenos, title, full)
+        cache.set(cache_key(key, full), html)
+    return html
+
+
+class LocalExecutor(futures.Executor):
+    """
+    Runs submitted work immediately in the calling thread. Used in tests and
+    wherever a worker pool is not wanted.
+    """
+
+    inline = True
+
+    def submit(self, fn, /, *args, **kwargs):
+        future = futures.Future()
+        try:
+            future.set_result(fn(*args, **kwargs))
+        except Exception as exc:
+            future.set_exception(exc)
+        return future
+
+
+_executor = None
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        with _cache_lock:
+            if _executor is None:
+                kind = get_setting("HIGHLIGHT_EXECUTOR")
+                workers = get_setting("HIGHLIGHT_WORKERS")
+                if kind == "thread":
+                    _executor = futures.ThreadPoolExecutor(
+                        max_workers=workers, thread_name_prefix="highlight"
+                    )
+                elif kind == "process":
+                    _executor = futures.ProcessPoolExecutor(max_workers=workers)
+                elif kind == "local":
+                    _executor = LocalExecutor()
+                else:
+                    raise ValueError(f"Unknown HIGHLIGHT_EXECUTOR {kind!r}")
+    return _executor
+
+
+@on_settings_changed
+def _reset_executor():
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False)
+    _executor = None
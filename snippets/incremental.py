@@ -0,0 +1,504 @@
+"""
+Incremental re-rendering of large snippets.
+
+Pygments' RegexLexer is a loop over (position, state stack): resuming it at
+a line start with the stack it had there produces exactly the tokens a full
+run would. A full render of a large snippet records these checkpoints, and
+HtmlFormatter turns each line of tokens into one line of HTML on its own, so
+after an edit only the lines from the last checkpoint before the change are
+lexed again, until a line start where the stack matches the old checkpoint
+for that line. From there the old HTML lines are reused as they are.
+
+That holds as long as no rule matched before the edit read the edited text.
+Rules look at most `MARGIN` lines past their match, with two exceptions
+handled here: a construct spanning lines through lexer states (a triple
+quoted string, say) is re-lexed from the line it opened on, by resuming only
+from line starts in the root state, and a rule that scanned ahead for the
+end of an unterminated comment or string (see `_scan_prefix`) pins every
+later edit to re-lex from the line it was tried on. So does one that matched
+such a construct up to an end chosen by a backreference, like a heredoc's,
+as a later line may hold an end it tried first.
+
+Checkpoints are stored as a dict of ``states``, run-length encoded as a list
+of ``[first_line, lines, stack]`` runs of consecutive line starts sharing a
+stack, and ``scans``, the lines unterminated scans were tried from. Line
+starts inside a token (a multi-line string, say) have no state.
+
+Whether a lexer's rules keep to these limits cannot be told from its
+patterns alone (reStructuredText's directives, say, read indented bodies
+over any number of lines with no literal prefix), so only the lexers of
+`LEXERS`, checked against full renders by the tests, and renders without
+line numbers take the incremental path; everything else is rendered in
+full.
+"""
+import re
+from collections import namedtuple
+from functools import lru_cache
+
+from .conf import get_setting
+from .highlight import get_formatter, render as render_full
+from .instrumentation import timed
+
+# The inputs and output of the render an edit starts from.
+Previous = namedtuple("Previous", "code language style linenos title full html checkpoints")
+
+# Lines of context re-lexed on either side of an edit, in case a rule looks
+# behind or ahead of the text it matches.
+MARGIN = 1
+
+ROOT = ("root",)
+
+# Lexers whose incremental renders are checked to match full renders, by
+# class name. Their subclasses add rules of their own and are not included.
+LEXERS = frozenset({
+    "BashLexer",
+    "CssLexer",
+    "DiffLexer",
+    "GoLexer",
+    "JavascriptLexer",
+    "PythonLexer",
+    "RustLexer",
+    "SqlLexer",
+})
+
+
+def get_lexer(language):
+    from pygments.lexers import get_lexer_by_name
+
+    return get_lexer_by_name(language)
+
+
+def supports(lexer, linenos):
+    from pygments.lexer import RegexLexer
+
+    return (
+        not linenos
+        and type(lexer).__name__ in LEXERS
+        and isinstance(lexer, RegexLexer)
+        and type(lexer).get_tokens_unprocessed is RegexLexer.get_tokens_unprocessed
+        and not lexer.filters
+    )
+
+
+def is_large(code):
+    threshold = get_setting("INCREMENTAL_RENDER_MIN_LINES")
+    return threshold is not None and code.count("\n") + 1 >= threshold
+
+
+@lru_cache(maxsize=64)
+def _frame(style, linenos, title, full):
+    # The formatter's output around the lines of code, found by formatting
+    # a single marker line.
+    from pygments.token import Text
+
+    marker = "\x00\n"
+    head, _, tail = _format(get_formatter(style, linenos, title, full), [(Text, marker)]).partition(marker)
+    return head, tail
+
+
+def _format(formatter, tokens):
+    from io import StringIO
+
+    out = StringIO()
+    formatter.format(tokens, out)
+    return out.getvalue()
+
+
+@lru_cache(maxsize=64)
+def _line_formatter(style):
+    from pygments.formatters.html import HtmlFormatter
+
+    return HtmlFormatter(style=style, nowrap=True)
+
+
+@lru_cache(maxsize=None)
+def _rules(lexer_class):
+    # The lexer's token definitions with the scan prefix of every rule and
+    # whether its matches also pin later edits.
+    tokens = {}
+    for state, rules in lexer_class._tokens.items():
+        tokens[state] = []
+        for rule in rules:
+            prefix = _scan_prefix(rule[0].__self__)
+            pins = prefix is not None and _has_backreference(rule[0].__self__)
+            tokens[state].append((*rule, prefix, pins))
+    return tokens
+
+
+def _scan_prefix(pattern):
+    """
+    Return the literal texts every match of `pattern` starts with one of if
+    it can match across any number of lines, like a block comment, and None
+    otherwise.
+
+    When such a rule fails after its prefix matched, the comment or string
+    it started is unterminated and the rule may have read to the end of the
+    text looking for its end, so its outcome depends on every later line.
+    """
+    try:
+        from re import _constants as sre, _parser
+    except ImportError:  # Python < 3.11
+        import sre_constants as sre
+        import sre_parse as _parser
+
+    tree = _parser.parse(pattern.pattern, pattern.flags)
+    if not _scans_lines(sre, tree, pattern.flags):
+        return None
+    prefixes = _literal_prefixes(sre, tree, pattern.flags)[0]
+    if not all(prefixes):
+        return None
+    return tuple(sorted(set(prefixes)))
+
+
+def _has_backreference(pattern):
+    try:
+        from re import _constants as sre, _parser
+    except ImportError:  # Python < 3.11
+        import sre_constants as sre
+        import sre_parse as _parser
+
+    def walk(items):
+        for op, av in items:
+            if op in (sre.GROUPREF, sre.GROUPREF_EXISTS):
+                return True
+            if op in (sre.MAX_REPEAT, sre.MIN_REPEAT, getattr(sre, "POSSESSIVE_REPEAT", None)):
+                found = walk(av[2])
+            elif op is sre.SUBPATTERN:
+                found = walk(av[3])
+            elif op is sre.BRANCH:
+                found = any(walk(branch) for branch in av[1])
+            elif op is sre.ASSERT or op is sre.ASSERT_NOT:
+                found = walk(av[1])
+            elif op is getattr(sre, "ATOMIC_GROUP", None):
+                found = walk(av)
+            else:
+                found = False
+            if found:
+                return True
+        return False
+
+    return walk(_parser.parse(pattern.pattern, pattern.flags))
+
+
+def _scans_lines(sre, items, flags):
+    # Whether `items` repeat without bound something that runs over lines,
+    # see `_runs_over_lines`.
+    for op, av in items:
+        if op in (sre.MAX_REPEAT, sre.MIN_REPEAT, getattr(sre, "POSSESSIVE_REPEAT", None)):
+            if av[1] == sre.MAXREPEAT and _runs_over_lines(sre, av[2], flags):
+                return True
+            found = _scans_lines(sre, av[2], flags)
+        elif op is sre.SUBPATTERN:
+            found = _scans_lines(sre, av[3], (flags | av[1]) & ~av[2])
+        elif op is sre.BRANCH:
+            found = any(_scans_lines(sre, branch, flags) for branch in av[1])
+        elif op is sre.ASSERT or op is sre.ASSERT_NOT:
+            found = _scans_lines(sre, av[1], flags)
+        elif op is getattr(sre, "ATOMIC_GROUP", None):
+            found = _scans_lines(sre, av, flags)
+        else:
+            found = False
+        if found:
+            return True
+    return False
+
+
+def _runs_over_lines(sre, body, flags):
+    # Whether a repeated `body` can go on over newlines and any one
+    # character of text other than whitespace, like ``[^"]`` or ``(.|\\n)``.
+    # Runs of whitespace end on the next line with any text in it, so they
+    # are not counted.
+    while len(body) == 1 and body[0][0] is sre.SUBPATTERN:
+        flags = (flags | body[0][1][1]) & ~body[0][1][2]
+        body = body[0][1][3]
+    if len(body) == 1 and body[0][0] is sre.BRANCH:
+        branches = body[0][1][1]
+    else:
+        branches = [body]
+    return any(_chars(sre, branch, flags)[0] for branch in branches) and any(
+        _chars(sre, branch, flags)[1] for branch in branches if branch.getwidth() == (1, 1)
+    )
+
+
+def _chars(sre, items, flags):
+    # Returns whether `items` can match (a newline, text other than whitespace).
+    newline = text = False
+    for op, av in items:
+        if op is sre.LITERAL:
+            item = av == ord("\n"), not chr(av).isspace()
+        elif op is sre.NOT_LITERAL:
+            item = av != ord("\n"), True
+        elif op is sre.ANY:
+            item = bool(flags & re.DOTALL), True
+        elif op is sre.IN:
+            item = _set_chars(sre, av)
+        elif op in (sre.MAX_REPEAT, sre.MIN_REPEAT, getattr(sre, "POSSESSIVE_REPEAT", None)):
+            item = _chars(sre, av[2], flags)
+        elif op is sre.SUBPATTERN:
+            item = _chars(sre, av[3], (flags | av[1]) & ~av[2])
+        elif op is sre.BRANCH:
+            branches = [_chars(sre, branch, flags) for branch in av[1]]
+            item = any(b[0] for b in branches), any(b[1] for b in branches)
+        elif op is getattr(sre, "ATOMIC_GROUP", None):
+            item = _chars(sre, av, flags)
+        elif op in (sre.AT, sre.ASSERT, sre.ASSERT_NOT):
+            item = False, False
+        else:
+            # Backreferences and conditionals.
+            item = True, True
+        newline, text = newline or item[0], text or item[1]
+    return newline, text
+
+
+def _set_chars(sre, items):
+    newline = text = False
+    for kind, value in items:
+        if kind is sre.LITERAL:
+            newline = newline or value == ord("\n")
+            text = text or not chr(value).isspace()
+        elif kind is sre.RANGE:
+            newline = newline or value[0] <= ord("\n") <= value[1]
+            text = True
+        elif kind is sre.CATEGORY:
+            newline = newline or value in (
+                sre.CATEGORY_SPACE, sre.CATEGORY_NOT_DIGIT, sre.CATEGORY_NOT_WORD
+            )
+            text = text or value is not sre.CATEGORY_SPACE
+    if items and items[0][0] is sre.NEGATE:
+        # Anything but the set matches text unless the set holds all of it.
+        return not newline, not any(
+            kind is sre.CATEGORY and value is sre.CATEGORY_NOT_SPACE for kind, value in items
+        )
+    return newline, text
+
+
+def _literal_prefixes(sre, items, flags):
+    # Returns (the literal texts every match starts with one of, whether
+    # `items` is nothing but those texts).
+    prefixes = [""]
+    for op, av in items:
+        if op is sre.LITERAL:
+            char = chr(av)
+            if flags & re.IGNORECASE and char.lower() != char.upper():
+                return prefixes, False
+            prefixes = [prefix + char for prefix in prefixes]
+        elif op is sre.SUBPATTERN and not av[1] and not av[2]:
+            inner, complete = _literal_prefixes(sre, av[3], flags)
+            prefixes = [prefix + text for prefix in prefixes for text in inner]
+            if not complete:
+                return prefixes, False
+        elif op in (sre.MAX_REPEAT, sre.MIN_REPEAT) and av[:2] == (0, 1):
+            # An optional literal, like the $ of $"...".
+            inner, complete = _literal_prefixes(sre, av[2], flags)
+            if not complete:
+                return prefixes, False
+            prefixes = [prefix + text for prefix in prefixes for text in ("", *inner)]
+        else:
+            return prefixes, False
+    return prefixes, True
+
+
+def lex(lexer, text, pos, stack, line):
+    """
+    Run `lexer`'s RegexLexer loop over `text` from `pos`, which is the start
+    of line `line`, with state `stack`. Yields (tokens, line, stack, scan)
+    after every step: `line` is the line the step ended on, `stack` a tuple
+    if it ended on a line start and None otherwise, and `scan` the line the
+    step started on if it tried an unterminated scan, otherwise None.
+    """
+    from pygments.token import Error, Whitespace, _TokenType
+
+    tokendefs = _rules(type(lexer))
+    statestack = list(stack)
+    statetokens = tokendefs[statestack[-1]]
+    end = len(text)
+    while pos < end:
+        start = pos
+        scan = None
+        for rexmatch, action, new_state, prefix, pins in statetokens:
+            m = rexmatch(text, pos)
+            if m:
+                if pins:
+                    scan = line
+                if action is None:
+                    tokens = ()
+                elif type(action) is _TokenType:
+                    tokens = ((action, m.group()),)
+                else:
+                    tokens = [(ttype, value) for _, ttype, value in action(lexer, m)]
+                pos = m.end()
+                if new_state is not None:
+                    if isinstance(new_state, tuple):
+                        for state in new_state:
+                            if state == "#pop":
+                                if len(statestack) > 1:
+                                    statestack.pop()
+                            elif state == "#push":
+                                statestack.append(statestack[-1])
+                            else:
+                                statestack.append(state)
+                    elif isinstance(new_state, int):
+                        if abs(new_state) >= len(statestack):
+                            del statestack[1:]
+                        else:
+                            del statestack[new_state:]
+                    elif new_state == "#push":
+                        statestack.append(statestack[-1])
+                    else:
+                        raise ValueError(f"wrong state def: {new_state!r}")
+                    statetokens = tokendefs[statestack[-1]]
+                break
+            if prefix is not None and text.startswith(prefix, pos):
+                scan = line
+        else:
+            if text[pos] == "\n":
+                statestack = ["root"]
+                statetokens = tokendefs["root"]
+                tokens = ((Whitespace, "\n"),)
+            else:
+                tokens = ((Error, text[pos]),)
+            pos += 1
+        line += text.count("\n", start, pos)
+        at_line_start = pos > start and text[pos - 1] == "\n"
+        yield tokens, line, tuple(statestack) if at_line_start else None, scan
+
+
+def encode_checkpoints(states, scans):
+    """
+    Return the checkpoints of a render given the stack at each line start,
+    None where a line starts inside a token, and the lines unterminated
+    scans were tried from.
+    """
+    runs = []
+    for line, stack in enumerate(states):
+        if stack is None:
+            continue
+        if runs and runs[-1][2] == stack and runs[-1][0] + runs[-1][1] == line:
+            runs[-1][1] += 1
+        else:
+            runs.append([line, 1, stack])
+    return {
+        "states": [[first, count, list(stack)] for first, count, stack in runs],
+        "scans": sorted(set(scans)),
+    }
+
+
+def decode_checkpoints(checkpoints, lines):
+    """
+    Return the (states, scans) of `checkpoints` for a text of `lines` lines.
+    """
+    states = [None] * (lines + 1)
+    for first, count, stack in checkpoints["states"]:
+        states[first:first + count] = [tuple(stack)] * count
+    return states[:lines + 1], checkpoints["scans"]
+
+
+def _tokens_and_states(lexer, text, pos, line, states, scans, stop=None):
+    """
+    Lex from the start of line `line` in the root state, filling `states`
+    with the stacks at the line starts reached and adding the lines of
+    unterminated scans to `scans`. Stops after the line start for which
+    `stop(line, stack)` is true. Returns (tokens, last line reached).
+    """
+    tokens = []
+    states[line] = ROOT
+    for step, line, stack, scan in lex(lexer, text, pos, ROOT, line):
+        tokens.extend(step)
+        if scan is not None:
+            scans.append(scan)
+        if stack is not None:
+            states[line] = stack
+            if stop is not None and stop(line, stack):
+                break
+    return tokens, line
+
+
+def render(code, language, style, linenos, title, full=False):
+    """
+    Render like `snippets.highlight.render`, also returning the checkpoints
+    to re-render edits of the result from, or None if it does not support
+    that.
+    """
+    lexer = get_lexer(language)
+    if not supports(lexer, linenos):
+        return render_full(code, language, style, linenos, title, full), None
+
+    with timed("highlight"):
+        text = lexer._preprocess_lexer_input(code)
+        states = [None] * (text.count("\n") + 1)
+        scans = []
+        tokens, _ = _tokens_and_states(lexer, text, 0, 0, states, scans)
+        head, tail = _frame(style, linenos, title if full else "", full)
+        html = head + _format(_line_formatter(style), tokens) + tail
+    return html, encode_checkpoints(states, scans)
+
+
+def rerender(previous, code, language, style, linenos, title, full=False):
+    """
+    Render `code` by re-lexing only what changed since the `previous`
+    render. Returns (html, checkpoints), or None if the previous render
+    cannot be reused.
+    """
+    lexer = get_lexer(language)
+    if (
+        not supports(lexer, linenos)
+        or previous.language != language
+        or previous.linenos
+        or not previous.checkpoints
+    ):
+        return None
+    old_head, old_tail = _frame(
+        previous.style, previous.linenos, previous.title if previous.full else "", previous.full
+    )
+    if not (previous.html.startswith(old_head) and previous.html.endswith(old_tail)):
+        return None
+    old_html = previous.html[len(old_head):len(previous.html) - len(old_tail)].split("\n")[:-1]
+    old_text = lexer._preprocess_lexer_input(previous.code)
+    old_lines = old_text.split("\n")[:-1]
+    if len(old_html) != len(old_lines):
+        return None
+
+    with timed("highlight"):
+        text = lexer._preprocess_lexer_input(code)
+        lines = text.split("\n")[:-1]
+        old_states, old_scans = decode_checkpoints(previous.checkpoints, len(old_lines))
+
+        # The unchanged lines at the start and at the end.
+        prefix = 0
+        limit = min(len(lines), len(old_lines))
+        while prefix < limit and lines[prefix] == old_lines[prefix]:
+            prefix += 1
+        suffix = 0
+        while suffix < limit - prefix and lines[-1 - suffix] == old_lines[-1 - suffix]:
+            suffix += 1
+
+        # Resume from the last line start in the root state before both the
+        # edit and any unterminated scan the edit might end.
+        first = max(prefix - MARGIN, 0)
+        if old_scans and old_scans[0] < first:
+            first = old_scans[0]
+        while old_states[first] != ROOT:
+            first -= 1
+        pos = sum(len(line) + 1 for line in lines[:first])
+
+        # Stop at a line start past the edit where the stack is the same as
+        # it was at that line before.
+        shift = len(old_lines) - len(lines)
+        resume = len(lines) - suffix + MARGIN
+
+        def converged(line, stack):
+            return resume <= line < len(lines) and old_states[line + shift] == stack
+
+        states = [None] * (len(lines) + 1)
+        scans = [scan for scan in old_scans if scan < first]
+        tokens, last = _tokens_and_states(lexer, text, pos, first, states, scans, converged)
+        html_lines = old_html[:first] + _format(_line_formatter(style), tokens).split("\n")[:-1]
+        states[:first] = old_states[:first]
+        if last < len(lines):
+            html_lines += old_html[last + shift:]
+            states[last:] = old_states[last + shift:]
+            scans += [scan - shift for scan in old_scans if scan >= last + shift]
+
+        head, tail = _frame(style, linenos, title if full else "", full)
+        html = head + "".join(line + "\n" for line in html_lines) + tail
+    return html, encode_checkpoints(states, scans)
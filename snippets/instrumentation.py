@@ -0,0 +1,217 @@
+"""
+Per-request timings, reported in a ``Server-Timing`` header and aggregated
+into per-view histograms served at ``/metrics/``.
+
+`InstrumentationMiddleware` starts a `RequestTimings` for every request and
+counts the time and number of database queries, on whichever thread runs
+them: async views run theirs in `sync_to_async` threads, which the
+request's timings follow through the context. Code on the request path
+adds phases with ``with timed("phase"):``; `InstrumentedViewMixin` times
+authentication and permission checks and `InstrumentedSerializerMixin`
+serialization. Phases overlap: database time is also part of the phase that
+ran the query. Everything is a no-op outside an instrumented request, and
+setting SNIPPETS["INSTRUMENTATION"] to False turns it off.
+"""
+import bisect
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+from .conf import get_setting
+
+# Upper bounds, in milliseconds, of the histogram buckets.
+BUCKETS_MS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, float("inf"))
+
+_current = ContextVar("snippets_request_timings", default=None)
+
+
+class RequestTimings:
+    def __init__(self):
+        self.durations = defaultdict(float)
+        self.queries = 0
+        self._active = set()
+
+    def server_timing(self):
+        entries = []
+        for phase, seconds in self.durations.items():
+            entry = f"{phase};dur={seconds * 1000:.3f}"
+            if phase == "db":
+                entry += f';desc="{self.queries} queries"'
+            entries.append(entry)
+        return ", ".join(entries)
+
+
+def current_timings():
+    return _current.get()
+
+
+@contextmanager
+def timed(phase):
+    """
+    Add the time spent in the block to `phase` of the current request.
+    Nested blocks for the same phase are only counted once.
+    """
+    timings = _current.get()
+    if timings is None or phase in timings._active:
+        yield
+        return
+    timings._active.add(phase)
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings.durations[phase] += time.perf_counter() - start
+        timings._active.discard(phase)
+
+
+def _time_query(execute, sql, params, many, context):
+    timings = _current.get()
+    if timings is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        timings.durations["db"] += time.perf_counter() - start
+        timings.queries += 1
+
+
+@receiver(connection_created)
+def install_query_timer(sender, connection, **kwargs):
+    """
+    Time the queries of every connection, as it is opened, against the
+    timings of the current request.
+    """
+    if _time_query not in connection.execute_wrappers:
+        # First, so `execute_wrapper` blocks that are open pop their own.
+        connection.execute_wrappers.insert(0, _time_query)
+
+
+class Histogram:
+    def __init__(self):
+        self.counts = [0] * len(BUCKETS_MS)
+        self.count = 0
+        self.sum_ms = 0.0
+
+    def observe(self, ms):
+        self.counts[bisect.bisect_left(BUCKETS_MS, ms)] += 1
+        self.count += 1
+        self.sum_ms += ms
+
+    def as_dict(self):
+        return {
+            "count": self.count,
+            "sum_ms": self.sum_ms,
+            "buckets": {
+                str(bound): count for bound, count in zip(BUCKETS_MS, self.counts)
+            },
+        }
+
+
+class Metrics:
+    """
+    Histograms of the phase timings of this process, per view.
+    """
+
+    def __init__(self):
+        self._histograms = defaultdict(lambda: defaultdict(Histogram))
+        self._queries = defaultdict(Histogram)
+        self._lock = threading.Lock()
+
+    def record(self, view, timings):
+        with self._lock:
+            for phase, seconds in timings.durations.items():
+                self._histograms[view][phase].observe(seconds * 1000)
+            # Query counts share the bucket bounds of the timings.
+            self._queries[view].observe(timings.queries)
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                view: {
+                    "phases": {phase: h.as_dict() for phase, h in phases.items()},
+                    "queries": self._queries[view].as_dict(),
+                }
+                for view, phases in self._histograms.items()
+            }
+
+    def clear(self):
+        with self._lock:
+            self._histograms.clear()
+            self._queries.clear()
+
+
+metrics = Metrics()
+
+
+class InstrumentationMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not get_setting("INSTRUMENTATION"):
+            return self.get_response(request)
+        timings, token, start = self.start()
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.finish(request, response, timings, start)
+
+    async def __acall__(self, request):
+        if not get_setting("INSTRUMENTATION"):
+            return await self.get_response(request)
+        timings, token, start = self.start()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.finish(request, response, timings, start)
+
+    def start(self):
+        timings = RequestTimings()
+        return timings, _current.set(timings), time.perf_counter()
+
+    def finish(self, request, response, timings, start):
+        timings.durations["total"] = time.perf_counter() - start
+        match = request.resolver_match
+        metrics.record(match.view_name if match else "unresolved", timings)
+        response["Server-Timing"] = timings.server_timing()
+        return response
+
+
+class InstrumentedViewMixin:
+    """
+    Times authentication and permission checks of a REST framework view.
+    """
+
+    def perform_authentication(self, request):
+        with timed("auth"):
+            super().perform_authentication(request)
+
+    def check_permissions(self, request):
+        with timed("permissions"):
+            super().check_permissions(request)
+
+    def check_object_permissions(self, request, obj):
+        with timed("permissions"):
+            super().check_object_permissions(request, obj)
+
+
+class InstrumentedSerializerMixin:
+    def to_representation(self, instance):
+        with timed("serialize"):
+            return super().to_representation(instance)
@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand
+
+from snippets.archive import archive_audit_log, archive_dir, retention_cutoff
+from snippets.models import AuditLog
+
+
+class Command(BaseCommand):
+    help = (
+        "Move audit log entries older than the retention window into gzipped "
+        "JSON lines segments and delete them from the database."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--days", type=int, help="Retention window, AUDIT_RETENTION_DAYS by default."
+        )
+        parser.add_argument("--directory", help="Segment directory, AUDIT_ARCHIVE_DIR by default.")
+        parser.add_argument("--batch-size", type=int, default=1000)
+        parser.add_argument(
+            "--dry-run", action="store_true", help="Count the entries without archiving them."
+        )
+
+    def handle(self, *args, **options):
+        cutoff = retention_cutoff(options["days"])
+        if options["dry_run"]:
+            count = AuditLog.objects.filter(timestamp__lt=cutoff).count()
+            self.stdout.write(f"Would archive {count} entries older than {cutoff:%Y-%m-%d %H:%M:%S}.")
+            return
+        directory = options["directory"] or archive_dir()
+        archived, segments = archive_audit_log(
+            cutoff, directory, batch_size=options["batch_size"]
+        )
+        if options["verbosity"] > 1:
+            for path in sorted(segments):
+                self.stdout.write(f"Wrote {path}")
+        self.stdout.write(
+            self.style.SUCCESS(f"Archived {archived} entries to {len(segments)} segments in {directory}.")
+        )
@@ -0,0 +1,25 @@
+import json
+
+from django.core.management.base import BaseCommand
+
+from snippets.benchmarks import discover
+
+
+class Command(BaseCommand):
+    help = "Run one of the snippets performance benchmarks and print JSON results."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--output", help="Also write the results to this file.")
+        subparsers = parser.add_subparsers(dest="benchmark", required=True)
+        for name, module in sorted(discover().items()):
+            subparser = subparsers.add_parser(name, help=module.__doc__.strip().splitlines()[0])
+            module.add_arguments(subparser)
+
+    def handle(self, *args, **options):
+        module = discover()[options["benchmark"]]
+        results = {"benchmark": options["benchmark"], **module.run(options)}
+        output = json.dumps(results, indent=2, default=str)
+        self.stdout.write(output)
+        if options["output"]:
+            with open(options["output"], "w") as f:
+                f.write(output + "\n")
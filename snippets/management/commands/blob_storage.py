@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from snippets import blobs
+from snippets.models import Blob, Snippet
+
+
+class Command(BaseCommand):
+    help = (
+        "Report the storage the highlighted HTML blobs take and how much "
+        "sharing and compressing them saves."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--repair",
+            action="store_true",
+            help="Reinstall the refcount triggers, recount references and "
+            "delete unreferenced blobs first.",
+        )
+
+    def handle(self, *args, **options):
+        if options["repair"]:
+            with transaction.atomic():
+                blobs.install(connection)
+                deleted = blobs.recount(Blob, Snippet)
+            self.stdout.write(f"Recounted references, deleted {deleted} unreferenced blobs.")
+        report = blobs.report(Blob, Snippet)
+        logical = report["logical_bytes"]
+        ratio = report["saved_bytes"] / logical if logical else 0
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"{report['snippets']} snippets share {report['blobs']} blobs. "
+                f"Their HTML takes {logical} bytes, {report['unique_bytes']} bytes "
+                f"once deduplicated and {report['stored_bytes']} bytes stored, "
+                f"saving {report['saved_bytes']} bytes ({ratio:.0%})."
+            )
+        )
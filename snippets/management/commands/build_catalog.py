@@ -0,0 +1,46 @@
+from pathlib import Path
+from pprint import pformat
+
+import pygments
+from django.core.management.base import BaseCommand
+
+from snippets import catalog
+
+TEMPLATE = '''\
+# Generated by "manage.py build_catalog". Do not edit; rerun the command after
+# upgrading pygments or installing pygments plugins.
+
+PYGMENTS_VERSION = {version!r}
+
+LANGUAGE_CHOICES = {languages}
+
+STYLE_CHOICES = {styles}
+'''
+
+
+class Command(BaseCommand):
+    help = "Precompute the pygments language and style catalog into a module."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--output",
+            default=str(Path(catalog.__file__).with_name("catalog_data.py")),
+            help="Path of the generated module.",
+        )
+
+    def handle(self, *args, **options):
+        languages = catalog.build_language_choices()
+        styles = catalog.build_style_choices()
+        Path(options["output"]).write_text(
+            TEMPLATE.format(
+                version=pygments.__version__,
+                languages=pformat(languages),
+                styles=pformat(styles),
+            )
+        )
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Wrote {len(languages)} languages and {len(styles)} styles "
+                f"to {options['output']}."
+            )
+        )
@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+
+from snippets.highlight import compact_documents
+from snippets.models import Snippet
+
+
+class Command(BaseCommand):
+    help = (
+        "Rewrite snippets that store full highlighted documents to store only "
+        "the highlighted fragment, and report the bytes saved."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=500)
+        parser.add_argument(
+            "--dry-run", action="store_true", help="Report the savings without writing."
+        )
+
+    def handle(self, *args, **options):
+        rows, before, after = compact_documents(
+            Snippet, batch_size=options["batch_size"], dry_run=options["dry_run"]
+        )
+        verb = "Would compact" if options["dry_run"] else "Compacted"
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"{verb} {rows} snippets from {before} to {after} bytes, "
+                f"saving {before - after} bytes."
+            )
+        )
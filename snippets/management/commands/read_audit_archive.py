@@ -0,0 +1,28 @@
+import argparse
+import json
+
+from django.core.management.base import BaseCommand
+from django.core.serializers.json import DjangoJSONEncoder
+
+from snippets.archive import read_archive
+from snippets.filters import parse_moment
+
+
+def parse_bound(value):
+    moment = parse_moment(value)
+    if moment is None:
+        raise argparse.ArgumentTypeError(f"Expected a date or datetime, got {value!r}.")
+    return moment
+
+
+class Command(BaseCommand):
+    help = "Print archived audit log entries in a time range as JSON lines."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--since", type=parse_bound, help="Inclusive start date or datetime.")
+        parser.add_argument("--until", type=parse_bound, help="Exclusive end date or datetime.")
+        parser.add_argument("--directory", help="Segment directory, AUDIT_ARCHIVE_DIR by default.")
+
+    def handle(self, *args, **options):
+        for record in read_archive(options["directory"], options["since"], options["until"]):
+            self.stdout.write(json.dumps(record, cls=DjangoJSONEncoder))
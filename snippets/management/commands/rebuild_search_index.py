@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from snippets.search import get_search_backend
+
+
+class Command(BaseCommand):
+    help = (
+        "Rebuild the snippet search index from the snippets table, and "
+        "reinstall the triggers that keep it in sync."
+    )
+
+    def handle(self, *args, **options):
+        backend = get_search_backend()
+        backend.rebuild()
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt the {type(backend).__name__} search index."))
@@ -0,0 +1,53 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from snippets.models import RENDER_FAILED, RENDER_PENDING, Snippet, store_highlights
+
+
+class Command(BaseCommand):
+    help = "Render snippets whose highlighting is pending or failed."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--all",
+            action="store_true",
+            help="Re-render every snippet, not only the pending and failed ones.",
+        )
+        parser.add_argument("--batch-size", type=int, default=200)
+
+    def handle(self, *args, **options):
+        queryset = Snippet.all_objects.order_by("pk")
+        if not options["all"]:
+            queryset = queryset.filter(render_state__in=(RENDER_PENDING, RENDER_FAILED))
+
+        rendered = 0
+        last_pk = 0
+        while True:
+            batch = list(queryset.filter(pk__gt=last_pk)[: options["batch_size"]])
+            if not batch:
+                break
+            keys = {snippet.pk: snippet.render_key for snippet in batch}
+            for snippet in batch:
+                snippet.refresh_highlight(force=True, sync=True)
+            with transaction.atomic():
+                # Like _store_render, drop the renders of snippets edited
+                # since they were read: their saves replaced render_key.
+                current = dict(
+                    Snippet.all_objects.select_for_update()
+                    .filter(pk__in=keys)
+                    .values_list("pk", "render_key")
+                )
+                unchanged = [s for s in batch if s.pk in current and current[s.pk] == keys[s.pk]]
+                # A new render changes the ETag, which `modified` is part of.
+                now = timezone.now()
+                for snippet in unchanged:
+                    snippet.modified = now
+                store_highlights(unchanged)
+                Snippet.all_objects.bulk_update(unchanged, [*Snippet.HIGHLIGHT_FIELDS, "modified"])
+            rendered += len(unchanged)
+            last_pk = batch[-1].pk
+            if options["verbosity"] > 1:
+                self.stdout.write(f"Rendered snippets up to id {last_pk}")
+
+        self.stdout.write(self.style.SUCCESS(f"Rendered {rendered} snippets."))
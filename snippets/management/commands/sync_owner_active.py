@@ -0,0 +1,19 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from snippets import softdelete
+from snippets.models import Snippet
+
+
+class Command(BaseCommand):
+    help = (
+        "Reinstall the triggers hiding the snippets of deactivated users, and "
+        "copy every user's is_active onto their snippets."
+    )
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            softdelete.install(connection)
+            updated = softdelete.resync(Snippet, User)
+        self.stdout.write(self.style.SUCCESS(f"Updated the visibility of {updated} snippets."))
@@ -0,0 +1,18 @@
+# Generated by Django 5.0.6 on 2026-10-17 01:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('snippets', '0002_auditlog'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='snippet',
+            name='render_key',
+            field=models.CharField(blank=True, default='', editable=False, max_length=64),
+        ),
+    ]
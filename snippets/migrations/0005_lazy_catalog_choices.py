@@ -0,0 +1,24 @@
+# Generated by Django 5.0.6 on 2026-10-17 01:36
+
+import snippets.catalog
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('snippets', '0004_snippet_render_state'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='snippet',
+            name='language',
+            field=models.CharField(choices=snippets.catalog.language_choices, default='python', max_length=100),
+        ),
+        migrations.AlterField(
+            model_name='snippet',
+            name='style',
+            field=models.CharField(choices=snippets.catalog.style_choices, default='friendly', max_length=100),
+        ),
+    ]
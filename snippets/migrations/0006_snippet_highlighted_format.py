@@ -0,0 +1,18 @@
+# Generated by Django 5.0.6 on 2026-10-17 01:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('snippets', '0005_lazy_catalog_choices'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='snippet',
+            name='highlighted_format',
+            field=models.CharField(choices=[('document', 'Document'), ('fragment', 'Fragment')], default='fragment', editable=False, max_length=10),
+        ),
+    ]
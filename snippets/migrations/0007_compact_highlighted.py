@@ -0,0 +1,33 @@
+from django.db import migrations
+
+from snippets.highlight import DOCUMENT, FRAGMENT, compact_documents, wrap_document
+
+
+def compact(apps, schema_editor):
+    Snippet = apps.get_model('snippets', 'Snippet')
+    # Every row rendered before highlighted_format existed is a full document.
+    Snippet.objects.filter(highlighted__startswith='<!DOCTYPE').update(highlighted_format=DOCUMENT)
+    rows, before, after = compact_documents(Snippet)
+    if rows:
+        print(f"\n  Compacted {rows} highlighted snippets from {before} to {after} bytes, "
+              f"saving {before - after} bytes.")
+
+
+def expand(apps, schema_editor):
+    Snippet = apps.get_model('snippets', 'Snippet')
+    snippets = list(Snippet.objects.filter(highlighted_format=FRAGMENT))
+    for snippet in snippets:
+        snippet.highlighted = wrap_document(snippet.highlighted, snippet.style, snippet.title)
+        snippet.highlighted_format = DOCUMENT
+    Snippet.objects.bulk_update(snippets, ['highlighted', 'highlighted_format'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('snippets', '0006_snippet_highlighted_format'),
+    ]
+
+    operations = [
+        migrations.RunPython(compact, expand),
+    ]
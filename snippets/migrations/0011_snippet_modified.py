@@ -0,0 +1,19 @@
+# Generated by Django 5.0.6 on 2026-10-17 03:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('snippets', '0010_auditlog_filter_indexes'),
+    ]
+
+    operations = [
+        # Existing rows are stamped with the time of the migration.
+        migrations.AddField(
+            model_name='snippet',
+            name='modified',
+            field=models.DateTimeField(auto_now=True),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.0.6 on 2026-10-17 04:20
+
+from django.db import migrations
+
+from snippets.search import FTS5Backend
+
+
+def install(apps, schema_editor):
+    # Other databases use the "scan" search backend, which needs no index.
+    if schema_editor.connection.vendor == 'sqlite':
+        with schema_editor.connection.cursor() as cursor:
+            FTS5Backend.install(cursor)
+
+
+def uninstall(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        with schema_editor.connection.cursor() as cursor:
+            FTS5Backend.uninstall(cursor)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('snippets', '0011_snippet_modified'),
+    ]
+
+    operations = [
+        migrations.RunPython(install, uninstall),
+    ]
@@ -0,0 +1,99 @@
+# Generated by Django 5.0.6 on 2026-10-17 05:10
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+from snippets import blobs
+from snippets.search import FTS5Backend
+
+
+def move_to_blobs(apps, schema_editor):
+    Blob = apps.get_model('snippets', 'Blob')
+    Snippet = apps.get_model('snippets', 'Snippet')
+    queryset = Snippet.objects.exclude(highlighted='').only('pk', 'highlighted').order_by('pk')
+    last_pk = 0
+    while True:
+        batch = list(queryset.filter(pk__gt=last_pk)[:500])
+        if not batch:
+            break
+        last_pk = batch[-1].pk
+        new = {}
+        for snippet in batch:
+            hash, data, compressed, size = blobs.encode(snippet.highlighted)
+            new.setdefault(hash, Blob(hash=hash, data=data, compressed=compressed, size=size))
+            snippet.highlighted_blob_id = hash
+        Blob.objects.bulk_create(new.values(), ignore_conflicts=True)
+        Snippet.objects.bulk_update(batch, ['highlighted_blob'])
+    blobs.recount(Blob, Snippet)
+    report = blobs.report(Blob, Snippet)
+    if report['snippets']:
+        print(f"\n  Moved the HTML of {report['snippets']} snippets to {report['blobs']} blobs, "
+              f"storing {report['stored_bytes']} of {report['logical_bytes']} bytes.")
+
+
+def move_from_blobs(apps, schema_editor):
+    Snippet = apps.get_model('snippets', 'Snippet')
+    snippets = list(Snippet.objects.select_related('highlighted_blob').exclude(highlighted_blob=None))
+    for snippet in snippets:
+        blob = snippet.highlighted_blob
+        snippet.highlighted = blobs.decode(blob.data, blob.compressed)
+    Snippet.objects.bulk_update(snippets, ['highlighted'], batch_size=500)
+
+
+def restore_search_index(apps, schema_editor):
+    # Unapplying rebuilds the snippets table, dropping the search triggers.
+    if schema_editor.connection.vendor == 'sqlite':
+        with schema_editor.connection.cursor() as cursor:
+            FTS5Backend.install(cursor)
+
+
+def install_triggers(apps, schema_editor):
+    blobs.install(schema_editor.connection)
+
+
+def uninstall_triggers(apps, schema_editor):
+    blobs.uninstall(schema_editor.connection)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('snippets', '0012_snippet_search_index'),
+    ]
+
+    operations = [
+        migrations.RunPython(migrations.RunPython.noop, restore_search_index),
+        migrations.CreateModel(
+            name='Blob',
+            fields=[
+                ('hash', models.CharField(max_length=64, primary_key=True, serialize=False)),
+                ('data', models.BinaryField()),
+                ('compressed', models.BooleanField(default=False)),
+                ('size', models.PositiveIntegerField()),
+                ('refcount', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='snippet',
+            name='highlighted_blob',
+            field=models.ForeignKey(editable=False, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='+', to='snippets.blob'),
+        ),
+        migrations.RunPython(move_to_blobs, move_from_blobs),
+        migrations.RunPython(install_triggers, uninstall_triggers),
+        # Django would rebuild the table to add the column back when
+        # unapplying, losing its triggers and failing on NOT NULL.
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.RemoveField(
+                    model_name='snippet',
+                    name='highlighted',
+                ),
+            ],
+            database_operations=[
+                migrations.RunSQL(
+                    'ALTER TABLE snippets_snippet DROP COLUMN highlighted',
+                    "ALTER TABLE snippets_snippet ADD COLUMN highlighted text NOT NULL DEFAULT ''",
+                ),
+            ],
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.0.6 on 2026-10-17 05:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('snippets', '0013_snippet_highlighted_blob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='snippet',
+            name='render_checkpoints',
+            field=models.JSONField(editable=False, null=True),
+        ),
+    ]
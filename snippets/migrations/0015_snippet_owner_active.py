@@ -0,0 +1,69 @@
+# Generated by Django 5.0.6 on 2026-10-17 06:10
+
+from django.conf import settings
+from django.db import migrations, models
+
+from snippets import softdelete
+
+
+def copy_owner_active(apps, schema_editor):
+    softdelete.resync(apps.get_model('snippets', 'Snippet'), apps.get_model('auth', 'User'))
+
+
+def install_triggers(apps, schema_editor):
+    softdelete.install(schema_editor.connection)
+
+
+def uninstall_triggers(apps, schema_editor):
+    softdelete.uninstall(schema_editor.connection)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('snippets', '0014_snippet_render_checkpoints'),
+    ]
+
+    operations = [
+        # Django would rebuild the table to add a NOT NULL column on SQLite,
+        # dropping the search index and blob refcount triggers.
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.AddField(
+                    model_name='snippet',
+                    name='owner_active',
+                    field=models.BooleanField(default=True, editable=False),
+                ),
+            ],
+            database_operations=[
+                migrations.RunSQL(
+                    'ALTER TABLE snippets_snippet ADD COLUMN owner_active bool NOT NULL DEFAULT TRUE',
+                    'ALTER TABLE snippets_snippet DROP COLUMN owner_active',
+                ),
+            ],
+        ),
+        migrations.RunPython(copy_owner_active, migrations.RunPython.noop),
+        migrations.RunPython(install_triggers, uninstall_triggers),
+        migrations.RemoveIndex(
+            model_name='snippet',
+            name='snippet_created_id_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='snippet',
+            name='snippet_owner_created_idx',
+        ),
+        migrations.AddIndex(
+            model_name='snippet',
+            index=models.Index(condition=models.Q(('owner_active', True)), fields=['created', 'id'], name='snippet_visible_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='snippet',
+            index=models.Index(condition=models.Q(('owner_active', True)), fields=['owner', 'created', 'id'], name='snippet_visible_owner_idx'),
+        ),
+        # Lists and counts of active users read only this index.
+        migrations.RunSQL(
+            'CREATE INDEX snippets_user_active_idx ON auth_user (id) WHERE is_active',
+            'DROP INDEX snippets_user_active_idx',
+        ),
+    ]
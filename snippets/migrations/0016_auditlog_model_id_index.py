@@ -0,0 +1,17 @@
+# Generated by Django 5.0.6 on 2026-10-17 08:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('snippets', '0015_snippet_owner_active'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='auditlog',
+            index=models.Index(fields=['model_id', 'id'], name='auditlog_model_id_idx'),
+        ),
+    ]
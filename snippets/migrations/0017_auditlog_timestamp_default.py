@@ -0,0 +1,25 @@
+# Generated by Django 5.0.6 on 2026-10-17 09:15
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('snippets', '0016_auditlog_model_id_index'),
+    ]
+
+    operations = [
+        # The column is unchanged; Django would still rebuild the table on
+        # SQLite to alter it.
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.AlterField(
+                    model_name='auditlog',
+                    name='timestamp',
+                    field=models.DateTimeField(default=django.utils.timezone.now, editable=False),
+                ),
+            ],
+        ),
+    ]
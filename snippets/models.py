@@ -1,52 +1,343 @@
+import logging
+from functools import partial
+
 from django.contrib.auth.models import User
-from django.db import models
-from pygments import highlight  
-from pygments.formatters.html import HtmlFormatter  
-from pygments.lexers import get_all_lexers, get_lexer_by_name  
-from pygments.styles import get_all_styles
+from django.db import close_old_connections, models, transaction
+from django.db.models import Exists, OuterRef
+from django.utils import timezone
+from django.utils.functional import cached_property
+
+from . import blobs, incremental
+from .catalog import language_choices, style_choices
+from .highlight import (
+    DOCUMENT,
+    FRAGMENT,
+    cache_key,
+    get_executor,
+    get_render_cache,
+    is_async,
+    render,
+    render_cached,
+    render_key,
+    storage_format,
+    wrap_document,
+)
+from .softdelete import ActiveOwnerManager
+
+logger = logging.getLogger(__name__)
 
-LEXERS = [item for item in get_all_lexers() if item[1]]
-LANGUAGE_CHOICES = sorted([(item[1][0], item[0]) for item in LEXERS])
-STYLE_CHOICES = sorted((item, item) for item in get_all_styles())
+RENDER_READY = "ready"
+RENDER_PENDING = "pending"
+RENDER_FAILED = "failed"
+RENDER_STATE_CHOICES = [
+    (RENDER_READY, "Ready"),
+    (RENDER_PENDING, "Pending"),
+    (RENDER_FAILED, "Failed"),
+]
+HIGHLIGHTED_FORMAT_CHOICES = [
+    (DOCUMENT, "Document"),
+    (FRAGMENT, "Fragment"),
+]
 
 
 class Snippet(models.Model):
     created = models.DateTimeField(auto_now_add=True)
+    modified = models.DateTimeField(auto_now=True)
     title = models.CharField(max_length=100, blank=True, default="")
     code = models.TextField()
     linenos = models.BooleanField(default=False)
     language = models.CharField(
-        choices=LANGUAGE_CHOICES, default="python", max_length=100
+        choices=language_choices, default="python", max_length=100
     )
-    style = models.CharField(choices=STYLE_CHOICES, default="friendly", max_length=100)
+    style = models.CharField(choices=style_choices, default="friendly", max_length=100)
     owner = models.ForeignKey(
         User, related_name="snippets", on_delete=models.CASCADE
     )  
-    highlighted = models.TextField()  
+    # The highlighted HTML, shared with every snippet that renders the same.
+    # Read and written through `highlighted`.
+    highlighted_blob = models.ForeignKey(
+        "Blob", null=True, related_name="+", on_delete=models.PROTECT, editable=False
+    )
+    # Hash of the render inputs `highlighted` was produced from.
+    render_key = models.CharField(max_length=64, blank=True, default="", editable=False)
+    render_state = models.CharField(
+        choices=RENDER_STATE_CHOICES, default=RENDER_READY, max_length=10, editable=False
+    )
+    highlighted_format = models.CharField(
+        choices=HIGHLIGHTED_FORMAT_CHOICES, default=FRAGMENT, max_length=10, editable=False
+    )
+    # Lexer state at each line of large snippets, so that edits re-highlight
+    # only what changed. See `snippets.incremental`.
+    render_checkpoints = models.JSONField(null=True, editable=False)
+    # Copy of the owner's `is_active`, see `snippets.softdelete`.
+    owner_active = models.BooleanField(default=True, editable=False)
+
+    # Snippets of active owners; `all_objects` includes deactivated owners'.
+    objects = ActiveOwnerManager()
+    all_objects = models.Manager()
+
+    # Fields written by `refresh_highlight`, once `store_highlights` ran.
+    HIGHLIGHT_FIELDS = (
+        "highlighted_blob", "highlighted_format", "render_checkpoints", "render_key", "render_state"
+    )
 
     class Meta:
         ordering = ("created",)
+        indexes = [
+            # Keyset pagination of the snippet list, overall and per owner.
+            # Only snippets of active owners are listed, and indexed.
+            models.Index(
+                fields=["created", "id"],
+                condition=models.Q(owner_active=True),
+                name="snippet_visible_created_idx",
+            ),
+            models.Index(
+                fields=["owner", "created", "id"],
+                condition=models.Q(owner_active=True),
+                name="snippet_visible_owner_idx",
+            ),
+        ]
 
     def save(self, *args, **kwargs):  
         """
         Use the `pygments` library to create a highlighted HTML
         representation of the code snippet.
+
+        Rendering is skipped when none of the render inputs changed, and
+        served from the highlight cache when an identical snippet was
+        rendered before. In async highlight mode a cache miss saves the
+        snippet as pending and renders it once the transaction commits.
+
+        Every save stamps `modified`, which with the render inputs makes up
+        the snippet's ETag.
+        """
+        rendered = self.refresh_highlight()
+        update_fields = kwargs.get("update_fields")
+        if update_fields is not None:
+            # `modified` is only stamped when it is saved.
+            update_fields = {*update_fields, "modified"}
+            if rendered:
+                update_fields.update(self.HIGHLIGHT_FIELDS)
+            kwargs["update_fields"] = update_fields
+        # The blob must not be collected before the snippet references it.
+        with transaction.atomic(using=kwargs.get("using"), savepoint=False):
+            store_highlights([self])
+            super(Snippet, self).save(*args, **kwargs)
+        if self.render_state == RENDER_PENDING:
+            transaction.on_commit(self.schedule_render, using=kwargs.get("using"))
+
+    @property
+    def highlighted(self):
+        """
+        The highlighted HTML. Setting it takes effect when the snippet is
+        saved, or for bulk writes once passed to `store_highlights`.
+        """
+        html = self.__dict__.get("_highlighted")
+        if html is not None:
+            return html
+        blob = self.highlighted_blob
+        return "" if blob is None else blob.text
+
+    @highlighted.setter
+    def highlighted(self, html):
+        self.__dict__["_highlighted"] = html
+
+    def render_inputs(self):
+        return (self.code, self.language, self.style, self.linenos, self.title)
+
+    def refresh_highlight(self, force=False, sync=False):
         """
-        lexer = get_lexer_by_name(self.language)
-        linenos = "table" if self.linenos else False
-        options = {"title": self.title} if self.title else {}
-        formatter = HtmlFormatter(
-            style=self.style, linenos=linenos, full=True, **options
+        Re-render `highlighted` if the render inputs changed since the last
+        render. Returns True if the highlight fields were updated.
+
+        Pass `sync=True` to render inline even in async highlight mode.
+        """
+        key = render_key(*self.render_inputs())
+        if key == self.render_key and self.render_state == RENDER_READY and not force:
+            return False
+        inline = sync or not is_async()
+        large = inline and incremental.is_large(self.code)
+        previous = self.previous_render() if large and not force else None
+        self.render_key = key
+        self.highlighted_format = storage_format()
+        self.render_checkpoints = None
+        full = self.highlighted_format == DOCUMENT
+        if not inline:
+            html = get_render_cache().get(cache_key(key, full))
+            if html is None:
+                self.highlighted = ""
+                self.render_state = RENDER_PENDING
+                return True
+        elif large:
+            html, self.render_checkpoints = self.render_large(key, full, previous)
+        else:
+            html = render_cached(key, *self.render_inputs(), full)
+        self.highlighted = html
+        self.render_state = RENDER_READY
+        return True
+
+    def previous_render(self):
+        """
+        Return the stored render of this snippet as an
+        `incremental.Previous` to re-render an edit from, or None.
+        """
+        if self.pk is None or not self.render_key:
+            return None
+        row = (
+            Snippet.all_objects.filter(
+                pk=self.pk,
+                render_key=self.render_key,
+                render_state=RENDER_READY,
+                render_checkpoints__isnull=False,
+                highlighted_blob__isnull=False,
+            )
+            .values_list(
+                "code", "language", "style", "linenos", "title", "highlighted_format",
+                "highlighted_blob__data", "highlighted_blob__compressed", "render_checkpoints",
+            )
+            .first()
+        )
+        if row is None:
+            return None
+        *inputs, highlighted_format, data, compressed, checkpoints = row
+        # Rows written with `update()` may not match their render key.
+        if render_key(*inputs) != self.render_key:
+            return None
+        html = blobs.decode(data, compressed)
+        return incremental.Previous(
+            *inputs, highlighted_format == DOCUMENT, html, checkpoints
+        )
+
+    def render_large(self, key, full, previous=None):
+        """
+        Render a large snippet, re-lexing only the lines edited since the
+        `previous` render when there is one. Returns (html, checkpoints),
+        with no checkpoints when the HTML came from the highlight cache.
+        """
+        cache = get_render_cache()
+        if previous is not None:
+            result = incremental.rerender(previous, *self.render_inputs(), full)
+            # Kept out of the cache shared by every snippet with these
+            # inputs, which only holds full renders.
+            if result is not None:
+                return result
+        html = cache.get(cache_key(key, full))
+        if html is not None:
+            return html, None
+        html, checkpoints = incremental.render(*self.render_inputs(), full)
+        cache.set(cache_key(key, full), html)
+        return html, checkpoints
+
+    def highlighted_document(self):
+        """
+        Return `highlighted` as a complete HTML document, whatever its format.
+        """
+        if self.highlighted_format == FRAGMENT:
+            return wrap_document(self.highlighted, self.style, self.title)
+        return self.highlighted
+
+    def schedule_render(self):
+        """
+        Render the snippet on the highlight executor and store the result,
+        unless the snippet has been edited again in the meantime.
+        """
+        executor = get_executor()
+        full = self.highlighted_format == DOCUMENT
+        future = executor.submit(render, *self.render_inputs(), full)
+        future.add_done_callback(
+            partial(
+                _store_render,
+                self.pk,
+                self.render_key,
+                full,
+                release_connections=not getattr(executor, "inline", False),
+            )
         )
-        self.highlighted = highlight(self.code, lexer, formatter)
-        super(Snippet, self).save(*args, **kwargs)
 
     def __str__(self):
         return self.title
 
 
+def store_highlights(snippets):
+    """
+    Point the snippets whose `highlighted` was set at blobs holding the
+    HTML, inserting the blobs that do not exist yet. Blob refcounts follow
+    once the snippets are written, so call this in the same transaction.
+    """
+    new = {}
+    for snippet in snippets:
+        html = snippet.__dict__.pop("_highlighted", None)
+        if html is None:
+            continue
+        if not html:
+            snippet.highlighted_blob = None
+            continue
+        blob = Blob.from_text(html)
+        snippet.highlighted_blob = new.setdefault(blob.hash, blob)
+    if new:
+        Blob.objects.bulk_create(new.values(), ignore_conflicts=True)
+
+
+def _store_render(pk, key, full, future, release_connections=True):
+    try:
+        try:
+            html = future.result()
+        except Exception:
+            logger.exception("Highlighting snippet %s failed", pk)
+            Snippet.all_objects.filter(pk=pk, render_key=key).update(
+                render_state=RENDER_FAILED, modified=timezone.now()
+            )
+            return
+        get_render_cache().set(cache_key(key, full), html)
+        blob = Blob.from_text(html)
+        with transaction.atomic():
+            Blob.objects.bulk_create([blob], ignore_conflicts=True)
+            # Filtering on the key drops results for inputs that have since changed.
+            updated = Snippet.all_objects.filter(pk=pk, render_key=key).update(
+                highlighted_blob=blob, render_state=RENDER_READY, modified=timezone.now()
+            )
+            if not updated:
+                # Only what references the blob decides; its refcount is
+                # only as good as the triggers keeping it.
+                referenced = Snippet.all_objects.filter(highlighted_blob=OuterRef("pk"))
+                Blob.objects.filter(pk=blob.pk, refcount=0).exclude(Exists(referenced)).delete()
+    finally:
+        if release_connections:
+            close_old_connections()
+
+
+class Blob(models.Model):
+    """
+    Highlighted HTML stored once for all snippets rendering to it, keyed on
+    its sha256. See `snippets.blobs`.
+    """
+    hash = models.CharField(primary_key=True, max_length=64)
+    data = models.BinaryField()
+    compressed = models.BooleanField(default=False)
+    # Length of the HTML in bytes, before compression.
+    size = models.PositiveIntegerField()
+    # Snippets referencing the blob, counted by database triggers.
+    refcount = models.PositiveIntegerField(default=0)
+
+    @classmethod
+    def from_text(cls, text):
+        hash, data, compressed, size = blobs.encode(text)
+        blob = cls(hash=hash, data=data, compressed=compressed, size=size)
+        blob.__dict__["text"] = text
+        return blob
+
+    @cached_property
+    def text(self):
+        return blobs.decode(self.data, self.compressed)
+
+    def __str__(self):
+        return self.hash
+
+
 class AuditLog(models.Model):
-    timestamp = models.DateTimeField(auto_now_add=True)
+    # Set when the entry is recorded, which the buffered sink does before
+    # writing it.
+    timestamp = models.DateTimeField(default=timezone.now, editable=False)
     action = models.CharField(max_length=100)
     user = models.ForeignKey(User, on_delete=models.SET_NULL, null=True)
     model_name = models.CharField(max_length=100)
@@ -54,9 +345,16 @@ class AuditLog(models.Model):
 
     class Meta:
         ordering = ["-id"]
+        indexes = [
+            # Retention scans for entries older than a cutoff.
+            models.Index(fields=["timestamp"], name="auditlog_timestamp_idx"),
+            # Filters of AuditLogFilter, each ending in id to serve the
+            # newest-first order without sorting.
+            models.Index(fields=["user", "id"], name="auditlog_user_id_idx"),
+            models.Index(fields=["model_name", "model_id", "id"], name="auditlog_model_idx"),
+            models.Index(fields=["model_id", "id"], name="auditlog_model_id_idx"),
+            models.Index(fields=["action", "id"], name="auditlog_action_id_idx"),
+        ]
 
     def __str__(self):
         return f"ACTION: {self.action} MODEL: {self.model_name} ID: {self.model_id}, ON: {self.timestamp.strftime('%Y-%m-%d %H:%M:%S')}"
-
-
-
@@ -0,0 +1,42 @@
+from rest_framework.pagination import BasePagination, CursorPagination, PageNumberPagination
+
+
+class PageNumberOrCursorPagination(BasePagination):
+    """
+    Page number pagination unless the request asks for cursor pagination with
+    ``?pagination=cursor`` (or follows a cursor link).
+
+    Cursor pages are keyset queries ordered by the view's `cursor_ordering`,
+    so they cost the same at any depth and skip the COUNT(*) that numbered
+    pages need.
+    """
+    mode_query_param = "pagination"
+    cursor_mode = "cursor"
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.paginator = self.get_paginator(request, view)
+        return self.paginator.paginate_queryset(queryset, request, view)
+
+    def get_paginator(self, request, view):
+        wants_cursor = (
+            request.query_params.get(self.mode_query_param) == self.cursor_mode
+            or CursorPagination.cursor_query_param in request.query_params
+        )
+        if wants_cursor and getattr(view, "cursor_ordering", None):
+            paginator = CursorPagination()
+            paginator.ordering = view.cursor_ordering
+            return paginator
+        return PageNumberPagination()
+
+    def get_paginated_response(self, data):
+        return self.paginator.get_paginated_response(data)
+
+    def get_paginated_response_schema(self, schema):
+        return PageNumberPagination().get_paginated_response_schema(schema)
+
+    def __getattr__(self, name):
+        # Delegate everything else, such as the browsable API's page
+        # controls, to the paginator chosen for this request.
+        if name == "paginator":
+            raise AttributeError(name)
+        return getattr(self.paginator, name)
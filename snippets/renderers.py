@@ -0,0 +1,74 @@
+import csv
+import io
+import json
+
+from rest_framework import renderers
+from rest_framework.utils import encoders
+
+
+class CSSRenderer(renderers.BaseRenderer):
+    media_type = "text/css"
+    format = "css"
+    charset = "utf-8"
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b""
+        if isinstance(data, str):
+            return data.encode(self.charset)
+        # Error responses carry a dict such as {"detail": "Not found."}.
+        return f"/* {data.get('detail', '')} */\n".encode(self.charset)
+
+
+class CSVRenderer(renderers.BaseRenderer):
+    """
+    Renders a list of flat dicts as CSV. `stream` renders an iterable of such
+    lists chunk by chunk for StreamingHttpResponse.
+    """
+    media_type = "text/csv"
+    format = "csv"
+    charset = "utf-8"
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b""
+        if isinstance(data, dict):
+            data = [data]
+        fields = list(data[0]) if data else []
+        return b"".join(self.stream([data], fields))
+
+    def stream(self, chunks, fields):
+        buffer = io.StringIO()
+        writer = csv.DictWriter(buffer, fieldnames=fields, extrasaction="ignore")
+        writer.writeheader()
+        for rows in chunks:
+            writer.writerows(rows)
+            yield buffer.getvalue().encode(self.charset)
+            buffer.seek(0)
+            buffer.truncate()
+        # Nothing was yielded for an empty export; emit the header alone.
+        if buffer.tell():
+            yield buffer.getvalue().encode(self.charset)
+
+
+class NDJSONRenderer(renderers.BaseRenderer):
+    """
+    Renders a list of dicts as newline delimited JSON, one object per line.
+    """
+    media_type = "application/x-ndjson"
+    format = "ndjson"
+    charset = "utf-8"
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b""
+        if isinstance(data, dict):
+            data = [data]
+        return b"".join(self.stream([data]))
+
+    def stream(self, chunks, fields=None):
+        for rows in chunks:
+            yield "".join(
+                json.dumps(row, cls=encoders.JSONEncoder, ensure_ascii=False) + "\n"
+                for row in rows
+            ).encode(self.charset)
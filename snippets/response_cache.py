@@ -0,0 +1,113 @@
+"""
+A cache of the payloads served to anonymous snippet reads.
+
+Entries are keyed on the absolute URL (query string included, so the page
+too) and response format, plus the current generation of every scope the
+payload depends on: "list" for list pages and "snippet:<pk>" for a detail.
+Invalidating a scope replaces its generation, so stale entries are never
+looked up again and simply expire. Generations are random rather than
+counters so an evicted generation cannot bring old entries back.
+
+Enabled by setting RESPONSE_CACHE_ALIAS. Any Django cache backend works;
+with the local memory backend each process has its own generations, so use
+a shared backend when running more than one process.
+"""
+import hashlib
+import threading
+import uuid
+
+from django.core.cache import caches
+from django.db import transaction
+
+from .conf import get_setting, on_settings_changed
+
+KEY_PREFIX = "snippets:response:"
+GENERATION_PREFIX = "snippets:response:generation:"
+LIST_SCOPE = "list"
+
+
+def snippet_scope(pk):
+    return f"snippet:{pk}"
+
+
+class ResponseCache:
+    def __init__(self, alias, timeout):
+        self.alias = alias
+        self.timeout = timeout
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    @property
+    def cache(self):
+        return caches[self.alias]
+
+    def generations(self, scopes):
+        keys = [GENERATION_PREFIX + scope for scope in scopes]
+        found = self.cache.get_many(keys)
+        for key in keys:
+            if key not in found:
+                self.cache.add(key, uuid.uuid4().hex, None)
+                found[key] = self.cache.get(key)
+        return [found[key] for key in keys]
+
+    def key(self, scopes, url, format):
+        parts = [url, format or "", *self.generations(scopes)]
+        return KEY_PREFIX + hashlib.sha256("\0".join(parts).encode("utf-8")).hexdigest()
+
+    def get(self, key):
+        data = self.cache.get(key)
+        with self._lock:
+            if data is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return data
+
+    def set(self, key, data):
+        self.cache.set(key, data, self.timeout)
+
+    def invalidate(self, scopes):
+        self.cache.set_many(
+            {GENERATION_PREFIX + scope: uuid.uuid4().hex for scope in scopes}, None
+        )
+
+
+_response_cache = None
+_response_cache_lock = threading.Lock()
+
+
+def get_response_cache():
+    """
+    Return the response cache, or None if it is disabled.
+    """
+    global _response_cache
+    alias = get_setting("RESPONSE_CACHE_ALIAS")
+    if alias is None:
+        return None
+    if _response_cache is None:
+        with _response_cache_lock:
+            if _response_cache is None:
+                _response_cache = ResponseCache(alias, get_setting("RESPONSE_CACHE_TIMEOUT"))
+    return _response_cache
+
+
+@on_settings_changed
+def _reset_response_cache():
+    global _response_cache
+    _response_cache = None
+
+
+def invalidate_snippets(pks):
+    """
+    Drop cached list pages and the cached details of the snippets `pks`.
+    """
+    response_cache = get_response_cache()
+    if response_cache is None:
+        return
+    scopes = [LIST_SCOPE, *map(snippet_scope, pks)]
+    response_cache.invalidate(scopes)
+    # Invalidate again once the write is visible to other connections, or a
+    # read racing the commit could cache the old rows under the new
+    # generation.
+    transaction.on_commit(lambda: response_cache.invalidate(scopes))
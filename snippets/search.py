@@ -0,0 +1,209 @@
+"""
+Full-text search over snippet titles and code.
+
+A search backend narrows a snippet queryset to the matches of a query,
+ranked best first, and fills in highlighted match fragments for a page of
+results. The backend is chosen by the SEARCH_BACKEND setting:
+
+* "fts5" searches an SQLite FTS5 index of the snippets table. Triggers keep
+  the index in sync with every insert, update and delete, bulk ones and
+  ``QuerySet.update()`` included, so nothing in Python has to remember to.
+  The triggers live on the table, so a migration that makes Django rebuild
+  the table drops them; they are put back after ``migrate``, see
+  `snippets.triggers`, and ``python manage.py rebuild_search_index`` puts
+  them back and reindexes.
+* "scan" filters with ``icontains``. It needs no index, works on any
+  database and reads every row.
+* A dotted path to a `SearchBackend` subclass.
+
+Left unset, "fts5" is used on SQLite and "scan" elsewhere.
+"""
+import re
+import threading
+
+from django.db import connection
+from django.db.models import Case, FloatField, Q, Value, When
+from django.utils.html import escape
+from django.utils.module_loading import import_string
+
+from .conf import get_setting, on_settings_changed
+
+FTS_TABLE = "snippets_snippet_fts"
+
+# Matches are wrapped in these while the text is still unescaped.
+MARK_START = "\x02"
+MARK_END = "\x03"
+ELLIPSIS = "…"
+
+# A match in the title counts for this many matches in the code.
+TITLE_WEIGHT = 10.0
+# Roughly how many tokens of code a highlighted fragment spans.
+FRAGMENT_TOKENS = 16
+
+
+def search_terms(query):
+    """
+    Split a user's query into words. Punctuation only separates words, so
+    queries can never be malformed.
+    """
+    return re.findall(r"\w+", query)
+
+
+def mark(text):
+    """
+    Escape `text` and turn the match markers in it into <mark> elements.
+    """
+    return escape(text).replace(MARK_START, "<mark>").replace(MARK_END, "</mark>")
+
+
+class SearchBackend:
+    def search(self, queryset, terms):
+        """
+        Return `queryset` narrowed to snippets matching all of `terms`,
+        ranked best first, with each snippet's score as `search_rank`.
+        """
+        raise NotImplementedError
+
+    def highlight(self, snippets, terms):
+        """
+        Set `search_highlights` on the results in `snippets` to a dict of
+        their title and a fragment of their code, matches in <mark>.
+        """
+        raise NotImplementedError
+
+    def rebuild(self):
+        """
+        Rebuild the index from the snippets table, if there is one.
+        """
+
+
+class FTS5Backend(SearchBackend):
+    # The index stores no copy of the text; it reads it from the snippets
+    # table ("external content") when highlighting.
+    SCHEMA = [
+        f"""CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(
+            title, code, content='snippets_snippet', content_rowid='id'
+        )""",
+        f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_insert AFTER INSERT ON snippets_snippet BEGIN
+            INSERT INTO {FTS_TABLE}(rowid, title, code) VALUES (new.id, new.title, new.code);
+        END""",
+        f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_delete AFTER DELETE ON snippets_snippet BEGIN
+            INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, title, code)
+            VALUES ('delete', old.id, old.title, old.code);
+        END""",
+        # Only writes to the indexed columns touch the index.
+        f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_update AFTER UPDATE OF title, code
+        ON snippets_snippet BEGIN
+            INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, title, code)
+            VALUES ('delete', old.id, old.title, old.code);
+            INSERT INTO {FTS_TABLE}(rowid, title, code) VALUES (new.id, new.title, new.code);
+        END""",
+    ]
+    DROP = [
+        f"DROP TRIGGER IF EXISTS {FTS_TABLE}_insert",
+        f"DROP TRIGGER IF EXISTS {FTS_TABLE}_delete",
+        f"DROP TRIGGER IF EXISTS {FTS_TABLE}_update",
+        f"DROP TABLE IF EXISTS {FTS_TABLE}",
+    ]
+
+    @classmethod
+    def install(cls, cursor):
+        for statement in cls.SCHEMA:
+            cursor.execute(statement)
+        cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')")
+
+    @classmethod
+    def uninstall(cls, cursor):
+        for statement in cls.DROP:
+            cursor.execute(statement)
+
+    def match_expression(self, terms):
+        # Quoted terms are matched literally. The last one also matches as a
+        # prefix, for queries typed as you go.
+        return " ".join(f'"{term}"' for term in terms) + "*"
+
+    def search(self, queryset, terms):
+        fts = connection.ops.quote_name(FTS_TABLE)
+        return queryset.extra(
+            tables=[FTS_TABLE],
+            where=[f"{fts}.rowid = snippets_snippet.id", f"{fts} MATCH %s"],
+            params=[self.match_expression(terms)],
+            select={
+                # bm25() scores better matches lower.
+                "search_rank": f"-bm25({fts}, {TITLE_WEIGHT}, 1.0)",
+                "search_title": f"highlight({fts}, 0, %s, %s)",
+                "search_code": f"snippet({fts}, 1, %s, %s, %s, {FRAGMENT_TOKENS})",
+            },
+            select_params=[MARK_START, MARK_END, MARK_START, MARK_END, ELLIPSIS],
+        ).order_by("-search_rank", "id")
+
+    def highlight(self, snippets, terms):
+        for snippet in snippets:
+            snippet.search_highlights = {
+                "title": mark(snippet.search_title),
+                "code": mark(snippet.search_code),
+            }
+
+    def rebuild(self):
+        with connection.cursor() as cursor:
+            self.install(cursor)
+
+
+class ScanBackend(SearchBackend):
+    def search(self, queryset, terms):
+        for term in terms:
+            queryset = queryset.filter(Q(title__icontains=term) | Q(code__icontains=term))
+        # Rank snippets by how many of the terms their title contains.
+        rank = sum(
+            (
+                Case(When(title__icontains=term, then=Value(TITLE_WEIGHT)), default=Value(0.0))
+                for term in terms
+            ),
+            Value(0.0, output_field=FloatField()),
+        )
+        return queryset.annotate(search_rank=rank).order_by("-search_rank", "id")
+
+    def highlight(self, snippets, terms):
+        pattern = re.compile("|".join(re.escape(term) for term in terms), re.IGNORECASE)
+        for snippet in snippets:
+            snippet.search_highlights = {
+                "title": mark(pattern.sub(self._mark, snippet.title)),
+                "code": mark(self.fragment(pattern, snippet.code)),
+            }
+
+    def fragment(self, pattern, code):
+        # Start at the line of the first match.
+        match = pattern.search(code)
+        start = code.rfind("\n", 0, match.start()) + 1 if match else 0
+        end = start + FRAGMENT_TOKENS * 8
+        text = pattern.sub(self._mark, code[start:end])
+        return (ELLIPSIS if start else "") + text + (ELLIPSIS if end < len(code) else "")
+
+    @staticmethod
+    def _mark(match):
+        return MARK_START + match.group(0) + MARK_END
+
+
+BACKENDS = {"fts5": FTS5Backend, "scan": ScanBackend}
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def get_search_backend():
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                name = get_setting("SEARCH_BACKEND")
+                if name is None:
+                    name = "fts5" if connection.vendor == "sqlite" else "scan"
+                backend_class = BACKENDS.get(name) or import_string(name)
+                _backend = backend_class()
+    return _backend
+
+
+@on_settings_changed
+def _reset_search_backend():
+    global _backend
+    _backend = None
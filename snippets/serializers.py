@@ -1,10 +1,51 @@
+from collections import defaultdict
+
 from django.contrib.auth.models import User
+from django.db.models import Window
+from django.db.models.functions import RowNumber
 from rest_framework import serializers
+from rest_framework.reverse import reverse
+from rest_framework.utils.urls import replace_query_param
+from snippets import catalog
+from snippets.conf import get_setting
+from snippets.instrumentation import InstrumentedSerializerMixin, timed
 from snippets.models import AuditLog, Snippet
+from snippets.softdelete import include_deactivated
+
+
+class CatalogChoiceField(serializers.ChoiceField):
+    """
+    A ChoiceField backed by a cached `snippets.catalog` table. The default
+    ChoiceField rebuilds its lookup tables for every serializer instance,
+    which for the several hundred pygments languages adds up per request.
+    """
+
+    def __init__(self, table, **kwargs):
+        self.table = table
+        super().__init__(choices=(), **kwargs)
+
+    def _get_choices(self):
+        return self.table().labels
+
+    def _set_choices(self, choices):
+        # Choices always come from the catalog table.
+        pass
 
+    choices = property(_get_choices, _set_choices)
 
-class SnippetSerializer(serializers.HyperlinkedModelSerializer): 
+    @property
+    def grouped_choices(self):
+        return self.table().labels
+
+    @property
+    def choice_strings_to_values(self):
+        return self.table().strings_to_values
+
+
+class SnippetSerializer(InstrumentedSerializerMixin, serializers.HyperlinkedModelSerializer): 
     owner = serializers.ReadOnlyField(source="owner.username")
+    language = CatalogChoiceField(catalog.languages, required=False)
+    style = CatalogChoiceField(catalog.styles, required=False)
     highlight = serializers.HyperlinkedIdentityField(  
         view_name="snippet-highlight", format="html"
     )
@@ -24,10 +65,38 @@ class SnippetSerializer(serializers.HyperlinkedModelSerializer):
         )  
 
 
-class UserSerializer(serializers.HyperlinkedModelSerializer):
-    snippets = serializers.HyperlinkedRelatedField(  
-        many=True, view_name="snippet-detail", read_only=True
+class SnippetSearchSerializer(SnippetSerializer):
+    """
+    A search result: the snippet, its score and its highlighted matches.
+    """
+    rank = serializers.FloatField(source="search_rank", read_only=True)
+    highlights = serializers.DictField(source="search_highlights", read_only=True)
+
+    class Meta(SnippetSerializer.Meta):
+        fields = SnippetSerializer.Meta.fields + ("rank", "highlights")
+
+
+class SnippetLinksField(serializers.ManyRelatedField):
+    """
+    Links to a user's snippets, at most USER_SNIPPET_LINKS_LIMIT of them.
+    Uses the `snippet_links` prefetched by the user views when present.
+    """
+
+    def get_attribute(self, instance):
+        related = getattr(instance, "snippet_links", None)
+        if related is None:
+            related = super().get_attribute(instance)
+        limit = get_setting("USER_SNIPPET_LINKS_LIMIT")
+        return related if limit is None else related[:limit]
+
+
+class UserSerializer(InstrumentedSerializerMixin, serializers.HyperlinkedModelSerializer):
+    snippets = SnippetLinksField(  
+        child_relation=serializers.HyperlinkedRelatedField(view_name="snippet-detail", read_only=True),
+        read_only=True,
     )
+    snippets_count = serializers.SerializerMethodField()
+    snippets_url = serializers.SerializerMethodField()
 
     class Meta:
         model = User
@@ -38,15 +107,161 @@ class UserSerializer(serializers.HyperlinkedModelSerializer):
             "username",
             "email",
             "password",
-            "snippets"
+            "snippets",
+            "snippets_count",
+            "snippets_url",
         )
         extra_kwargs = {
             "is_active": {"read_only": True},
             "password": {"write_only": True}
         }
 
+    def get_snippets_count(self, obj):
+        # Annotated by the user views; count directly for other querysets.
+        count = getattr(obj, "snippets_count", None)
+        return obj.snippets.count() if count is None else count
+
+    def get_snippets_url(self, obj):
+        url = reverse("snippet-list", request=self.context.get("request"))
+        return replace_query_param(url, "owner", obj.pk)
+
+
+# Stands in for the pk when building URL templates, long enough not to occur
+# anywhere else in a URL.
+TEMPLATE_PK = 7_380_149_265_003_518
+
+
+def url_template(field, model):
+    """
+    Return the (prefix, suffix) that the URLs a hyperlinked `field` produces
+    for instances of `model` have around their pk.
+    """
+    url = field.to_representation(model(pk=TEMPLATE_PK))
+    prefix, suffix = str(url).split(str(TEMPLATE_PK))
+    return prefix, suffix
+
+
+class ValuesSerializer:
+    """
+    Read-only serialization of `.values()` rows into exactly what
+    `serializer_class(instances, many=True).data` returns, for lists.
+
+    The serializer's fields are bound once, and hyperlinks are built from
+    URL templates, instead of binding fields and reversing URLs per row.
+    """
+    serializer_class = None
+    # The columns `values()` reads, keyed as `to_representation` reads them.
+    columns = ()
+
+    def __init__(self, context):
+        self.context = context
+        self.fields = self.serializer_class(context=context).fields
+
+    def values(self, queryset, *extra):
+        """
+        Return `queryset` as the rows to serialize. `extra` columns, such
+        as cursor pagination's ordering, are read too.
+        """
+        return queryset.values(*self.columns, *extra)
+
+    def serialize(self, rows):
+        with timed("serialize"):
+            return [self.to_representation(row) for row in rows]
+
+    def to_representation(self, row):
+        raise NotImplementedError
+
+
+class SnippetValuesSerializer(ValuesSerializer):
+    serializer_class = SnippetSerializer
+    columns = ("id", "title", "code", "linenos", "language", "style", "owner__username")
+
+    def __init__(self, context):
+        super().__init__(context)
+        self.url = url_template(self.fields["url"], Snippet)
+        self.highlight = url_template(self.fields["highlight"], Snippet)
+        self.languages = self.fields["language"].choice_strings_to_values
+        self.styles = self.fields["style"].choice_strings_to_values
+
+    def to_representation(self, row):
+        pk = row["id"]
+        url, highlight = self.url, self.highlight
+        return {
+            "url": f"{url[0]}{pk}{url[1]}",
+            "id": pk,
+            "highlight": f"{highlight[0]}{pk}{highlight[1]}",
+            "title": row["title"],
+            "code": row["code"],
+            "linenos": bool(row["linenos"]),
+            "language": self.languages.get(row["language"], row["language"]),
+            "style": self.styles.get(row["style"], row["style"]),
+            "owner": row["owner__username"],
+        }
+
 
-class AuditLogSerializer(serializers.ModelSerializer):
+class UserValuesSerializer(ValuesSerializer):
+    """
+    Users as UserSerializer shows them. Rows need the `snippets_count`
+    annotation of the user views; the snippet links are read with one more
+    query per page.
+    """
+    serializer_class = UserSerializer
+    columns = ("id", "is_active", "username", "email", "snippets_count")
+
+    def __init__(self, context):
+        super().__init__(context)
+        self.url = url_template(self.fields["url"], User)
+        self.snippet_url = url_template(self.fields["snippets"].child_relation, Snippet)
+        snippets_url = reverse("snippet-list", request=context.get("request"))
+        prefix, suffix = replace_query_param(snippets_url, "owner", TEMPLATE_PK).split(str(TEMPLATE_PK))
+        self.snippets_url = prefix, suffix
+
+    def values(self, queryset, *extra):
+        # The links are read by `snippet_links` instead of a prefetch.
+        return super().values(queryset.prefetch_related(None), *extra)
+
+    def serialize(self, rows):
+        rows = list(rows)
+        self.links = self.snippet_links([row["id"] for row in rows])
+        return super().serialize(rows)
+
+    def snippet_links(self, user_ids):
+        """
+        Return the ids of (at most USER_SNIPPET_LINKS_LIMIT of) the snippets
+        of each of `user_ids`, in the order UserSerializer lists them.
+        """
+        request = self.context.get("request")
+        snippets = Snippet.objects
+        if request is not None and include_deactivated(request.user, request.query_params):
+            snippets = Snippet.all_objects
+        snippets = snippets.filter(owner_id__in=user_ids)
+        limit = get_setting("USER_SNIPPET_LINKS_LIMIT")
+        if limit is not None:
+            position = Window(RowNumber(), partition_by="owner_id", order_by=Snippet._meta.ordering)
+            snippets = snippets.annotate(position=position).filter(position__lte=limit)
+        links = defaultdict(list)
+        for owner_id, pk in snippets.values_list("owner_id", "id"):
+            links[owner_id].append(pk)
+        return links
+
+    def to_representation(self, row):
+        pk = row["id"]
+        url, snippet_url, snippets_url = self.url, self.snippet_url, self.snippets_url
+        return {
+            "url": f"{url[0]}{pk}{url[1]}",
+            "id": pk,
+            "is_active": bool(row["is_active"]),
+            "username": row["username"],
+            "email": row["email"],
+            "snippets": [
+                f"{snippet_url[0]}{snippet_pk}{snippet_url[1]}" for snippet_pk in self.links.get(pk, ())
+            ],
+            "snippets_count": row["snippets_count"],
+            "snippets_url": f"{snippets_url[0]}{pk}{snippets_url[1]}",
+        }
+
+
+class AuditLogSerializer(InstrumentedSerializerMixin, serializers.ModelSerializer):
 
     class Meta:
         model = AuditLog
@@ -55,4 +270,13 @@ class AuditLogSerializer(serializers.ModelSerializer):
             "model_name",
             "model_id",
             "timestamp"
-        )
\ No newline at end of file
+        )
+
+class AuditLogExportSerializer(AuditLogSerializer):
+    """
+    An audit log entry as exported, with its id and the acting user's name.
+    """
+    user = serializers.CharField(source="user.username", read_only=True)
+
+    class Meta(AuditLogSerializer.Meta):
+        fields = ("id", "user") + AuditLogSerializer.Meta.fields
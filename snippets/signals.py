@@ -0,0 +1,67 @@
+from django.contrib.auth.models import User
+from django.db import connections
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+
+from .authentication import evict_token, evict_user
+from .models import Snippet
+from .response_cache import get_response_cache, invalidate_snippets
+
+
+@receiver(post_save, sender=Snippet)
+@receiver(post_delete, sender=Snippet)
+def _invalidate_snippet(sender, instance, **kwargs):
+    invalidate_snippets([instance.pk])
+
+
+@receiver(pre_save, sender=User)
+def _note_username_change(sender, instance, update_fields=None, **kwargs):
+    # Snippet payloads show the owner's username.
+    if get_response_cache() is None or instance.pk is None:
+        return
+    if update_fields is not None and "username" not in update_fields:
+        return
+    old = User.objects.filter(pk=instance.pk).values_list("username", flat=True).first()
+    instance._snippets_username_changed = old is not None and old != instance.username
+
+
+@receiver(post_save, sender=User)
+def _invalidate_owner_snippets(sender, instance, **kwargs):
+    if instance.__dict__.pop("_snippets_username_changed", False):
+        invalidate_snippets(instance.snippets.values_list("pk", flat=True))
+
+
+@receiver(pre_save, sender=User)
+def _note_activation_change(sender, instance, using, update_fields=None, **kwargs):
+    # Snippets of deactivated users are hidden, see snippets.softdelete.
+    if instance.pk is None:
+        return
+    if update_fields is not None and "is_active" not in update_fields:
+        return
+    if connections[using].vendor == "sqlite" and get_response_cache() is None:
+        return
+    old = User.objects.using(using).filter(pk=instance.pk).values_list("is_active", flat=True).first()
+    instance._snippets_activation_changed = old is not None and old != instance.is_active
+
+
+@receiver(post_save, sender=User)
+def _hide_owner_snippets(sender, instance, using, **kwargs):
+    if not instance.__dict__.pop("_snippets_activation_changed", False):
+        return
+    snippets = Snippet.all_objects.using(using).filter(owner=instance)
+    # SQLite triggers already copied is_active onto the snippets.
+    if connections[using].vendor != "sqlite":
+        snippets.update(owner_active=instance.is_active)
+    invalidate_snippets(snippets.values_list("pk", flat=True))
+
+
+@receiver(post_save, sender=User)
+def _evict_cached_logins(sender, instance, **kwargs):
+    # Covers deactivation by UserDetail.perform_destroy and password changes.
+    evict_user(instance.pk)
+
+
+@receiver(post_delete, sender=Token)
+def _evict_cached_token(sender, instance, **kwargs):
+    evict_token(instance.key)
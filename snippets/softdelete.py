@@ -0,0 +1,95 @@
+"""
+Soft deletion of users.
+
+Deleting a user through the API deactivates them (``is_active=False``)
+instead of removing the row, keeping their audit log entries attributed.
+Deactivated users and their snippets are hidden from the API: the user
+views filter them out with `filters.ActiveUserFilter`, and
+``Snippet.objects``, the default manager, excludes the snippets of
+deactivated owners. Staff asking
+with ``?include_deactivated=1`` see both; ``Snippet.all_objects`` always
+does.
+
+Hiding snippets does not check each snippet's owner. Every snippet carries
+a copy of its owner's ``is_active`` in ``owner_active``, which partial
+indexes on the snippets table are conditioned on, so listing and counting
+visible snippets reads only those indexes. On SQLite triggers keep the
+copies in sync however users and snippets are written. Like the search
+index triggers they are lost when a migration rebuilds either table, and
+reinstalled after ``migrate`` by `snippets.triggers`; on other databases
+there are none and saving a user updates the copies instead.
+``python manage.py sync_owner_active`` reinstalls the triggers and recopies
+every owner's state.
+"""
+from django.db import models
+
+SCHEMA = [
+    """CREATE TRIGGER IF NOT EXISTS snippets_owner_active_user AFTER UPDATE OF is_active
+    ON auth_user WHEN old.is_active IS NOT new.is_active BEGIN
+        UPDATE snippets_snippet SET owner_active = new.is_active WHERE owner_id = new.id;
+    END""",
+    # Snippets are created active; only those of a deactivated owner are fixed.
+    """CREATE TRIGGER IF NOT EXISTS snippets_owner_active_insert AFTER INSERT ON snippets_snippet
+    WHEN new.owner_active IS NOT (SELECT is_active FROM auth_user WHERE id = new.owner_id) BEGIN
+        UPDATE snippets_snippet SET owner_active = NOT new.owner_active WHERE id = new.id;
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS snippets_owner_active_owner AFTER UPDATE OF owner_id
+    ON snippets_snippet WHEN old.owner_id IS NOT new.owner_id BEGIN
+        UPDATE snippets_snippet SET owner_active = (
+            SELECT is_active FROM auth_user WHERE id = new.owner_id
+        ) WHERE id = new.id;
+    END""",
+]
+DROP = [
+    "DROP TRIGGER IF EXISTS snippets_owner_active_user",
+    "DROP TRIGGER IF EXISTS snippets_owner_active_insert",
+    "DROP TRIGGER IF EXISTS snippets_owner_active_owner",
+]
+
+
+def install(connection):
+    if connection.vendor == "sqlite":
+        with connection.cursor() as cursor:
+            for statement in SCHEMA:
+                cursor.execute(statement)
+
+
+def uninstall(connection):
+    if connection.vendor == "sqlite":
+        with connection.cursor() as cursor:
+            for statement in DROP:
+                cursor.execute(statement)
+
+
+def resync(snippet_model, user_model):
+    """
+    Copy every owner's ``is_active`` onto their snippets. Works with
+    historical models so migrations can use it. Returns the number of
+    snippets whose copy was out of date.
+    """
+    updated = 0
+    snippets = snippet_model._base_manager
+    for is_active in (True, False):
+        owners = user_model._base_manager.filter(is_active=is_active).values("pk")
+        updated += snippets.filter(owner__in=owners).exclude(owner_active=is_active).update(
+            owner_active=is_active
+        )
+    return updated
+
+
+class ActiveOwnerManager(models.Manager):
+    """
+    A manager excluding the snippets of deactivated owners.
+    """
+
+    def get_queryset(self):
+        return super().get_queryset().filter(owner_active=True)
+
+
+def include_deactivated(user, params):
+    """
+    Whether to show deactivated users and their snippets: to staff asking
+    with ``?include_deactivated=1``.
+    """
+    return user.is_staff and params.get("include_deactivated", "") == "1"
+
@@ -1,16 +1,52 @@
+import base64
+import gzip
+import csv
+import json
+import os
+import random
+import re
+import shutil
+import sqlite3
+import tempfile
+from concurrent.futures import Future
+from datetime import datetime, timedelta, timezone as dt_timezone
+from io import StringIO
+from unittest import mock
+
+from django.contrib.auth.hashers import check_password
 from django.contrib.auth.models import User
-from django.test import TestCase
+from django.core.exceptions import ImproperlyConfigured
+from django.core.signals import request_finished
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.management.sql import emit_post_migrate_signal
+from django.db import connection, connections, transaction
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
 from rest_framework import status
 from rest_framework.authtoken.models import Token
 from rest_framework.exceptions import PermissionDenied
+from rest_framework.pagination import PageNumberPagination
 from rest_framework.request import Request
 from rest_framework.reverse import reverse
 from rest_framework.test import APIClient
 from rest_framework.test import APIRequestFactory
 
-from .views import UserList
-from .models import Snippet, AuditLog
-from .serializers import AuditLogSerializer, SnippetSerializer, UserSerializer
+from tutorial.backends.sqlite3.base import DatabaseWrapper
+
+from . import archive, audit, authentication, blobs, catalog, highlight, incremental, instrumentation, softdelete, triggers
+from .filters import AuditLogFilter
+from .views import AuditLogList, SnippetBulk, UserList, users_with_snippets
+from .highlight import DOCUMENT, FRAGMENT
+from .models import RENDER_FAILED, RENDER_PENDING, RENDER_READY, Blob, Snippet, AuditLog, _store_render, store_highlights
+from .serializers import (
+    AuditLogSerializer,
+    SnippetSerializer,
+    SnippetValuesSerializer,
+    UserSerializer,
+    UserValuesSerializer,
+)
 
 
 class TestSnippetList(TestCase):
@@ -246,4 +282,1612 @@ class TestAuditLog(TestCase):
     def test_get_audit_log_list_non_staff(self):
         self.client.force_authenticate(user=self.regular_user)
         self.client.get(reverse('audit-log'))
-        self.assertRaises(PermissionDenied)
\ No newline at end of file
+        self.assertRaises(PermissionDenied)
+
+
+class TestHighlightCache(TestCase):
+    def setUp(self):
+        highlight.get_render_cache().clear()
+        self.user = User.objects.create_user(username='testuser', password='testpassword')
+
+    def test_save_without_render_changes_skips_highlighting(self):
+        snippet = Snippet.objects.create(code='print(1)', owner=self.user)
+        with mock.patch('snippets.highlight.render', wraps=highlight.render) as render:
+            snippet.save()
+            snippet.refresh_from_db()
+            snippet.save()
+        render.assert_not_called()
+
+    def test_render_inputs_change_rerenders(self):
+        snippet = Snippet.objects.create(code='print(1)', owner=self.user)
+        old_highlighted, old_key = snippet.highlighted, snippet.render_key
+        snippet.language = 'text'
+        snippet.save()
+        snippet.refresh_from_db()
+        self.assertNotEqual(snippet.render_key, old_key)
+        self.assertNotEqual(snippet.highlighted, old_highlighted)
+
+    def test_update_fields_includes_highlight_fields(self):
+        snippet = Snippet.objects.create(code='print(1)', owner=self.user)
+        snippet.code = 'print(2)'
+        snippet.save(update_fields=['code'])
+        snippet.refresh_from_db()
+        self.assertIn('2', snippet.highlighted)
+        self.assertEqual(snippet.render_key, highlight.render_key(*snippet.render_inputs()))
+
+    def test_identical_snippets_share_a_render(self):
+        with mock.patch('snippets.highlight.render', wraps=highlight.render) as render:
+            first = Snippet.objects.create(code='x = 1', owner=self.user)
+            second = Snippet.objects.create(code='x = 1', owner=self.user)
+        self.assertEqual(render.call_count, 1)
+        self.assertEqual(first.highlighted, second.highlighted)
+
+    @override_settings(SNIPPETS={'HIGHLIGHT_CACHE_SIZE': 0, 'HIGHLIGHT_CACHE_ALIAS': 'default'})
+    def test_shared_cache_tier(self):
+        Snippet.objects.create(code='y = 2', owner=self.user)
+        with mock.patch('snippets.highlight.render', wraps=highlight.render) as render:
+            Snippet.objects.create(code='y = 2', owner=self.user)
+        render.assert_not_called()
+
+    def test_lru_is_bounded(self):
+        cache = highlight.RenderCache(maxsize=2)
+        cache.set('a', '1')
+        cache.set('b', '2')
+        cache.get('a')
+        cache.set('c', '3')
+        self.assertEqual(len(cache), 2)
+        self.assertEqual(cache.get('a'), '1')
+        self.assertIsNone(cache.get('b'))
+
+
+class TestHighlightModes(TestCase):
+    def setUp(self):
+        highlight.get_render_cache().clear()
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='testuser', password='testpassword')
+        self.client.force_authenticate(user=self.user)
+
+    def create_snippet(self, code):
+        response = self.client.post(reverse('snippet-list'), {'code': code})
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        return Snippet.objects.get(pk=response.data['id'])
+
+    def test_sync_mode_renders_before_responding(self):
+        snippet = self.create_snippet('a = 1')
+        self.assertEqual(snippet.render_state, RENDER_READY)
+        response = self.client.get(reverse('snippet-highlight', kwargs={'pk': snippet.pk}))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn(b'highlight', b''.join(response.streaming_content))
+
+    @override_settings(SNIPPETS={'HIGHLIGHT_MODE': 'async', 'HIGHLIGHT_EXECUTOR': 'local', 'AUDIT_SINK': 'sync'})
+    def test_async_mode_renders_after_commit(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            snippet = self.create_snippet('b = 2')
+        self.assertEqual(snippet.render_state, RENDER_PENDING)
+        url = reverse('snippet-highlight', kwargs={'pk': snippet.pk})
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+
+        for callback in callbacks:
+            callback()
+        snippet.refresh_from_db()
+        self.assertEqual(snippet.render_state, RENDER_READY)
+        self.assertEqual(snippet.highlighted, highlight.render(*snippet.render_inputs()))
+        self.assertEqual(self.client.get(url).status_code, status.HTTP_200_OK)
+
+    @override_settings(SNIPPETS={'HIGHLIGHT_MODE': 'async', 'HIGHLIGHT_EXECUTOR': 'local', 'AUDIT_SINK': 'sync'})
+    def test_async_mode_uses_cached_render(self):
+        Snippet.objects.create(code='c = 3', owner=self.user).refresh_highlight(sync=True)
+        with self.captureOnCommitCallbacks() as callbacks:
+            snippet = self.create_snippet('c = 3')
+        self.assertEqual(snippet.render_state, RENDER_READY)
+        self.assertEqual(callbacks, [])
+
+    @override_settings(SNIPPETS={'HIGHLIGHT_MODE': 'async', 'HIGHLIGHT_EXECUTOR': 'local', 'AUDIT_SINK': 'sync'})
+    def test_async_mode_discards_stale_render(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            snippet = self.create_snippet('d = 4')
+        Snippet.objects.filter(pk=snippet.pk).update(render_key='edited')
+        for callback in callbacks:
+            callback()
+        snippet.refresh_from_db()
+        self.assertEqual(snippet.render_state, RENDER_PENDING)
+        self.assertEqual(snippet.highlighted, '')
+
+    @override_settings(SNIPPETS={'HIGHLIGHT_MODE': 'async', 'HIGHLIGHT_EXECUTOR': 'local', 'AUDIT_SINK': 'sync'})
+    def test_failed_render_is_recorded_and_drained(self):
+        with mock.patch('snippets.models.render', side_effect=RuntimeError), \
+                self.assertLogs('snippets.models', level='ERROR'):
+            with self.captureOnCommitCallbacks(execute=True):
+                snippet = self.create_snippet('e = 5')
+        snippet.refresh_from_db()
+        self.assertEqual(snippet.render_state, RENDER_FAILED)
+
+        call_command('render_snippets', stdout=StringIO())
+        snippet.refresh_from_db()
+        self.assertEqual(snippet.render_state, RENDER_READY)
+        self.assertTrue(snippet.highlighted)
+
+    @override_settings(SNIPPETS={'HIGHLIGHT_MODE': 'async', 'HIGHLIGHT_EXECUTOR': 'local', 'AUDIT_SINK': 'sync'})
+    def test_drain_command_renders_pending_snippets(self):
+        snippets = [self.create_snippet(f'f = {i}') for i in range(3)]
+        out = StringIO()
+        call_command('render_snippets', batch_size=2, stdout=out)
+        self.assertIn('Rendered 3 snippets.', out.getvalue())
+        for snippet in snippets:
+            modified = snippet.modified
+            snippet.refresh_from_db()
+            self.assertEqual(snippet.render_state, RENDER_READY)
+            self.assertGreater(snippet.modified, modified)
+
+    @override_settings(SNIPPETS={'HIGHLIGHT_MODE': 'async', 'HIGHLIGHT_EXECUTOR': 'local', 'AUDIT_SINK': 'sync'})
+    def test_drain_command_discards_renders_of_edited_snippets(self):
+        snippets = [self.create_snippet(f'g = {i}') for i in range(2)]
+        refresh_highlight = Snippet.refresh_highlight
+        edits = [snippets[0].pk]
+
+        def render_then_edit(snippet, **kwargs):
+            rendered = refresh_highlight(snippet, **kwargs)
+            if snippet.pk in edits:
+                # Edited by a request while the command renders.
+                edits.remove(snippet.pk)
+                edited = Snippet.objects.get(pk=snippet.pk)
+                edited.code = 'edited = 1'
+                edited.save()
+            return rendered
+
+        out = StringIO()
+        with mock.patch.object(Snippet, 'refresh_highlight', render_then_edit):
+            call_command('render_snippets', stdout=out)
+        self.assertIn('Rendered 1 snippets.', out.getvalue())
+        snippets[0].refresh_from_db()
+        self.assertEqual(snippets[0].render_state, RENDER_PENDING)
+        self.assertEqual(snippets[0].render_key, highlight.render_key(*snippets[0].render_inputs()))
+        snippets[1].refresh_from_db()
+        self.assertEqual(snippets[1].render_state, RENDER_READY)
+
+
+class TestCatalog(TestCase):
+    def tearDown(self):
+        catalog.languages.cache_clear()
+        catalog.styles.cache_clear()
+
+    def test_model_choices_come_from_catalog(self):
+        language = Snippet._meta.get_field('language')
+        self.assertEqual(list(language.choices), catalog.build_language_choices())
+        self.assertIn(('python', 'Python'), language.choices)
+        self.assertIn('friendly', catalog.styles())
+
+    def test_precomputed_catalog_is_used_for_current_pygments(self):
+        data = mock.Mock(
+            PYGMENTS_VERSION=catalog.pygments.__version__,
+            LANGUAGE_CHOICES=[['python', 'Python']],
+            STYLE_CHOICES=[['friendly', 'friendly']],
+        )
+        catalog.languages.cache_clear()
+        with mock.patch.object(catalog, 'catalog_data', data):
+            self.assertEqual(catalog.language_choices(), [('python', 'Python')])
+        data.PYGMENTS_VERSION = '0.0'
+        catalog.languages.cache_clear()
+        with mock.patch.object(catalog, 'catalog_data', data):
+            self.assertGreater(len(catalog.languages()), 1)
+
+    def test_serializer_validates_against_catalog(self):
+        user = User.objects.create_user(username='testuser', password='testpassword')
+        serializer = SnippetSerializer(data={'code': 'x', 'language': 'not-a-language'})
+        self.assertFalse(serializer.is_valid())
+        self.assertIn('language', serializer.errors)
+        serializer = SnippetSerializer(data={'code': 'x', 'language': 'rust', 'style': 'monokai'})
+        self.assertTrue(serializer.is_valid(), serializer.errors)
+        snippet = serializer.save(owner=user)
+        self.assertEqual((snippet.language, snippet.style), ('rust', 'monokai'))
+
+
+class TestHighlightStorage(TestCase):
+    def setUp(self):
+        highlight.get_render_cache().clear()
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='testuser', password='testpassword')
+        self.snippet = Snippet.objects.create(
+            title='Storage', code='def f():\n    return 1\n', linenos=True, owner=self.user
+        )
+
+    def test_fragment_is_stored_and_streamed_as_document(self):
+        self.assertEqual(self.snippet.highlighted_format, FRAGMENT)
+        self.assertNotIn('<style', self.snippet.highlighted)
+
+        response = self.client.get(reverse('snippet-highlight', kwargs={'pk': self.snippet.pk}))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.streaming)
+        document = b''.join(response.streaming_content).decode()
+        self.assertIn('<title>Storage</title>', document)
+        self.assertIn('href="http://testserver/styles/friendly.css"', document)
+        self.assertIn(self.snippet.highlighted, document)
+
+    def test_style_sheet_is_cacheable(self):
+        response = self.client.get('/styles/friendly.css')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response['Content-Type'], 'text/css; charset=utf-8')
+        self.assertIn('body .k', response.content.decode())
+        self.assertIn('max-age', response['Cache-Control'])
+
+        etag = response['ETag']
+        response = self.client.get('/styles/friendly.css', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(response['ETag'], etag)
+
+        self.assertEqual(self.client.get('/styles/no-such-style.css').status_code, status.HTTP_404_NOT_FOUND)
+
+    @override_settings(SNIPPETS={'HIGHLIGHT_STORAGE': 'document'})
+    def test_document_storage_mode(self):
+        snippet = Snippet.objects.create(code='x = 1', owner=self.user)
+        self.assertEqual(snippet.highlighted_format, DOCUMENT)
+        self.assertIn('<style', snippet.highlighted)
+        response = self.client.get(reverse('snippet-highlight', kwargs={'pk': snippet.pk}))
+        self.assertEqual(response.content.decode(), snippet.highlighted)
+
+    def test_compaction_round_trip(self):
+        document = self.snippet.highlighted_document()
+        self.snippet.highlighted = document
+        store_highlights([self.snippet])
+        Snippet.objects.filter(pk=self.snippet.pk).update(
+            highlighted_blob=self.snippet.highlighted_blob, highlighted_format=DOCUMENT
+        )
+        out = StringIO()
+        call_command('compact_highlights', stdout=out)
+        self.assertIn('Compacted 1 snippets', out.getvalue())
+        self.snippet.refresh_from_db()
+        self.assertEqual(self.snippet.highlighted_format, FRAGMENT)
+        self.assertEqual(self.snippet.highlighted_document(), document)
+        self.assertLess(len(self.snippet.highlighted), len(document))
+
+
+def selected_columns(queries, table):
+    """
+    Return the columns of `table` read by the last SELECT from it, the one
+    loading the object after the conditional request validators.
+    """
+    for query in reversed(queries):
+        sql = query['sql']
+        if sql.startswith('SELECT') and f' "{table}"' in sql:
+            columns = set(re.findall(rf'"{table}"\."(\w+)"', sql[:sql.index(' FROM ')]))
+            if columns:
+                return columns
+    raise AssertionError(f'No SELECT from {table}')
+
+
+class TestSnippetColumns(TestCase):
+    serializer_columns = {'id', 'title', 'code', 'linenos', 'language', 'style', 'owner_id'}
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='testuser', password='testpassword')
+        self.snippet = Snippet.objects.create(code='print(1)', owner=self.user)
+
+    def test_list_reads_serializer_columns_only(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('snippet-list'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        # Rows are read with values(), which joins the owner for its name only.
+        self.assertEqual(
+            selected_columns(queries, 'snippets_snippet'), self.serializer_columns - {'owner_id'} | {'created'}
+        )
+        self.assertEqual(selected_columns(queries, 'auth_user'), {'username'})
+
+    def test_detail_reads_serializer_and_render_columns(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('snippet-detail', kwargs={'pk': self.snippet.pk}))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            selected_columns(queries, 'snippets_snippet'),
+            self.serializer_columns | {'modified', 'render_key', 'render_state'},
+        )
+
+    def test_highlight_reads_highlight_columns_only(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('snippet-highlight', kwargs={'pk': self.snippet.pk}))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            selected_columns(queries, 'snippets_snippet'),
+            {'id', 'highlighted_blob_id', 'highlighted_format', 'render_state', 'style', 'title'},
+        )
+        self.assertEqual(selected_columns(queries, 'snippets_blob'), {'hash', 'data', 'compressed'})
+
+    def test_update_with_deferred_columns_rerenders(self):
+        self.client.force_authenticate(user=self.user)
+        url = reverse('snippet-detail', kwargs={'pk': self.snippet.pk})
+        response = self.client.put(url, {'code': 'print(22)'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.snippet.refresh_from_db()
+        self.assertIn('22', self.snippet.highlighted)
+        self.assertEqual(self.snippet.render_key, highlight.render_key(*self.snippet.render_inputs()))
+
+
+class TestUserSnippetLinks(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.staff_user = User.objects.create_user(username='staffuser', password='staffpassword', is_staff=True)
+        self.client.force_authenticate(user=self.staff_user)
+
+    def create_users(self, count, snippets_each=3):
+        for i in range(count):
+            user = User.objects.create_user(username=f'user{User.objects.count()}')
+            for j in range(snippets_each):
+                Snippet.objects.create(code=f'x = {j}', owner=user)
+
+    def test_user_list_query_count_is_constant(self):
+        self.create_users(2)
+        with CaptureQueriesContext(connection) as few:
+            self.client.get(reverse('user-list'))
+        self.create_users(6)
+        with CaptureQueriesContext(connection) as many:
+            response = self.client.get(reverse('user-list'))
+        self.assertEqual(response.data['count'], 9)
+        self.assertEqual(len(many), len(few))
+        with self.assertNumQueries(len(few)):
+            self.client.get(reverse('user-list'))
+
+    def test_user_detail_links_and_count(self):
+        self.create_users(1, snippets_each=4)
+        user = User.objects.get(username='user1')
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse('user-detail', kwargs={'pk': user.pk}))
+        self.assertEqual(response.data['snippets_count'], 4)
+        self.assertEqual(len(response.data['snippets']), 4)
+        self.assertEqual(response.data['snippets_url'], f'http://testserver/snippets/?owner={user.pk}')
+
+    @override_settings(SNIPPETS={'USER_SNIPPET_LINKS_LIMIT': 2})
+    def test_embedded_links_are_capped(self):
+        self.create_users(1, snippets_each=5)
+        user = User.objects.get(username='user1')
+        response = self.client.get(reverse('user-detail', kwargs={'pk': user.pk}))
+        self.assertEqual(response.data['snippets_count'], 5)
+        first_two = Snippet.objects.filter(owner=user).order_by('created')[:2]
+        self.assertEqual(
+            response.data['snippets'],
+            [f'http://testserver/snippets/{snippet.pk}/' for snippet in first_two],
+        )
+
+    def test_snippet_list_owner_filter(self):
+        self.create_users(2, snippets_each=2)
+        user = User.objects.get(username='user1')
+        response = self.client.get(reverse('snippet-list'), {'owner': user.pk})
+        self.assertEqual(response.data['count'], 2)
+        self.assertTrue(all(item['owner'] == 'user1' for item in response.data['results']))
+        response = self.client.get(reverse('snippet-list'), {'owner': 'user1'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class TestCursorPagination(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.staff_user = User.objects.create_user(username='staffuser', password='staffpassword', is_staff=True)
+        self.client.force_authenticate(user=self.staff_user)
+        for i in range(25):
+            Snippet.objects.create(code=f'x = {i}', owner=self.staff_user)
+            AuditLog.objects.create(user=self.staff_user, action='create', model_id=i, model_name='Snippet')
+
+    def walk(self, url, params=None, key='id'):
+        ids = []
+        response = self.client.get(url, params)
+        while True:
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertNotIn('count', response.data)
+            ids.extend(item[key] for item in response.data['results'])
+            if response.data['next'] is None:
+                return ids
+            response = self.client.get(response.data['next'])
+
+    def test_snippet_list_cursor_pages(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(reverse('snippet-list'), {'pagination': 'cursor'})
+        self.assertEqual(len(queries), 1)
+        ids = self.walk(reverse('snippet-list'), {'pagination': 'cursor'})
+        self.assertEqual(ids, list(Snippet.objects.order_by('created', 'id').values_list('id', flat=True)))
+
+    def test_snippet_list_cursor_with_owner_filter(self):
+        other = User.objects.create_user(username='other')
+        Snippet.objects.create(code='y', owner=other)
+        ids = self.walk(reverse('snippet-list'), {'pagination': 'cursor', 'owner': other.pk})
+        self.assertEqual(ids, [Snippet.objects.get(owner=other).pk])
+
+    def test_audit_log_cursor_pages(self):
+        model_ids = self.walk(reverse('audit-log'), {'pagination': 'cursor'}, key='model_id')
+        self.assertEqual(model_ids, list(range(24, -1, -1)))
+
+    def test_user_list_cursor_pages(self):
+        for i in range(12):
+            User.objects.create_user(username=f'user{i}')
+        ids = self.walk(reverse('user-list'), {'pagination': 'cursor'})
+        self.assertEqual(ids, list(User.objects.filter(is_active=True).order_by('id').values_list('id', flat=True)))
+
+    def test_page_number_pagination_is_the_default(self):
+        response = self.client.get(reverse('audit-log'), {'page': 2})
+        self.assertEqual(response.data['count'], 25)
+        self.assertEqual(len(response.data['results']), 10)
+        self.assertIn('page=3', response.data['next'])
+
+
+class TestAuditSinks(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='testuser', password='testpassword')
+        self.client.force_authenticate(user=self.user)
+
+    @override_settings(SNIPPETS={'AUDIT_SINK': 'sync'})
+    def test_sync_sink_writes_in_request(self):
+        response = self.client.post(reverse('snippet-list'), {'code': 'foo'})
+        entry = AuditLog.objects.get()
+        self.assertEqual((entry.action, entry.model_name, entry.model_id), ('create', 'Snippet', response.data['id']))
+
+    @override_settings(SNIPPETS={'AUDIT_SINK': 'buffered', 'AUDIT_BUFFER_SIZE': 3, 'AUDIT_FLUSH_INTERVAL': 60})
+    def test_buffered_sink_flushes_in_bulk(self):
+        sink = audit.get_audit_sink()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('snippet-list'), {'code': 'foo'})
+            self.client.post(reverse('snippet-list'), {'code': 'bar'})
+        self.assertEqual(AuditLog.objects.count(), 0)
+        self.assertEqual(len(sink), 2)
+        with self.assertNumQueries(1), self.captureOnCommitCallbacks(execute=True):
+            sink.record(user=self.user, action='create', model_name='Snippet', model_id=3)
+        self.assertEqual(len(sink), 0)
+        self.assertEqual(list(AuditLog.objects.order_by('id').values_list('model_name', flat=True)), ['Snippet'] * 3)
+
+    @override_settings(SNIPPETS={'AUDIT_SINK': 'buffered', 'AUDIT_FLUSH_INTERVAL': 60})
+    def test_buffered_sink_skips_rolled_back_entries(self):
+        sink = audit.get_audit_sink()
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            try:
+                with transaction.atomic():
+                    sink.record(user=self.user, action='create', model_name='Snippet', model_id=1)
+                    raise ValueError
+            except ValueError:
+                pass
+            sink.record(user=self.user, action='create', model_name='Snippet', model_id=2)
+        self.assertEqual(len(callbacks), 1)
+        self.assertEqual(sink.flush(), 1)
+        self.assertEqual(AuditLog.objects.get().model_id, 2)
+
+    @override_settings(SNIPPETS={'AUDIT_SINK': 'buffered', 'AUDIT_FLUSH_INTERVAL': 60})
+    def test_buffered_sink_flushes_when_request_finishes(self):
+        sink = audit.get_audit_sink()
+        recorded = timezone.now() - timedelta(minutes=5)
+        with mock.patch('django.utils.timezone.now', return_value=recorded):
+            with self.captureOnCommitCallbacks(execute=True):
+                sink.record(user=self.user, action='create', model_name='Snippet', model_id=1)
+        self.assertEqual(AuditLog.objects.count(), 0)
+        request_finished.send(sender=self.__class__)
+        self.assertEqual(len(sink), 0)
+        self.assertEqual(AuditLog.objects.get().timestamp, recorded)
+
+    @override_settings(SNIPPETS={'AUDIT_SINK': 'buffered', 'AUDIT_FLUSH_INTERVAL': 60})
+    def test_settings_change_flushes_buffer(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            audit.get_audit_sink().record(user=self.user, action='create', model_name='Snippet', model_id=1)
+        with override_settings(SNIPPETS={'AUDIT_SINK': 'sync'}):
+            self.assertEqual(AuditLog.objects.count(), 1)
+
+
+class TestAuditArchive(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='testpassword')
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        now = timezone.now()
+        for days in (200, 120, 100, 100, 10):
+            entry = AuditLog.objects.create(user=self.user, action='create', model_name='Snippet', model_id=days)
+            AuditLog.objects.filter(pk=entry.pk).update(timestamp=now - timedelta(days=days))
+
+    def archive(self, **options):
+        call_command('archive_audit_log', directory=self.directory, stdout=StringIO(), **options)
+
+    def test_old_entries_are_moved_to_day_segments(self):
+        self.archive(batch_size=2)
+        self.assertEqual(list(AuditLog.objects.values_list('model_id', flat=True)), [10])
+        self.assertEqual(len(os.listdir(self.directory)), 3)
+        records = list(archive.read_archive(self.directory))
+        self.assertEqual([record['model_id'] for record in records], [200, 120, 100, 100])
+        self.assertEqual(records[0]['username'], 'testuser')
+
+    def test_timestamps_round_trip_exactly(self):
+        timestamps = list(AuditLog.objects.filter(model_id__gt=10).order_by('id').values_list('timestamp', flat=True))
+        self.archive()
+        records = list(archive.read_archive(self.directory))
+        self.assertEqual([record['timestamp'] for record in records], timestamps)
+        self.assertTrue(any(timestamp.microsecond % 1000 for timestamp in timestamps))
+        # Segments written by DjangoJSONEncoder, with "Z" for UTC.
+        with gzip.open(archive.segment_path(self.directory, timestamps[0].date()), 'wt') as segment:
+            segment.write('{"id": 1, "timestamp": "2020-01-02T03:04:05.678Z", "model_id": 1}\n')
+        record = next(archive.read_archive(self.directory))
+        self.assertEqual(record['timestamp'], datetime(2020, 1, 2, 3, 4, 5, 678000, tzinfo=dt_timezone.utc))
+
+    def test_read_archive_by_time_range(self):
+        self.archive()
+        now = timezone.now()
+        records = archive.read_archive(self.directory, start=now - timedelta(days=150), end=now - timedelta(days=110))
+        self.assertEqual([record['model_id'] for record in records], [120])
+
+    def test_rerun_appends_and_skips_repeats(self):
+        self.archive(days=150)
+        # An interrupted run archives entries without deleting them.
+        with mock.patch('django.db.models.query.QuerySet.delete', side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError):
+                self.archive(days=110)
+        self.archive(days=110)
+        self.assertEqual([record['model_id'] for record in archive.read_archive(self.directory)], [200, 120])
+        self.assertEqual(AuditLog.objects.count(), 3)
+
+    def test_read_command_prints_json_lines(self):
+        self.archive()
+        out = StringIO()
+        call_command('read_audit_archive', '--since=2000-01-01', directory=self.directory, stdout=out)
+        self.assertEqual(len(out.getvalue().splitlines()), 4)
+
+
+class TestAuditLogFilters(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.staff_user = User.objects.create_user(username='staffuser', password='staffpassword', is_staff=True)
+        self.other_user = User.objects.create_user(username='otheruser', password='otherpassword')
+        self.client.force_authenticate(user=self.staff_user)
+        AuditLog.objects.create(user=self.staff_user, action='create', model_name='Snippet', model_id=1)
+        AuditLog.objects.create(user=self.other_user, action='update', model_name='Snippet', model_id=1)
+        AuditLog.objects.create(user=self.other_user, action='delete', model_name='User', model_id=7)
+
+    def model_ids(self, params):
+        response = self.client.get(reverse('audit-log'), params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return [(item['action'], item['model_id']) for item in response.data['results']]
+
+    def test_filters(self):
+        self.assertEqual(self.model_ids({'user': self.other_user.pk}), [('delete', 7), ('update', 1)])
+        self.assertEqual(self.model_ids({'model_name': 'Snippet', 'model_id': 1}), [('update', 1), ('create', 1)])
+        self.assertEqual(self.model_ids({'action': 'create'}), [('create', 1)])
+        tomorrow = (timezone.now() + timedelta(days=1)).date().isoformat()
+        self.assertEqual(len(self.model_ids({'since': '2000-01-01', 'until': tomorrow})), 3)
+        self.assertEqual(self.model_ids({'since': tomorrow}), [])
+
+    def test_invalid_filters_are_rejected(self):
+        response = self.client.get(reverse('audit-log'), {'user': 'me', 'since': 'yesterday'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(set(response.data), {'user', 'since'})
+
+    def test_filters_use_indexes(self):
+        view = AuditLogList()
+        for params in (
+            {'user': '1'},
+            {'model_name': 'Snippet'},
+            {'model_name': 'Snippet', 'model_id': '1'},
+            {'model_id': '1'},
+            {'action': 'create'},
+            {'since': '2024-01-01', 'until': '2024-02-01'},
+        ):
+            request = Request(APIRequestFactory().get('/audit_log/', params))
+            queryset = AuditLogFilter().filter_queryset(request, AuditLog.objects.all(), view)
+            plan = queryset.explain()
+            self.assertNotIn('SCAN snippets_auditlog', plan, f'{params} scans the table:\n{plan}')
+            self.assertIn('USING INDEX', plan)
+
+
+class TestAuditLogExport(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.staff_user = User.objects.create_user(username='staffuser', password='staffpassword', is_staff=True)
+        self.client.force_authenticate(user=self.staff_user)
+        for i in range(5):
+            AuditLog.objects.create(user=self.staff_user, action='create', model_name='Snippet', model_id=i)
+        AuditLog.objects.create(user=None, action='delete', model_name='User', model_id=9)
+
+    def export(self, params=None):
+        response = self.client.get(reverse('audit-log-export'), params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.streaming)
+        return response, b''.join(response.streaming_content).decode()
+
+    def test_csv_export(self):
+        response, content = self.export()
+        self.assertEqual(response['Content-Type'], 'text/csv; charset=utf-8')
+        rows = list(csv.DictReader(StringIO(content)))
+        self.assertEqual([row['model_id'] for row in rows], ['0', '1', '2', '3', '4', '9'])
+        self.assertEqual(rows[0]['user'], 'staffuser')
+        self.assertEqual(rows[-1]['user'], '')
+
+    def test_ndjson_export_is_filtered_and_chunked(self):
+        with mock.patch('snippets.views.EXPORT_CHUNK_SIZE', 2):
+            response, content = self.export({'format': 'ndjson', 'action': 'create'})
+            chunks = list(self.client.get(reverse('audit-log-export'), {'format': 'ndjson'}).streaming_content)
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson; charset=utf-8')
+        rows = [json.loads(line) for line in content.splitlines()]
+        self.assertEqual([row['model_id'] for row in rows], [0, 1, 2, 3, 4])
+        self.assertEqual(len(chunks), 3)
+
+    def test_empty_csv_export_has_header(self):
+        _, content = self.export({'action': 'none'})
+        self.assertEqual(content.splitlines(), ['id,user,action,model_name,model_id,timestamp'])
+
+    def test_export_is_staff_only(self):
+        self.client.force_authenticate(user=User.objects.create_user(username='regularuser'))
+        response = self.client.get(reverse('audit-log-export'))
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+
+@override_settings(SNIPPETS={'AUDIT_SINK': 'sync'})
+class TestSnippetBulk(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='testuser', password='testpassword')
+        self.other_user = User.objects.create_user(username='otheruser', password='otherpassword')
+        self.client.force_authenticate(user=self.user)
+        self.url = reverse('snippet-bulk')
+
+    def test_bulk_create(self):
+        items = [{'code': f'x = {i}', 'title': f'snippet {i}'} for i in range(20)]
+        # Savepoint, blob insert, snippet insert, audit log insert, release.
+        with self.assertNumQueries(5):
+            response = self.client.post(self.url, items, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(len(response.data), 20)
+        snippet = Snippet.objects.get(title='snippet 3')
+        self.assertEqual(snippet.owner, self.user)
+        self.assertEqual(snippet.highlighted, highlight.render(*snippet.render_inputs()))
+        self.assertEqual(AuditLog.objects.filter(action='create').count(), 20)
+
+    def test_bulk_create_reports_item_errors(self):
+        items = [{'code': 'ok'}, {'code': 'x', 'language': 'nope'}, {}]
+        response = self.client.post(self.url, items, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data[0], {})
+        self.assertIn('language', response.data[1])
+        self.assertIn('code', response.data[2])
+        self.assertEqual(Snippet.objects.count(), 0)
+
+    @override_settings(SNIPPETS={'AUDIT_SINK': 'sync', 'BULK_MAX_ITEMS': 2})
+    def test_bulk_limit(self):
+        response = self.client.post(self.url, [{'code': 'a'}] * 3, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_bulk_update(self):
+        mine = [Snippet.objects.create(code=f'a = {i}', owner=self.user) for i in range(3)]
+        response = self.client.patch(self.url, [
+            {'id': mine[0].pk, 'code': 'b = 1'},
+            {'id': mine[1].pk, 'title': 'renamed'},
+        ], format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        mine[0].refresh_from_db()
+        mine[1].refresh_from_db()
+        self.assertEqual(mine[0].highlighted, highlight.render(*mine[0].render_inputs()))
+        self.assertEqual(mine[1].title, 'renamed')
+        self.assertEqual(AuditLog.objects.filter(action='update').count(), 2)
+
+    def test_bulk_update_rejects_foreign_snippets(self):
+        mine = Snippet.objects.create(code='a', owner=self.user)
+        theirs = Snippet.objects.create(code='b', owner=self.other_user)
+        response = self.client.patch(self.url, [
+            {'id': mine.pk, 'code': 'c'},
+            {'id': theirs.pk, 'code': 'c'},
+        ], format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data[0], {})
+        self.assertIn('id', response.data[1])
+        mine.refresh_from_db()
+        self.assertEqual(mine.code, 'a')
+
+    def test_bulk_delete(self):
+        mine = [Snippet.objects.create(code=f'a = {i}', owner=self.user) for i in range(3)]
+        theirs = Snippet.objects.create(code='b', owner=self.other_user)
+        response = self.client.delete(self.url, [mine[0].pk, theirs.pk], format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(Snippet.objects.count(), 4)
+        response = self.client.delete(self.url, [mine[0].pk, mine[1].pk], format='json')
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertEqual(list(Snippet.objects.filter(owner=self.user)), [mine[2]])
+        self.assertEqual(AuditLog.objects.filter(action='delete').count(), 2)
+
+    def test_bulk_rejects_repeated_ids(self):
+        mine = Snippet.objects.create(code='a', owner=self.user)
+        response = self.client.patch(self.url, [{'id': mine.pk, 'code': 'b'}, {'id': mine.pk, 'code': 'c'}], format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data, [{}, {'id': ['This id is repeated.']}])
+        response = self.client.delete(self.url, [mine.pk, mine.pk], format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data, [{}, {'id': ['This id is repeated.']}])
+        self.assertTrue(Snippet.objects.filter(pk=mine.pk).exists())
+        self.assertFalse(AuditLog.objects.exists())
+
+    def test_bulk_rejects_boolean_ids(self):
+        mine = Snippet.objects.create(code='a', owner=self.user)
+        Snippet.objects.filter(pk=mine.pk).update(id=1)
+        response = self.client.delete(self.url, [True], format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data, [{'id': ['No snippet of yours has this id.']}])
+        response = self.client.patch(self.url, [{'id': True, 'title': 'x'}], format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertTrue(Snippet.objects.filter(pk=1, title='').exists())
+        self.assertFalse(AuditLog.objects.exists())
+
+    def test_bulk_audits_only_written_snippets(self):
+        mine = [Snippet.objects.create(code=f'a = {i}', owner=self.user) for i in range(2)]
+        check_ids = SnippetBulk.check_ids
+
+        def check_then_delete(view, ids):
+            checked = check_ids(view, ids)
+            # Deleted by another request once the ids were checked.
+            Snippet.objects.filter(pk=mine[1].pk).delete()
+            return checked
+
+        with mock.patch.object(SnippetBulk, 'check_ids', check_then_delete):
+            response = self.client.patch(self.url, [{'id': snippet.pk, 'title': 'x'} for snippet in mine], format='json')
+        self.assertEqual([item['id'] for item in response.data], [mine[0].pk])
+        self.assertEqual(list(AuditLog.objects.values_list('model_id', flat=True)), [mine[0].pk])
+        mine[1] = Snippet.objects.create(code='b', owner=self.user)
+        with mock.patch.object(SnippetBulk, 'check_ids', check_then_delete):
+            response = self.client.delete(self.url, [snippet.pk for snippet in mine], format='json')
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertEqual(list(AuditLog.objects.filter(action='delete').values_list('model_id', flat=True)), [mine[0].pk])
+
+    def test_bulk_update_keeps_concurrent_edits(self):
+        mine = [Snippet.objects.create(code=f'a = {i}', owner=self.user) for i in range(2)]
+        check_ids = SnippetBulk.check_ids
+
+        def check_then_edit(view, ids):
+            checked = check_ids(view, ids)
+            # Edited by another request once the ids were checked.
+            Snippet.objects.filter(pk=mine[0].pk).update(code='edited = 1')
+            return checked
+
+        with mock.patch.object(SnippetBulk, 'check_ids', check_then_edit):
+            response = self.client.patch(self.url, [
+                {'id': mine[0].pk, 'title': 'renamed'},
+                {'id': mine[1].pk, 'code': 'b = 1'},
+            ], format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data[0]['code'], 'edited = 1')
+        first, second = (Snippet.objects.get(pk=snippet.pk) for snippet in mine)
+        self.assertEqual((first.title, first.code), ('renamed', 'edited = 1'))
+        self.assertEqual(first.highlighted, highlight.render(*first.render_inputs()))
+        self.assertEqual((second.title, second.code), ('', 'b = 1'))
+
+    @override_settings(SNIPPETS={'AUDIT_SINK': 'sync', 'HIGHLIGHT_MODE': 'async', 'HIGHLIGHT_EXECUTOR': 'local'})
+    def test_bulk_create_schedules_async_renders(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(self.url, [{'code': 'q = 1'}], format='json')
+        snippet = Snippet.objects.get(pk=response.data[0]['id'])
+        self.assertEqual(snippet.render_state, RENDER_READY)
+
+
+@override_settings(SNIPPETS={'AUDIT_SINK': 'sync'})
+class TestConditionalRequests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='testuser', password='testpassword')
+        self.client.force_authenticate(user=self.user)
+        self.snippet = Snippet.objects.create(code='a = 1', owner=self.user)
+        self.detail_url = reverse('snippet-detail', kwargs={'pk': self.snippet.pk})
+        self.highlight_url = reverse('snippet-highlight', kwargs={'pk': self.snippet.pk})
+
+    def test_detail_not_modified(self):
+        response = self.client.get(self.detail_url)
+        etag = response['ETag']
+        self.assertTrue(response.has_header('Last-Modified'))
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.detail_url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(response['ETag'], etag)
+        self.assertEqual(len(queries), 1)
+        self.assertNotIn('"code"', queries[0]['sql'])
+
+    def test_highlight_not_modified_without_loading_html(self):
+        response = self.client.get(self.highlight_url)
+        etag = response['ETag']
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.highlight_url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertNotIn('"snippets_blob"', ' '.join(query['sql'] for query in queries))
+
+    def test_etag_changes_with_edits(self):
+        etag = self.client.get(self.detail_url)['ETag']
+        highlight_etag = self.client.get(self.highlight_url)['ETag']
+        self.client.patch(self.detail_url, {'code': 'a = 2'})
+        self.assertEqual(self.client.get(self.detail_url, HTTP_IF_NONE_MATCH=etag).status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            self.client.get(self.highlight_url, HTTP_IF_NONE_MATCH=highlight_etag).status_code,
+            status.HTTP_200_OK,
+        )
+
+    def test_etag_changes_with_owner_username(self):
+        etag = self.client.get(self.detail_url)['ETag']
+        self.user.username = 'renamed'
+        self.user.save()
+        response = self.client.get(self.detail_url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['owner'], 'renamed')
+
+    def test_save_stamps_modified(self):
+        modified = self.snippet.modified
+        self.snippet.title = 'renamed'
+        self.snippet.save(update_fields=['title'])
+        self.snippet.refresh_from_db()
+        self.assertGreater(self.snippet.modified, modified)
+
+    def test_if_match_guards_writes(self):
+        etag = self.client.get(self.detail_url)['ETag']
+        response = self.client.patch(self.detail_url, {'title': 'first'}, HTTP_IF_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response['ETag'], etag)
+        # A second writer holding the old ETag loses.
+        response = self.client.patch(self.detail_url, {'title': 'second'}, HTTP_IF_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_412_PRECONDITION_FAILED)
+        response = self.client.delete(self.detail_url, HTTP_IF_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_412_PRECONDITION_FAILED)
+        self.snippet.refresh_from_db()
+        self.assertEqual(self.snippet.title, 'first')
+
+
+@override_settings(SNIPPETS={'AUDIT_SINK': 'sync', 'RESPONSE_CACHE_ALIAS': 'default'})
+class TestResponseCache(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.anonymous = APIClient()
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='testuser', password='testpassword', is_staff=True)
+        self.client.force_authenticate(user=self.user)
+        self.snippet = Snippet.objects.create(code='a = 1', title='first', owner=self.user)
+        self.list_url = reverse('snippet-list')
+        self.detail_url = reverse('snippet-detail', kwargs={'pk': self.snippet.pk})
+
+    def get(self, url, params=None):
+        response = self.anonymous.get(url, params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response
+
+    def test_anonymous_reads_are_cached(self):
+        self.assertEqual(self.get(self.list_url)['X-Cache'], 'MISS')
+        with self.assertNumQueries(0):
+            response = self.get(self.list_url)
+        self.assertEqual(response['X-Cache'], 'HIT')
+        self.assertEqual(response.data['results'][0]['title'], 'first')
+        # Other pages and formats are cached separately.
+        self.assertEqual(self.get(self.list_url, {'page': 1})['X-Cache'], 'MISS')
+        self.assertEqual(self.get(self.list_url, {'format': 'api'})['X-Cache'], 'MISS')
+        self.assertEqual(self.get(self.detail_url)['X-Cache'], 'MISS')
+        self.assertEqual(self.get(self.detail_url)['X-Cache'], 'HIT')
+        stats = self.client.get(reverse('response-cache-stats')).data
+        self.assertEqual((stats['hits'], stats['misses']), (2, 4))
+
+    def test_authenticated_reads_are_not_cached(self):
+        response = self.client.get(self.list_url)
+        self.assertFalse(response.has_header('X-Cache'))
+
+    def test_writes_invalidate(self):
+        self.get(self.list_url)
+        self.get(self.detail_url)
+        self.client.patch(self.detail_url, {'title': 'second'})
+        self.assertEqual(self.get(self.list_url).data['results'][0]['title'], 'second')
+        self.assertEqual(self.get(self.detail_url).data['title'], 'second')
+
+        self.client.post(reverse('snippet-bulk'), [{'code': 'b'}], format='json')
+        self.assertEqual(self.get(self.list_url).data['count'], 2)
+        self.client.patch(reverse('snippet-bulk'), [{'id': self.snippet.pk, 'title': 'third'}], format='json')
+        self.assertEqual(self.get(self.detail_url).data['title'], 'third')
+
+        self.client.delete(self.detail_url)
+        self.assertEqual(self.get(self.list_url).data['count'], 1)
+        self.assertEqual(self.anonymous.get(self.detail_url).status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_other_snippets_stay_cached(self):
+        other = Snippet.objects.create(code='b = 2', owner=self.user)
+        other_url = reverse('snippet-detail', kwargs={'pk': other.pk})
+        self.get(other_url)
+        self.snippet.save()
+        self.assertEqual(self.get(other_url)['X-Cache'], 'HIT')
+        self.assertEqual(self.get(self.list_url)['X-Cache'], 'MISS')
+
+    def test_username_change_invalidates(self):
+        self.get(self.list_url)
+        self.get(self.detail_url)
+        self.user.last_login = timezone.now()
+        self.user.save(update_fields=['last_login'])
+        self.assertEqual(self.get(self.detail_url)['X-Cache'], 'HIT')
+        self.user.username = 'renamed'
+        self.user.save()
+        self.assertEqual(self.get(self.list_url).data['results'][0]['owner'], 'renamed')
+        self.assertEqual(self.get(self.detail_url).data['owner'], 'renamed')
+
+
+class TestCachedAuthentication(TestCase):
+    def setUp(self):
+        authentication._reset_auth_caches()
+        self.user = User.objects.create_user(username='testuser', password='testpassword', is_staff=True)
+        self.token = Token.objects.create(user=self.user)
+        self.url = reverse('snippet-list')
+
+    def token_client(self):
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION='Token ' + self.token.key)
+        return client
+
+    def basic_client(self, password='testpassword'):
+        client = APIClient()
+        credentials = base64.b64encode(f'testuser:{password}'.encode()).decode()
+        client.credentials(HTTP_AUTHORIZATION='Basic ' + credentials)
+        return client
+
+    def test_token_lookup_is_cached(self):
+        client = self.token_client()
+        client.get(self.url)
+        with CaptureQueriesContext(connection) as queries:
+            response = client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertFalse(any('authtoken_token' in query['sql'] for query in queries))
+
+    def test_deleted_token_is_rejected(self):
+        client = self.token_client()
+        client.get(self.url)
+        self.token.delete()
+        self.assertEqual(client.post(self.url, {'code': 'a'}).status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_soft_deleted_user_is_rejected(self):
+        client = self.token_client()
+        client.get(self.url)
+        admin = APIClient()
+        admin.force_authenticate(user=User.objects.create_user(username='admin', is_staff=True))
+        admin.delete(reverse('user-detail', kwargs={'pk': self.user.pk}))
+        self.assertEqual(client.post(self.url, {'code': 'a'}).status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_basic_credentials_are_verified_once(self):
+        client = self.basic_client()
+        with mock.patch('django.contrib.auth.base_user.check_password', wraps=check_password) as check:
+            self.assertEqual(client.post(self.url, {'code': 'a'}).status_code, status.HTTP_201_CREATED)
+            self.assertEqual(client.post(self.url, {'code': 'b'}).status_code, status.HTTP_201_CREATED)
+        self.assertEqual(check.call_count, 1)
+
+    def test_wrong_and_changed_passwords_are_rejected(self):
+        self.assertEqual(self.basic_client('nope').get(self.url).status_code, status.HTTP_401_UNAUTHORIZED)
+        client = self.basic_client()
+        client.get(self.url)
+        self.user.set_password('changed')
+        self.user.save()
+        self.assertEqual(client.get(self.url).status_code, status.HTTP_401_UNAUTHORIZED)
+        self.assertEqual(self.basic_client('changed').get(self.url).status_code, status.HTTP_200_OK)
+
+    def test_entries_expire(self):
+        auth_cache = authentication.TTLCache(maxsize=2, ttl=10)
+        with mock.patch('snippets.authentication.time.monotonic', return_value=100):
+            auth_cache.set('a', (self.user, None))
+            auth_cache.set('b', (self.user, None))
+            auth_cache.set('c', (self.user, None))
+            self.assertIsNone(auth_cache.get('a'))
+            self.assertIsNotNone(auth_cache.get('b'))
+        with mock.patch('snippets.authentication.time.monotonic', return_value=111):
+            self.assertIsNone(auth_cache.get('b'))
+
+
+@override_settings(SNIPPETS={'AUDIT_SINK': 'sync'})
+class TestInstrumentation(TestCase):
+    def setUp(self):
+        instrumentation.metrics.clear()
+        highlight.get_render_cache().clear()
+        self.client = APIClient()
+        self.staff_user = User.objects.create_user(username='staffuser', password='staffpassword', is_staff=True)
+        self.client.force_authenticate(user=self.staff_user)
+
+    def phases(self, response):
+        return {entry.split(';')[0] for entry in response['Server-Timing'].split(', ')}
+
+    def test_server_timing_phases(self):
+        response = self.client.post(reverse('snippet-list'), {'code': 'a = 1'})
+        self.assertTrue({'auth', 'permissions', 'db', 'highlight', 'serialize', 'audit', 'total'} <= self.phases(response))
+        self.assertRegex(response['Server-Timing'], r'db;dur=[\d.]+;desc="\d+ queries"')
+
+    def test_server_timing_of_async_views(self):
+        Snippet.objects.create(code='a = 1', owner=self.staff_user)
+        response = self.client.get(reverse('async-snippet-list'))
+        self.assertTrue({'db', 'serialize', 'total'} <= self.phases(response))
+        self.assertRegex(response['Server-Timing'], r'db;dur=[\d.]+;desc="2 queries"')
+
+    def test_metrics_endpoint(self):
+        self.client.get(reverse('snippet-list'))
+        self.client.get(reverse('snippet-list'))
+        response = self.client.get(reverse('metrics'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        snippet_list = response.data['views']['snippet-list']
+        self.assertEqual(snippet_list['phases']['total']['count'], 2)
+        self.assertEqual(sum(snippet_list['phases']['total']['buckets'].values()), 2)
+        self.assertEqual(snippet_list['queries']['count'], 2)
+
+        self.client.force_authenticate(user=User.objects.create_user(username='regularuser'))
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, status.HTTP_403_FORBIDDEN)
+
+    @override_settings(SNIPPETS={'INSTRUMENTATION': False})
+    def test_can_be_switched_off(self):
+        response = self.client.get(reverse('snippet-list'))
+        self.assertFalse(response.has_header('Server-Timing'))
+        self.assertEqual(instrumentation.metrics.snapshot(), {})
+
+    def test_timed_is_a_no_op_outside_requests(self):
+        self.assertIsNone(instrumentation.current_timings())
+        with instrumentation.timed('highlight'):
+            pass
+
+
+class TestAsyncViews(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='testpassword')
+        self.staff = User.objects.create_user(username='staff', password='testpassword', is_staff=True)
+        User.objects.create_user(username='inactive', password='testpassword', is_active=False)
+        self.snippets = [Snippet.objects.create(code=f'a = {i}', owner=self.user) for i in range(3)]
+        self.snippet = self.snippets[0]
+
+    def assertSamePayload(self, sync_url, async_url, client=None, params=None):
+        client = client or APIClient()
+        expected = client.get(sync_url, params, format='json')
+        response = client.get(async_url, params)
+        self.assertEqual(response.status_code, expected.status_code)
+        self.assertEqual(response.json(), json.loads(expected.content))
+        return response
+
+    def test_snippets(self):
+        pk = self.snippet.pk
+        self.assertSamePayload(reverse('snippet-list'), reverse('async-snippet-list'))
+        self.assertSamePayload(
+            reverse('snippet-list'), reverse('async-snippet-list'), params={'owner': self.staff.pk}
+        )
+        self.assertSamePayload(
+            reverse('snippet-detail', kwargs={'pk': pk}), reverse('async-snippet-detail', kwargs={'pk': pk})
+        )
+        self.assertSamePayload(
+            reverse('snippet-detail', kwargs={'pk': 0}), reverse('async-snippet-detail', kwargs={'pk': 0})
+        )
+        response = self.client.get(reverse('async-snippet-list'), {'owner': 'x'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.json(), {'owner': 'Expected a user id.'})
+
+    def test_snippet_list_pages(self):
+        with mock.patch.object(PageNumberPagination, 'page_size', 2):
+            expected = self.client.get(reverse('snippet-list')).json()
+            first = self.client.get(reverse('async-snippet-list'))
+            self.assertEqual(first.json()['results'], expected['results'])
+            self.assertIsNone(first.json()['previous'])
+            second = self.client.get(first.json()['next'])
+            self.assertEqual(second.json()['results'][0]['id'], self.snippets[2].pk)
+            self.assertIsNone(second.json()['next'])
+            self.assertEqual(self.client.get(second.json()['previous']).json(), first.json())
+            response = self.client.get(reverse('async-snippet-list'), {'page': 3})
+            self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_highlight(self):
+        kwargs = {'pk': self.snippet.pk}
+        expected = APIClient().get(reverse('snippet-highlight', kwargs=kwargs))
+        response = self.client.get(reverse('async-snippet-highlight', kwargs=kwargs))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.content, b''.join(expected.streaming_content))
+        Snippet.objects.filter(pk=self.snippet.pk).update(render_state=RENDER_PENDING)
+        response = self.client.get(reverse('async-snippet-highlight', kwargs=kwargs))
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+
+    def test_users(self):
+        client = APIClient()
+        self.assertSamePayload(reverse('user-list'), reverse('async-user-list'), client=client)
+        # Deactivated users are only listed for staff who ask for them.
+        client.force_login(self.staff)
+        response = self.assertSamePayload(
+            reverse('user-list'), reverse('async-user-list'), client=client,
+            params={'include_deactivated': 1},
+        )
+        self.assertEqual(response.json()['count'], 3)
+
+    def test_audit_log(self):
+        AuditLog.objects.create(action='create', user=self.user, model_name='Snippet', model_id=1)
+        AuditLog.objects.create(action='delete', user=self.staff, model_name='Snippet', model_id=1)
+        url = reverse('async-audit-log')
+        response = self.assertSamePayload(reverse('audit-log'), url)
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+        self.assertEqual(response['WWW-Authenticate'], 'Basic realm="api"')
+        user_client = APIClient()
+        user_client.force_login(self.user)
+        response = self.assertSamePayload(reverse('audit-log'), url, client=user_client)
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION='Token ' + Token.objects.create(user=self.staff).key)
+        response = self.assertSamePayload(
+            reverse('audit-log'), url, client=client, params={'action': 'delete'}
+        )
+        self.assertEqual(response.json()['count'], 1)
+        self.assertSamePayload(reverse('audit-log'), url, client=client, params={'user': 'x'})
+        client.credentials(HTTP_AUTHORIZATION='Token invalid')
+        self.assertEqual(client.get(url).status_code, status.HTTP_401_UNAUTHORIZED)
+
+
+class TestSnippetSearch(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='testuser', password='testpassword')
+        self.other = User.objects.create_user(username='other', password='testpassword')
+        self.in_title = Snippet.objects.create(title='parse config', code='x = 1', owner=self.user)
+        self.in_code = Snippet.objects.create(
+            title='loader', code='import json\n\ndef load(path):\n    return parse(open(path))',
+            owner=self.other, language='python3',
+        )
+        Snippet.objects.create(title='unrelated', code='y = <2>', owner=self.user)
+        self.url = reverse('snippet-search')
+
+    def search(self, **params):
+        response = self.client.get(self.url, params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response.data['results']
+
+    def check_backend(self):
+        results = self.search(q='parse')
+        self.assertEqual([r['id'] for r in results], [self.in_title.pk, self.in_code.pk])
+        self.assertGreater(results[0]['rank'], results[1]['rank'])
+        self.assertEqual(results[0]['highlights']['title'], '<mark>parse</mark> config')
+        self.assertIn('<mark>parse</mark>(open(path))', results[1]['highlights']['code'])
+        # Every word must match.
+        self.assertEqual([r['id'] for r in self.search(q='parse open')], [self.in_code.pk])
+        self.assertEqual([r['id'] for r in self.search(q='parse', owner=self.other.pk)], [self.in_code.pk])
+        self.assertEqual([r['id'] for r in self.search(q='parse', language='python3')], [self.in_code.pk])
+        self.assertEqual(self.search(q='missing'), [])
+        self.assertEqual(self.client.get(self.url, {'q': '()'}).status_code, status.HTTP_400_BAD_REQUEST)
+        # Matches are highlighted in escaped text.
+        self.assertIn('&lt;<mark>2</mark>&gt;', self.search(q='2')[0]['highlights']['code'])
+
+    def test_fts5(self):
+        self.check_backend()
+        # The last word also matches as a prefix.
+        self.assertEqual([r['id'] for r in self.search(q='conf')], [self.in_title.pk])
+
+    @override_settings(SNIPPETS={'SEARCH_BACKEND': 'scan'})
+    def test_scan(self):
+        self.check_backend()
+
+    def test_index_follows_writes(self):
+        self.in_title.title = 'renamed'
+        self.in_title.save()
+        Snippet.objects.filter(pk=self.in_code.pk).update(code='pass')
+        Snippet.objects.bulk_create([Snippet(code='parse()', owner=self.user)])
+        self.assertEqual(len(self.search(q='parse')), 1)
+        Snippet.objects.filter(code='parse()').delete()
+        self.assertEqual(self.search(q='parse'), [])
+        self.assertEqual(len(self.search(q='renamed')), 1)
+
+    def test_rebuild_search_index(self):
+        with connection.cursor() as cursor:
+            cursor.execute('DROP TRIGGER snippets_snippet_fts_insert')
+        Snippet.objects.create(title='parse again', code='z', owner=self.user)
+        self.assertEqual(len(self.search(q='parse')), 2)
+        call_command('rebuild_search_index', stdout=StringIO())
+        self.assertEqual(len(self.search(q='parse')), 3)
+        Snippet.objects.create(title='parse more', code='z', owner=self.user)
+        self.assertEqual(len(self.search(q='parse')), 4)
+
+    def test_queries(self):
+        with self.assertNumQueries(2):
+            self.search(q='parse')
+
+
+@override_settings(SNIPPETS={'AUDIT_SINK': 'sync', 'BLOB_COMPRESS_MIN_SIZE': 1024})
+class TestBlobStorage(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='testuser', password='testpassword')
+
+    def test_identical_snippets_share_a_blob(self):
+        first = Snippet.objects.create(code='a = 1', owner=self.user)
+        second = Snippet.objects.create(code='a = 1', owner=self.user)
+        self.assertEqual(first.highlighted_blob_id, second.highlighted_blob_id)
+        blob = Blob.objects.get()
+        self.assertEqual(blob.refcount, 2)
+        self.assertEqual(blob.text, first.highlighted)
+
+        second.code = 'b = 2'
+        second.save()
+        blob.refresh_from_db()
+        self.assertEqual(blob.refcount, 1)
+        # The last reference going away deletes the blob.
+        first.delete()
+        self.assertFalse(Blob.objects.filter(pk=blob.pk).exists())
+        self.assertEqual(Blob.objects.get().refcount, 1)
+
+    def test_bulk_writes_keep_refcounts(self):
+        self.client.force_authenticate(user=self.user)
+        url = reverse('snippet-bulk')
+        response = self.client.post(url, [{'code': 'a = 1'}] * 3, format='json')
+        self.assertEqual(Blob.objects.get().refcount, 3)
+        ids = [item['id'] for item in response.data]
+        self.client.patch(url, [{'id': ids[0], 'code': 'b = 2'}], format='json')
+        self.assertEqual(sorted(Blob.objects.values_list('refcount', flat=True)), [1, 2])
+        self.client.delete(url, ids, format='json')
+        self.assertFalse(Blob.objects.exists())
+
+    def test_large_html_is_compressed(self):
+        snippet = Snippet.objects.create(code='x = 1\n' * 200, owner=self.user)
+        blob = Blob.objects.get()
+        self.assertTrue(blob.compressed)
+        self.assertLess(len(blob.data), blob.size)
+        snippet = Snippet.objects.get(pk=snippet.pk)
+        self.assertEqual(snippet.highlighted, highlight.render(*snippet.render_inputs()))
+        response = self.client.get(reverse('snippet-highlight', kwargs={'pk': snippet.pk}))
+        self.assertIn(snippet.highlighted, b''.join(response.streaming_content).decode())
+
+    def test_blob_storage_command(self):
+        for _ in range(3):
+            Snippet.objects.create(code='a = 1', owner=self.user)
+        Blob.objects.update(refcount=0)
+        Blob.objects.create(hash='orphan', data=b'', size=0)
+        out = StringIO()
+        call_command('blob_storage', '--repair', stdout=out)
+        self.assertIn('deleted 1 unreferenced blobs', out.getvalue())
+        self.assertIn('3 snippets share 1 blobs', out.getvalue())
+        self.assertEqual(Blob.objects.get().refcount, 3)
+
+
+class TestTriggers(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='testpassword')
+
+    def test_missing_triggers_are_reported_and_reinstalled_after_migrate(self):
+        blobs.uninstall(connection)
+        softdelete.uninstall(connection)
+        warnings = triggers.check_triggers(None, databases=['default'])
+        self.assertEqual([warning.id for warning in warnings], ['snippets.W001'] * 2)
+        self.assertIn('snippets_blob_ref_insert', warnings[0].msg)
+        snippet = Snippet.objects.create(code='a = 1', owner=self.user)
+        self.assertEqual(Blob.objects.get().refcount, 0)
+
+        emit_post_migrate_signal(0, False, 'default')
+        self.assertEqual(triggers.check_triggers(None, databases=['default']), [])
+        self.assertEqual(Blob.objects.get().refcount, 1)
+        snippet.delete()
+        self.assertFalse(Blob.objects.exists())
+
+    def test_other_databases_are_refused(self):
+        with mock.patch.object(connections['default'], 'vendor', 'postgresql'):
+            errors = triggers.check_database_vendor(None)
+        self.assertEqual([error.id for error in errors], ['snippets.E001'])
+
+    def test_stale_render_keeps_a_blob_still_referenced(self):
+        snippet = Snippet.objects.create(code='a = 1', owner=self.user)
+        # As on a database whose triggers were lost.
+        Blob.objects.update(refcount=0)
+        future = Future()
+        future.set_result(snippet.highlighted)
+        _store_render(snippet.pk, 'stale', False, future, release_connections=False)
+        self.assertEqual(Snippet.objects.get(pk=snippet.pk).highlighted_blob_id, snippet.highlighted_blob_id)
+
+
+class TestIncrementalRender(TestCase):
+    sources = {
+        'python': 'def f(a, b):\n    """Doc\n    string."""\n    return a + b  # sum\n\n' * 30,
+        'javascript': "function f(a) {\n  /* block\n  comment */\n  return 'x' + a;\n}\n" * 30,
+        'sql': "SELECT a, 'b\nc' FROM t -- note\nWHERE x = \"y\";\n" * 30,
+        'css': 'p {\n  color: red; /* c\n  */\n  content: "x";\n}\n' * 30,
+        'bash': 'x="a\nb"\ncat <<EOF\nhello $x\nEOF\nif [ -f x ]; then echo \'y\'; fi # c\n' * 30,
+        # Rendered in full, see incremental.LEXERS.
+        'rst': 'Title\n=====\n\n.. code:: python\n\n   x = 1\n=====\n\n* item *emph* ``lit``\n' * 30,
+        'markdown': '# Head\n\nSome *text* and `code`\n\n```python\nx = 1\n```\n> quote\n' * 30,
+        'html': '<div class="a">\n<!-- c\n -->\n<script>\nvar a = \'<\';\n</script>\n</div>\n' * 30,
+    }
+    inserts = [
+        '\n', '"', "'", '"""', '/*', '*/', '--', '#', '{', '}', 'x = 1', '`', '```', '<!--', '-->',
+        '=====', '   ', '.. code:: python', '<<EOF', 'EOF',
+    ]
+
+    def edit(self, rng, code):
+        lines = code.split('\n')
+        line = rng.randrange(len(lines))
+        choice = rng.random()
+        if choice < 0.6:
+            column = rng.randrange(len(lines[line]) + 1)
+            lines[line] = lines[line][:column] + rng.choice(self.inserts) + lines[line][column:]
+        elif choice < 0.8:
+            del lines[line:line + rng.randrange(1, 4)]
+        else:
+            lines.insert(line, rng.choice(lines))
+        return '\n'.join(lines)
+
+    def rerender(self, previous, *inputs):
+        # As Snippet.render_large does.
+        return incremental.rerender(previous, *inputs) or incremental.render(*inputs)
+
+    def test_random_edits_render_identically(self):
+        rng = random.Random(21)
+        for language, code in self.sources.items():
+            for full in (False, True):
+                html, checkpoints = incremental.render(code, language, 'friendly', False, 'T', full)
+                self.assertEqual(checkpoints is None, language in ('rst', 'markdown', 'html'))
+                for _ in range(25):
+                    edited = self.edit(rng, code)
+                    previous = incremental.Previous(
+                        code, language, 'friendly', False, 'T', full, html, checkpoints
+                    )
+                    html, checkpoints = self.rerender(previous, edited, language, 'friendly', False, 'T', full)
+                    with self.subTest(language=language, full=full, code=edited):
+                        self.assertEqual(
+                            html, highlight.render(edited, language, 'friendly', False, 'T', full)
+                        )
+                        self.assertEqual(
+                            checkpoints,
+                            incremental.render(edited, language, 'friendly', False, 'T', full)[1],
+                        )
+                    code = edited
+
+    def test_heredoc_ended_by_a_later_line(self):
+        code = 'cat <<EOFEOF\nEOF\n' + 'echo $x\n' * 100
+        html, checkpoints = incremental.render(code, 'bash', 'friendly', False, '')
+        edited = code + 'EOFEOF\n'
+        previous = incremental.Previous(code, 'bash', 'friendly', False, '', False, html, checkpoints)
+        html, _ = incremental.rerender(previous, edited, 'bash', 'friendly', False, '')
+        self.assertEqual(html, highlight.render(edited, 'bash', 'friendly', False, ''))
+
+    def test_closing_an_earlier_comment(self):
+        code = 'var a = 1;\n/* open\n' + 'var b = 2;\n' * 100
+        html, checkpoints = incremental.render(code, 'javascript', 'friendly', False, '')
+        edited = code + '*/\n'
+        previous = incremental.Previous(code, 'javascript', 'friendly', False, '', False, html, checkpoints)
+        html, _ = incremental.rerender(previous, edited, 'javascript', 'friendly', False, '')
+        self.assertEqual(html, highlight.render(edited, 'javascript', 'friendly', False, ''))
+
+    @override_settings(SNIPPETS={'INCREMENTAL_RENDER_MIN_LINES': 50})
+    def test_edits_relex_only_changed_lines(self):
+        highlight.get_render_cache().clear()
+        user = User.objects.create_user(username='testuser', password='testpassword')
+        code = ''.join(f'x{i} = {i}\n' for i in range(200))
+        snippet = Snippet.objects.create(code=code, owner=user)
+        self.assertEqual(snippet.render_checkpoints, {'states': [[0, 201, ['root']]], 'scans': []})
+        self.assertIsNone(Snippet.objects.create(code='x = 1', owner=user).render_checkpoints)
+
+        client = APIClient()
+        client.force_authenticate(user=user)
+        edited = code.replace('x150 = 150', 'x150 = """\n150\n"""')
+        with mock.patch.object(incremental, 'lex', wraps=incremental.lex) as lex:
+            response = client.patch(
+                reverse('snippet-detail', kwargs={'pk': snippet.pk}), {'code': edited}, format='json'
+            )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        # Lexing resumed just before the edited line.
+        self.assertEqual(lex.call_count, 1)
+        self.assertEqual(lex.call_args.args[4], 150 - incremental.MARGIN)
+        snippet = Snippet.objects.get(pk=snippet.pk)
+        self.assertEqual(snippet.highlighted, highlight.render(*snippet.render_inputs()))
+        self.assertEqual(snippet.render_checkpoints, incremental.render(*snippet.render_inputs())[1])
+        key = highlight.cache_key(snippet.render_key, False)
+        self.assertIsNone(highlight.get_render_cache().get(key))
+
+
+class TestAdmin(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_superuser(username='admin', password='password')
+        self.client.force_login(self.user)
+
+    def test_snippet_changelist_reads_displayed_columns(self):
+        Snippet.objects.create(title='long', code='x' * 500, owner=self.user)
+        Snippet.objects.create(title='short', code='short_code', owner=self.user)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/admin/snippets/snippet/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertContains(response, 'x' * 80 + '…')
+        self.assertNotContains(response, 'x' * 81)
+        self.assertContains(response, 'short_code')
+        # The code is only read up to the preview.
+        self.assertEqual(
+            selected_columns(queries, 'snippets_snippet'), {'id', 'title', 'language', 'owner_id', 'code'}
+        )
+        self.assertTrue(any('SUBSTR("snippets_snippet"."code", 1, 81)' in query['sql'] for query in queries))
+        self.assertFalse(any(', "snippets_snippet"."code",' in query['sql'] for query in queries))
+        self.assertEqual(selected_columns(queries, 'auth_user'), {'id', 'username'})
+        self.assertFalse(any('snippets_blob' in query['sql'] for query in queries))
+
+    @override_settings(SNIPPETS={'ADMIN_EXACT_COUNT_LIMIT': 3})
+    def test_audit_log_counts_are_bounded(self):
+        AuditLog.objects.bulk_create(
+            AuditLog(action='create', model_name='Snippet', model_id=i, user=self.user) for i in range(6)
+        )
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/admin/snippets/auditlog/')
+        self.assertEqual(response.context['cl'].result_count, 6)
+        self.assertFalse(any('COUNT(' in query['sql'] for query in queries))
+        # A single join loads the users of the page.
+        self.assertEqual(sum('"auth_user"' in query['sql'] for query in queries), 2)
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/admin/snippets/auditlog/', {'action': 'create'})
+        self.assertEqual(response.context['cl'].result_count, 4)
+        counts = [query['sql'] for query in queries if 'COUNT(' in query['sql']]
+        self.assertEqual(len(counts), 1)
+        self.assertIn('LIMIT 4', counts[0])
+
+    def test_audit_log_filters_use_indexes(self):
+        entries = AuditLog.objects.bulk_create(
+            AuditLog(action=action, model_name=model_name, model_id=1)
+            for action, model_name in [('create', 'Snippet'), ('delete', 'Snippet'), ('create', 'User')]
+        )
+        now = timezone.now()
+        AuditLog.objects.filter(pk=entries[0].pk).update(timestamp=now.replace(year=now.year - 1))
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/admin/snippets/auditlog/')
+        self.assertContains(response, f'?timestamp__year={now.year - 1}')
+        self.assertContains(response, f'?timestamp__year={now.year}')
+        self.assertContains(response, '?action=delete')
+        self.assertContains(response, '?model_name=User')
+        for query in queries:
+            self.assertNotIn('DISTINCT', query['sql'])
+            self.assertNotIn('django_datetime', query['sql'])
+
+        response = self.client.get('/admin/snippets/auditlog/', {'timestamp__year': now.year})
+        self.assertEqual(response.context['cl'].result_count, 2)
+        self.assertContains(response, f'?timestamp__month={now.month}&amp;timestamp__year={now.year}')
+
+
+class TestSoftDelete(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.staff = User.objects.create_user(username='staff', password='testpassword', is_staff=True)
+        self.user = User.objects.create_user(username='testuser', password='testpassword')
+        self.snippet = Snippet.objects.create(title='hidden', code='hidden_word = 1', owner=self.user)
+        Snippet.objects.create(code='b = 2', owner=self.staff)
+
+    def deactivate(self):
+        self.client.force_authenticate(user=self.staff)
+        self.client.delete(reverse('user-detail', kwargs={'pk': self.user.pk}))
+        self.client.force_authenticate(user=None)
+
+    def test_deactivated_users_snippets_are_hidden(self):
+        self.deactivate()
+        self.assertFalse(Snippet.all_objects.get(pk=self.snippet.pk).owner_active)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('snippet-list'))
+        self.assertEqual(response.data['count'], 1)
+        # Visibility is read from the snippets table alone.
+        count = next(query['sql'] for query in queries if 'COUNT(' in query['sql'])
+        self.assertNotIn('auth_user', count)
+        detail = reverse('snippet-detail', kwargs={'pk': self.snippet.pk})
+        self.assertEqual(self.client.get(detail).status_code, status.HTTP_404_NOT_FOUND)
+        response = self.client.get(reverse('snippet-search'), {'q': 'hidden_word'})
+        self.assertEqual(response.data['count'], 0)
+        user_detail = reverse('user-detail', kwargs={'pk': self.user.pk})
+        self.assertEqual(self.client.get(user_detail).status_code, status.HTTP_404_NOT_FOUND)
+
+        self.client.force_authenticate(user=self.staff)
+        response = self.client.get(reverse('snippet-list'), {'include_deactivated': 1})
+        self.assertEqual(response.data['count'], 2)
+        self.assertEqual(self.client.get(detail, {'include_deactivated': 1}).status_code, status.HTTP_200_OK)
+        self.assertEqual(self.client.get(user_detail, {'include_deactivated': 1}).status_code, status.HTTP_200_OK)
+        self.assertEqual(self.client.get(detail).status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_deactivated_users_snippets_shown_to_staff(self):
+        self.deactivate()
+        self.client.force_authenticate(user=self.staff)
+        params = {'include_deactivated': 1}
+        detail_url = reverse('snippet-detail', kwargs={'pk': self.snippet.pk})
+        user_detail = self.client.get(reverse('user-detail', kwargs={'pk': self.user.pk}), params)
+        self.assertEqual(user_detail.data['snippets_count'], 1)
+        self.assertEqual(user_detail.data['snippets'], ['http://testserver' + detail_url])
+        users = self.client.get(reverse('user-list'), params).data['results']
+        self.assertEqual([user['snippets'] for user in users if user['id'] == self.user.pk], [user_detail.data['snippets']])
+        self.assertEqual(sum(user['snippets_count'] for user in users), 2)
+
+        self.client.force_login(self.staff)
+        async_detail = reverse('async-snippet-detail', kwargs={'pk': self.snippet.pk})
+        self.assertEqual(self.client.get(async_detail).status_code, status.HTTP_404_NOT_FOUND)
+        self.assertEqual(self.client.get(async_detail, params).json()['title'], 'hidden')
+        response = self.client.get(reverse('async-snippet-list'), {**params, 'owner': self.user.pk})
+        self.assertEqual(response.json()['count'], 1)
+        highlight = reverse('async-snippet-highlight', kwargs={'pk': self.snippet.pk})
+        self.assertEqual(self.client.get(highlight, params).status_code, status.HTTP_200_OK)
+        response = self.client.get(reverse('async-user-list'), params)
+        self.assertEqual(sum(user['snippets_count'] for user in response.json()['results']), 2)
+        # Only staff see them.
+        self.client.logout()
+        self.assertEqual(self.client.get(async_detail, params).status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_visibility_follows_every_write(self):
+        User.objects.filter(pk=self.user.pk).update(is_active=False)
+        self.assertFalse(Snippet.objects.filter(pk=self.snippet.pk).exists())
+        created = Snippet.objects.create(code='c = 3', owner=self.user)
+        self.assertFalse(Snippet.objects.filter(pk=created.pk).exists())
+        Snippet.all_objects.filter(pk=created.pk).update(owner=self.staff)
+        self.assertTrue(Snippet.objects.filter(pk=created.pk).exists())
+        self.user.is_active = True
+        self.user.save()
+        self.assertTrue(Snippet.objects.filter(pk=self.snippet.pk).exists())
+
+    def test_sync_owner_active_command(self):
+        self.deactivate()
+        Snippet.all_objects.update(owner_active=True)
+        out = StringIO()
+        call_command('sync_owner_active', stdout=out)
+        self.assertIn('Updated the visibility of 1 snippets.', out.getvalue())
+        self.assertEqual(list(Snippet.objects.values_list('owner', flat=True)), [self.staff.pk])
+
+
+class TestValuesSerializers(TestCase):
+    def setUp(self):
+        self.factory = APIRequestFactory()
+        self.user = User.objects.create_user(username='testuser', password='testpassword', email='a@b.c')
+        User.objects.create_user(username='nosnippets', password='testpassword')
+        for i in range(5):
+            Snippet.objects.create(
+                title=f'title {i}', code=f'x = {i}', linenos=i % 2 == 0,
+                language=['python', 'c', 'js'][i % 3], style='monokai', owner=self.user,
+            )
+
+    def assertSameOutput(self, serializer_class, values_serializer_class, queryset, path):
+        for format in (None, 'json'):
+            context = {'request': Request(self.factory.get(path)), 'format': format}
+            expected = serializer_class(queryset, many=True, context=context).data
+            values = values_serializer_class(context)
+            output = values.serialize(values.values(queryset))
+            self.assertEqual(output, expected)
+            self.assertEqual([list(item) for item in output], [list(item) for item in expected])
+
+    def test_snippets(self):
+        queryset = Snippet.objects.select_related('owner')
+        self.assertSameOutput(SnippetSerializer, SnippetValuesSerializer, queryset, '/snippets/?page=2')
+
+    def test_users(self):
+        queryset = users_with_snippets(Snippet.objects)
+        self.assertSameOutput(UserSerializer, UserValuesSerializer, queryset, '/users/')
+        with override_settings(SNIPPETS={'USER_SNIPPET_LINKS_LIMIT': 2}):
+            self.assertSameOutput(UserSerializer, UserValuesSerializer, queryset, '/users/')
+
+    def test_list_views_use_values(self):
+        client = APIClient()
+        with mock.patch.object(SnippetSerializer, 'to_representation') as to_representation:
+            response = client.get(reverse('snippet-list'), {'pagination': 'cursor'})
+        to_representation.assert_not_called()
+        self.assertEqual(len(response.data['results']), 5)
+        with self.assertNumQueries(3):
+            response = client.get(reverse('user-list'))
+        self.assertEqual(response.data['results'][0]['snippets_count'], 5)
+        self.assertEqual(len(response.data['results'][0]['snippets']), 5)
+
+
+class TestSQLiteBackend(TestCase):
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        self.path = os.path.join(directory, 'db.sqlite3')
+
+    def wrapper(self, **options):
+        wrapper = DatabaseWrapper({**connection.settings_dict, 'NAME': self.path, 'OPTIONS': options})
+        self.addCleanup(wrapper.close)
+        return wrapper
+
+    def test_pragmas(self):
+        wrapper = self.wrapper(pragmas={'synchronous': None, 'cache_size': -1024})
+        with wrapper.cursor() as cursor:
+            cursor.execute('PRAGMA journal_mode')
+            self.assertEqual(cursor.fetchone()[0], 'wal')
+            cursor.execute('PRAGMA busy_timeout')
+            self.assertEqual(cursor.fetchone()[0], 5000)
+            cursor.execute('PRAGMA cache_size')
+            self.assertEqual(cursor.fetchone()[0], -1024)
+            # FULL, SQLite's default, rather than NORMAL.
+            cursor.execute('PRAGMA synchronous')
+            self.assertEqual(cursor.fetchone()[0], 2)
+        with self.assertRaises(ImproperlyConfigured):
+            self.wrapper(transaction_mode='LAZY')
+
+    def test_transaction_mode(self):
+        other = sqlite3.connect(self.path, timeout=0)
+        self.addCleanup(other.close)
+        for mode, locks in (('DEFERRED', False), ('IMMEDIATE', True)):
+            with self.subTest(mode):
+                wrapper = self.wrapper(transaction_mode=mode)
+                wrapper.ensure_connection()
+                # What transaction.atomic does to begin a transaction.
+                wrapper._start_transaction_under_autocommit()
+                if locks:
+                    with self.assertRaisesRegex(sqlite3.OperationalError, 'locked'):
+                        other.execute('BEGIN IMMEDIATE')
+                else:
+                    other.execute('BEGIN IMMEDIATE')
+                    other.rollback()
+                wrapper.connection.rollback()
+
+    def test_health_check(self):
+        wrapper = self.wrapper()
+        wrapper.ensure_connection()
+        self.assertTrue(wrapper.is_usable())
+        wrapper.connection.close()
+        self.assertFalse(wrapper.is_usable())
@@ -0,0 +1,114 @@
+"""
+The SQLite triggers the snippets tables depend on.
+
+Triggers keep blob refcounts (`snippets.blobs`), the copies of owners'
+``is_active`` (`snippets.softdelete`) and the search index
+(`snippets.search`) in sync. A migration that makes Django rebuild a table
+silently drops its triggers, so after every ``migrate`` the missing ones are
+reinstalled and what they keep is recomputed, and a system check reports
+any that are still missing. Blob refcounts are kept by nothing else, so the
+check refuses databases other than SQLite.
+"""
+from django.core import checks
+from django.db import connections, transaction
+from django.db.migrations.executor import MigrationExecutor
+
+from . import blobs, softdelete
+from .search import FTS_TABLE, FTS5Backend
+
+TRIGGERS = {
+    "blob refcount": [
+        "snippets_blob_ref_insert",
+        "snippets_blob_ref_delete",
+        "snippets_blob_ref_update",
+    ],
+    "owner_active": [
+        "snippets_owner_active_user",
+        "snippets_owner_active_insert",
+        "snippets_owner_active_owner",
+    ],
+    "search index": [f"{FTS_TABLE}_insert", f"{FTS_TABLE}_delete", f"{FTS_TABLE}_update"],
+}
+
+
+def missing(connection):
+    """
+    Return a dict of the triggers missing on `connection`, by what they
+    keep in sync.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT name FROM sqlite_master WHERE type = 'trigger'")
+        installed = {name for name, in cursor.fetchall()}
+    return {
+        kind: [name for name in names if name not in installed]
+        for kind, names in TRIGGERS.items()
+        if not installed.issuperset(names)
+    }
+
+
+def migrated(connection):
+    # Until the last migration is applied the tables may not match the triggers.
+    executor = MigrationExecutor(connection)
+    return not executor.migration_plan(executor.loader.graph.leaf_nodes())
+
+
+def repair(connection):
+    """
+    Reinstall the triggers missing on `connection` and recompute what they
+    keep. Returns the kinds of triggers reinstalled.
+    """
+    from django.contrib.auth.models import User
+
+    from .models import Blob, Snippet
+
+    lost = missing(connection)
+    with transaction.atomic(using=connection.alias):
+        if "blob refcount" in lost:
+            blobs.install(connection)
+            blobs.recount(Blob, Snippet)
+        if "owner_active" in lost:
+            softdelete.install(connection)
+            softdelete.resync(Snippet, User)
+        if "search index" in lost:
+            with connection.cursor() as cursor:
+                FTS5Backend.install(cursor)
+    return sorted(lost)
+
+
+def repair_after_migrate(sender, using, **kwargs):
+    connection = connections[using]
+    if connection.vendor == "sqlite" and migrated(connection):
+        repair(connection)
+
+
+@checks.register()
+def check_database_vendor(app_configs, **kwargs):
+    return [
+        checks.Error(
+            f"The snippets app needs SQLite, database {alias!r} is "
+            f"{connections[alias].display_name}.",
+            hint="Blob refcounts are kept by SQLite triggers.",
+            id="snippets.E001",
+        )
+        for alias in connections
+        if connections[alias].vendor != "sqlite"
+    ]
+
+
+@checks.register(checks.Tags.database)
+def check_triggers(app_configs, databases=None, **kwargs):
+    errors = []
+    for alias in databases or []:
+        connection = connections[alias]
+        if connection.vendor != "sqlite" or not migrated(connection):
+            continue
+        for kind, names in missing(connection).items():
+            errors.append(
+                checks.Warning(
+                    f"The {kind} triggers {', '.join(names)} are missing "
+                    f"from database {alias!r}.",
+                    hint="Run 'python manage.py migrate' to reinstall them.",
+                    id="snippets.W001",
+                )
+            )
+    return errors
@@ -1,19 +1,73 @@
+import hashlib
+from collections import defaultdict
+
 from django.contrib.auth.models import User
-from rest_framework import generics, permissions, renderers
+from django.db import transaction
+from django.db.models import Count, OuterRef, Prefetch, Subquery
+from django.db.models.functions import Coalesce
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, parse_etags, quote_etag
+from rest_framework import generics, permissions, renderers, status
 from rest_framework.decorators import api_view
-from rest_framework.exceptions import PermissionDenied
+from rest_framework.exceptions import NotFound, PermissionDenied, ValidationError
 from rest_framework.mixins import CreateModelMixin, DestroyModelMixin
+from rest_framework.pagination import PageNumberPagination
 from rest_framework.response import Response
 from rest_framework.reverse import reverse
 
-from .models import Snippet, AuditLog
+from . import catalog
+from .audit import get_audit_sink
+from .conf import get_setting
+from .exceptions import PreconditionFailed
+from .filters import ActiveUserFilter, AuditLogFilter
+from .highlight import FRAGMENT, document_parts, get_render_cache, style_sheet
+from .instrumentation import InstrumentedViewMixin, metrics, timed
+from .models import RENDER_FAILED, RENDER_PENDING, RENDER_READY, Snippet, AuditLog, store_highlights
+from .pagination import PageNumberOrCursorPagination
 from .permissions import IsOwnerOrReadOnly, IsStaffOrReadOnly
-from .serializers import AuditLogSerializer, SnippetSerializer, UserSerializer
+from .renderers import CSSRenderer, CSVRenderer, NDJSONRenderer
+from .response_cache import LIST_SCOPE, get_response_cache, invalidate_snippets, snippet_scope
+from .search import get_search_backend, search_terms
+from .serializers import (
+    AuditLogExportSerializer,
+    AuditLogSerializer,
+    SnippetSearchSerializer,
+    SnippetSerializer,
+    SnippetValuesSerializer,
+    UserSerializer,
+    UserValuesSerializer,
+)
+from .softdelete import include_deactivated
 
 ACTION_CREATE = "create"
 ACTION_UPDATE = "update"
 ACTION_DELETE = "delete"
 
+# Columns each snippet endpoint reads. The highlighted HTML is by far the
+# largest value and only SnippetHighlight joins its blob.
+SNIPPET_SERIALIZER_FIELDS = (
+    "id", "title", "code", "linenos", "language", "style", "owner__username",
+)
+# Updates also need the render key to tell whether to re-render, and
+# `modified` so that saving the deferred instance stamps it.
+SNIPPET_DETAIL_FIELDS = SNIPPET_SERIALIZER_FIELDS + ("modified", "render_key", "render_state")
+SNIPPET_HIGHLIGHT_FIELDS = (
+    "highlighted_blob__data", "highlighted_blob__compressed",
+    "highlighted_format", "render_state", "style", "title",
+)
+
+STREAM_CHUNK_SIZE = 64 * 1024
+# Rows fetched from the database cursor and rendered at a time by exports.
+EXPORT_CHUNK_SIZE = 2000
+STYLE_SHEET_MAX_AGE = 60 * 60 * 24
+
+RENDER_PLACEHOLDERS = {
+    RENDER_PENDING: "<p>Highlighting is in progress, please try again shortly.</p>",
+    RENDER_FAILED: "<p>Highlighting failed and will be retried.</p>",
+}
+
 
 @api_view(["GET"])
 def api_root(request, format=None):
@@ -25,28 +79,219 @@ def api_root(request, format=None):
     )
 
 
+def visible_snippets(request):
+    """
+    The manager of the snippets `request` may see: those of active owners,
+    and for staff asking with "?include_deactivated=1" all of them.
+    """
+    if include_deactivated(request.user, request.query_params):
+        return Snippet.all_objects
+    return Snippet.objects
+
+
 def save_audit_log(request, action, model_name, model_id):
-    AuditLog.objects.create(user=request.user,
-                            action=action,
-                            model_name=model_name,
-                            model_id=model_id)
+    with timed("audit"):
+        get_audit_sink().record(user=request.user,
+                                action=action,
+                                model_name=model_name,
+                                model_id=model_id)
+
+
+def save_audit_logs(request, action, model_name, model_ids):
+    with timed("audit"):
+        get_audit_sink().record_many(
+            dict(user=request.user, action=action, model_name=model_name, model_id=model_id)
+            for model_id in model_ids
+        )
+
+
+class ConditionalSnippetMixin:
+    """
+    Conditional requests for a single snippet. The ETag hashes `etag_fields`
+    and the response format, and `modified` is the Last-Modified date. They
+    are read with a query for a few small columns, so a 304 (or a 412 for a
+    failed If-Match) is answered without loading or serializing the snippet.
+    """
+    etag_fields = ()
+
+    def get_validators(self):
+        row = (
+            visible_snippets(self.request).filter(pk=self.kwargs["pk"])
+            .values("modified", *self.etag_fields)
+            .first()
+        )
+        if row is None:
+            raise NotFound
+        parts = [str(row[name]) for name in self.etag_fields]
+        parts.append(self.request.accepted_renderer.format)
+        etag = hashlib.sha256("\0".join(parts).encode("utf-8")).hexdigest()[:32]
+        return quote_etag(etag), int(row["modified"].timestamp())
+
+    def conditional_get(self, request, handler, *args, **kwargs):
+        etag, last_modified = self.get_validators()
+        response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if response is None:
+            response = handler(request, *args, **kwargs)
+        return self.set_validators(response, etag, last_modified)
+
+    def check_preconditions(self, request):
+        """
+        Raise PreconditionFailed unless the If-Match and If-Unmodified-Since
+        headers of a write match the current snippet.
+        """
+        etag, last_modified = self.get_validators()
+        if get_conditional_response(request, etag=etag, last_modified=last_modified) is not None:
+            raise PreconditionFailed
+
+    def set_validators(self, response, etag, last_modified):
+        if response.status_code in (status.HTTP_200_OK, status.HTTP_304_NOT_MODIFIED):
+            response["ETag"] = etag
+            response["Last-Modified"] = http_date(last_modified)
+        return response
 
 
-class SnippetHighlight(generics.GenericAPIView):
-    queryset = Snippet.objects.select_related("owner").all()
+class SnippetHighlight(InstrumentedViewMixin, ConditionalSnippetMixin, generics.GenericAPIView):
     renderer_classes = (renderers.StaticHTMLRenderer,)
+    etag_fields = ("render_key", "render_state", "highlighted_format")
+
+    def get_queryset(self):
+        return (
+            visible_snippets(self.request)
+            .select_related("highlighted_blob")
+            .only(*SNIPPET_HIGHLIGHT_FIELDS)
+        )
 
     def get(self, request, *args, **kwargs):
+        return self.conditional_get(request, self.render_highlight, *args, **kwargs)
+
+    def render_highlight(self, request, *args, **kwargs):
         snippet = self.get_object()
+        if snippet.render_state != RENDER_READY:
+            # Rendering happens off the request path in async highlight mode.
+            return Response(
+                RENDER_PLACEHOLDERS[snippet.render_state],
+                status=status.HTTP_202_ACCEPTED,
+                headers={"Retry-After": "1"},
+            )
+        if snippet.highlighted_format == FRAGMENT:
+            css_url = reverse(
+                "snippet-style-sheet", kwargs={"style": snippet.style}, request=request
+            )
+            return StreamingHttpResponse(
+                self.stream_document(snippet, css_url),
+                content_type="text/html; charset=utf-8",
+            )
         return Response(snippet.highlighted)
 
+    def stream_document(self, snippet, css_url):
+        header, footer = document_parts(snippet.title, css_url)
+        yield header
+        fragment = snippet.highlighted
+        for start in range(0, len(fragment), STREAM_CHUNK_SIZE):
+            yield fragment[start:start + STREAM_CHUNK_SIZE]
+        yield footer
+
+
+class SnippetStyleSheet(InstrumentedViewMixin, generics.GenericAPIView):
+    """
+    The style sheet shared by all highlighted snippets using a style.
+    """
+    renderer_classes = (CSSRenderer,)
+
+    def get(self, request, style, *args, **kwargs):
+        if style not in catalog.styles():
+            raise NotFound
+        css, etag = style_sheet(style)
+        etag = quote_etag(etag)
+        if etag in parse_etags(request.headers.get("If-None-Match", "")):
+            response = Response(status=status.HTTP_304_NOT_MODIFIED)
+        else:
+            response = Response(css)
+        response["ETag"] = etag
+        patch_cache_control(response, public=True, max_age=STYLE_SHEET_MAX_AGE)
+        return response
+
+
+class AnonymousResponseCacheMixin:
+    """
+    Serve GETs by anonymous users from the response cache, when enabled.
+    Responses carry an X-Cache header of HIT or MISS.
+    """
+
+    def cached_response(self, request, scopes, handler, *args, **kwargs):
+        response_cache = get_response_cache()
+        if response_cache is None or request.user.is_authenticated:
+            return handler(request, *args, **kwargs)
+        key = response_cache.key(
+            scopes, request.build_absolute_uri(), request.accepted_renderer.format
+        )
+        data = response_cache.get(key)
+        if data is not None:
+            response = Response(data)
+            response["X-Cache"] = "HIT"
+            return response
+        response = handler(request, *args, **kwargs)
+        if response.status_code == status.HTTP_200_OK:
+            response_cache.set(key, response.data)
+            response["X-Cache"] = "MISS"
+        return response
 
-class SnippetList(generics.ListCreateAPIView, CreateModelMixin):
+
+class ValuesListMixin:
+    """
+    Lists with `values_serializer_class`, from `.values()` rows of the
+    page rather than model instances. The output is the same as listing
+    with `serializer_class`.
+    """
+    values_serializer_class = None
+
+    def list(self, request, *args, **kwargs):
+        serializer = self.values_serializer_class(self.get_serializer_context())
+        # Cursor pagination reads its position from the ordering columns.
+        ordering = getattr(self, "cursor_ordering", ())
+        queryset = self.filter_queryset(self.get_queryset())
+        rows = serializer.values(queryset, *(field.lstrip("-") for field in ordering))
+        # Count the rows without the joins the values read.
+        rows.count = queryset.count
+        page = self.paginate_queryset(rows)
+        if page is not None:
+            return self.get_paginated_response(serializer.serialize(page))
+        return Response(serializer.serialize(rows))
+
+
+class SnippetList(
+    InstrumentedViewMixin,
+    AnonymousResponseCacheMixin,
+    ValuesListMixin,
+    generics.ListCreateAPIView,
+    CreateModelMixin,
+):
     serializer_class = SnippetSerializer
+    values_serializer_class = SnippetValuesSerializer
     permission_classes = (permissions.IsAuthenticatedOrReadOnly,)
+    pagination_class = PageNumberOrCursorPagination
+    cursor_ordering = ("created", "id")
 
     def get_queryset(self):
-        return Snippet.objects.select_related("owner").all()
+        # The cursor ordering columns are read to build the next/previous links.
+        return visible_snippets(self.request).select_related("owner").only(
+            *SNIPPET_SERIALIZER_FIELDS, *self.cursor_ordering
+        )
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(request, [LIST_SCOPE], super().list, *args, **kwargs)
+
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+
+        # "?owner=<user id>" lists a single user's snippets, see UserSerializer.snippets_url
+        owner = self.request.query_params.get("owner")
+        if owner is not None:
+            if not owner.isdigit():
+                raise ValidationError({"owner": "Expected a user id."})
+            queryset = queryset.filter(owner_id=owner)
+
+        return queryset
 
     def perform_create(self, serializer):
         serializer.save(owner=self.request.user)
@@ -60,25 +305,83 @@ class SnippetList(generics.ListCreateAPIView, CreateModelMixin):
         return response
 
 
-class SnippetDetail(generics.RetrieveUpdateDestroyAPIView, DestroyModelMixin):
+class SnippetSearch(InstrumentedViewMixin, generics.ListAPIView):
+    """
+    Snippets whose title or code contain all words of "?q=", best matches
+    first. "?language=" and "?owner=<user id>" narrow the results.
+    """
+    serializer_class = SnippetSearchSerializer
+    pagination_class = PageNumberPagination
+
+    def get_queryset(self):
+        return visible_snippets(self.request).select_related("owner").only(
+            *SNIPPET_SERIALIZER_FIELDS
+        )
+
+    def get_terms(self):
+        terms = search_terms(self.request.query_params.get("q", ""))
+        if not terms:
+            raise ValidationError({"q": "Expected search terms."})
+        return terms
+
+    def filter_queryset(self, queryset):
+        params = self.request.query_params
+        language = params.get("language")
+        if language is not None:
+            queryset = queryset.filter(language=language)
+        owner = params.get("owner")
+        if owner is not None:
+            if not owner.isdigit():
+                raise ValidationError({"owner": "Expected a user id."})
+            queryset = queryset.filter(owner_id=owner)
+        return get_search_backend().search(queryset, self.get_terms())
+
+    def list(self, request, *args, **kwargs):
+        page = self.paginate_queryset(self.filter_queryset(self.get_queryset()))
+        # Only the page shown is highlighted.
+        get_search_backend().highlight(page, self.get_terms())
+        return self.get_paginated_response(self.get_serializer(page, many=True).data)
+
+
+class SnippetDetail(
+    InstrumentedViewMixin,
+    AnonymousResponseCacheMixin,
+    ConditionalSnippetMixin,
+    generics.RetrieveUpdateDestroyAPIView,
+    DestroyModelMixin,
+):
     serializer_class = SnippetSerializer
     permission_classes = (
         permissions.IsAuthenticatedOrReadOnly,
         IsOwnerOrReadOnly,
     )
+    # Every save stamps `modified`, and the payload shows the owner's name.
+    etag_fields = ("id", "modified", "render_key", "owner__username")
 
     def get_queryset(self):
-        return Snippet.objects.select_related("owner").all()
+        return visible_snippets(self.request).select_related("owner").only(*SNIPPET_DETAIL_FIELDS)
 
+    def get(self, request, *args, **kwargs):
+        return self.conditional_get(request, super().get, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached_response(
+            request, [snippet_scope(kwargs["pk"])], super().retrieve, *args, **kwargs
+        )
+
+    @transaction.atomic
     def update(self, request, *args, **kwargs):
+        self.check_preconditions(request)
         response = super().update(request, *args, **kwargs)
         save_audit_log(request=request,
                        action=ACTION_UPDATE,
                        model_name=response.data.serializer.Meta.model.__name__,
                        model_id=response.data["id"])
-        return response
+        return self.set_validators(response, *self.get_validators())
 
+    @transaction.atomic
     def destroy(self, request, *args, **kwargs):
+        self.check_preconditions(request)
         return super().destroy(request, *args, **kwargs)
 
     def perform_destroy(self, instance):
@@ -89,25 +392,190 @@ class SnippetDetail(generics.RetrieveUpdateDestroyAPIView, DestroyModelMixin):
         instance.delete()
 
 
-class UserList(generics.ListCreateAPIView):
-    serializer_class = UserSerializer
+class SnippetBulk(InstrumentedViewMixin, generics.GenericAPIView):
+    """
+    Create (POST), update (PATCH) or delete (DELETE) many of the requesting
+    user's snippets at once. POST takes a list of snippets, PATCH a list of
+    partial snippets with their "id", and DELETE a list of ids.
 
-    def get_queryset(self):
-        return User.objects.all()
+    Every item is validated first. If any is invalid, or repeats the id of
+    an earlier one, nothing is written and the 400 response lists the
+    errors of each item, in request order.
+    Otherwise the snippets are highlighted, written with one bulk query per
+    set of fields the items change and audited with one bulk write, all in
+    a single transaction.
+    """
+    serializer_class = SnippetSerializer
+    permission_classes = (permissions.IsAuthenticated,)
 
-    def filter_queryset(self, queryset):
-        queryset = super().filter_queryset(queryset)
+    def get_queryset(self):
+        return (
+            Snippet.objects.filter(owner=self.request.user)
+            .select_related("owner")
+            .only(*SNIPPET_DETAIL_FIELDS)
+        )
+
+    def get_items(self, request):
+        items = request.data
+        if not isinstance(items, list):
+            raise ValidationError({"non_field_errors": ["Expected a list of items."]})
+        limit = get_setting("BULK_MAX_ITEMS")
+        if len(items) > limit:
+            raise ValidationError({"non_field_errors": [f"At most {limit} items are allowed."]})
+        return items
+
+    def check_ids(self, ids):
+        """
+        Return the snippets of the requesting user with `ids`, by pk, and the
+        errors of each id: unknown or repeated ones.
+        """
+        # JSON true and false parse to bools, which pass for 1 and 0.
+        valid = [isinstance(pk, int) and not isinstance(pk, bool) for pk in ids]
+        snippets = self.get_queryset().in_bulk([pk for pk, ok in zip(ids, valid) if ok])
+        errors, seen = [], set()
+        for pk, ok in zip(ids, valid):
+            if not ok or pk not in snippets:
+                errors.append({"id": ["No snippet of yours has this id."]})
+            elif pk in seen:
+                errors.append({"id": ["This id is repeated."]})
+            else:
+                errors.append({})
+            seen.add(pk)
+        return snippets, errors
+
+    def written(self, snippets):
+        """
+        Return those of `snippets` that still exist, read in the write
+        transaction so only rows actually written are audited.
+        """
+        pks = Snippet.objects.filter(pk__in=[snippet.pk for snippet in snippets]).values_list("pk", flat=True)
+        pks = set(pks)
+        return [snippet for snippet in snippets if snippet.pk in pks]
+
+    def post(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=self.get_items(request), many=True)
+        serializer.is_valid(raise_exception=True)
+        snippets = [Snippet(owner=request.user, **data) for data in serializer.validated_data]
+        for snippet in snippets:
+            snippet.refresh_highlight()
+        with transaction.atomic():
+            store_highlights(snippets)
+            Snippet.objects.bulk_create(snippets)
+            save_audit_logs(request, ACTION_CREATE, Snippet.__name__, [s.pk for s in snippets])
+            # bulk_create sends no post_save signals.
+            invalidate_snippets([s.pk for s in snippets])
+            self.schedule_renders(snippets)
+        return Response(
+            self.get_serializer(snippets, many=True).data, status=status.HTTP_201_CREATED
+        )
+
+    def patch(self, request, *args, **kwargs):
+        items = self.get_items(request)
+        ids = [item.get("id") if isinstance(item, dict) else None for item in items]
+        snippets, errors = self.check_ids(ids)
+        checked = []
+        for index, (pk, item) in enumerate(zip(ids, items)):
+            if errors[index]:
+                continue
+            serializer = self.get_serializer(snippets[pk], data=item, partial=True)
+            checked.append(serializer)
+            if not serializer.is_valid():
+                errors[index] = serializer.errors
+        if any(errors):
+            raise ValidationError(errors)
+
+        with transaction.atomic():
+            # Each item is applied to its row as read, and locked, in the
+            # write transaction, and only the fields it changes are written,
+            # so concurrent edits to other fields are kept. Snippets deleted
+            # since they were validated are neither written nor audited.
+            current = self.get_queryset().select_for_update(of=("self",)).in_bulk(
+                [serializer.instance.pk for serializer in checked]
+            )
+            now = timezone.now()
+            updated, rendered, groups = [], [], defaultdict(list)
+            for serializer in checked:
+                snippet = current.get(serializer.instance.pk)
+                if snippet is None:
+                    continue
+                snippet.modified = now
+                for name, value in serializer.validated_data.items():
+                    setattr(snippet, name, value)
+                fields = {"modified", *serializer.validated_data}
+                # Only re-rendered snippets write the (deferred) highlight columns.
+                if snippet.refresh_highlight():
+                    rendered.append(snippet)
+                    fields.update(Snippet.HIGHLIGHT_FIELDS)
+                updated.append(snippet)
+                groups[frozenset(fields)].append(snippet)
+            store_highlights(rendered)
+            for fields, group in groups.items():
+                Snippet.objects.bulk_update(group, sorted(fields))
+            save_audit_logs(request, ACTION_UPDATE, Snippet.__name__, [s.pk for s in updated])
+            # bulk_update sends no post_save signals.
+            invalidate_snippets([s.pk for s in updated])
+            self.schedule_renders(rendered)
+        return Response(self.get_serializer(updated, many=True).data)
+
+    def delete(self, request, *args, **kwargs):
+        ids = self.get_items(request)
+        snippets, errors = self.check_ids(ids)
+        if any(errors):
+            raise ValidationError(errors)
+        with transaction.atomic():
+            deleted = [snippet.pk for snippet in self.written([snippets[pk] for pk in ids])]
+            Snippet.objects.filter(pk__in=deleted).delete()
+            save_audit_logs(request, ACTION_DELETE, Snippet.__name__, deleted)
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+    def schedule_renders(self, snippets):
+        # bulk_create and bulk_update bypass Snippet.save(), which would
+        # otherwise schedule the renders left pending in async mode.
+        for snippet in snippets:
+            if snippet.render_state == RENDER_PENDING:
+                transaction.on_commit(snippet.schedule_render)
+
+
+def users_with_snippets(snippets):
+    """
+    Users with what UserSerializer needs, read in a constant number of
+    queries: a per-user count of `snippets`, a manager of Snippet, and the
+    ids of (at most USER_SNIPPET_LINKS_LIMIT of) them in one prefetch.
+    """
+    snippet_count = (
+        snippets.filter(owner=OuterRef("pk"))
+        .order_by()
+        .values("owner")
+        .annotate(count=Count("pk"))
+        .values("count")
+    )
+    links = snippets.only("id", "owner_id")
+    limit = get_setting("USER_SNIPPET_LINKS_LIMIT")
+    if limit is not None:
+        links = links[:limit]
+    return User.objects.annotate(
+        snippets_count=Coalesce(Subquery(snippet_count), 0)
+    ).prefetch_related(
+        Prefetch("snippets", queryset=links, to_attr="snippet_links")
+    ).order_by("id")
+
+
+class UserQuerysetMixin:
+    """
+    Loads users with `users_with_snippets`, counting the snippets of
+    deactivated users too when they are shown.
+    """
 
-        # Don't include deactivated unless staff, and also specified flag "?include_deactivated=1"
-        include_deactivated = False
-        if self.request.user.is_staff:
-            include_deactivated = bool(self.request.query_params.get("include_deactivated", "") == "1")
+    def get_queryset(self):
+        return users_with_snippets(visible_snippets(self.request))
 
-        # Filter deactivated, unless flag set
-        if not include_deactivated:
-            queryset = queryset.filter(is_active=True)
 
-        return queryset
+class UserList(InstrumentedViewMixin, UserQuerysetMixin, ValuesListMixin, generics.ListCreateAPIView):
+    serializer_class = UserSerializer
+    values_serializer_class = UserValuesSerializer
+    pagination_class = PageNumberOrCursorPagination
+    cursor_ordering = ("id",)
+    filter_backends = (ActiveUserFilter,)
 
     def create(self, request, *args, **kwargs):
         # Only staff users can create new users
@@ -122,12 +590,10 @@ class UserList(generics.ListCreateAPIView):
         return response
 
 
-class UserDetail(generics.RetrieveDestroyAPIView, DestroyModelMixin):
+class UserDetail(InstrumentedViewMixin, UserQuerysetMixin, generics.RetrieveDestroyAPIView, DestroyModelMixin):
     serializer_class = UserSerializer
     permission_classes = (IsStaffOrReadOnly,)
-
-    def get_queryset(self):
-        return User.objects.all()
+    filter_backends = (ActiveUserFilter,)
 
     def perform_destroy(self, instance):
         save_audit_log(request=self.request,
@@ -138,11 +604,92 @@ class UserDetail(generics.RetrieveDestroyAPIView, DestroyModelMixin):
         instance.save(update_fields=["is_active"])
 
 
-class AuditLogList(generics.ListAPIView):
+class AuditLogList(InstrumentedViewMixin, generics.ListAPIView):
     serializer_class = AuditLogSerializer
     permission_classes = (IsStaffOrReadOnly,)
+    pagination_class = PageNumberOrCursorPagination
+    cursor_ordering = ("-id",)
+    filter_backends = (AuditLogFilter,)
 
     def get_queryset(self):
         if not self.request.user.is_staff:
-            raise PermissionDenied
+            # Challenges anonymous requests to authenticate.
+            self.permission_denied(self.request)
         return AuditLog.objects.select_related("user").all()
+
+
+class AuditLogExport(InstrumentedViewMixin, generics.GenericAPIView):
+    """
+    The whole audit log, oldest first, streamed as CSV or newline delimited
+    JSON (``?format=ndjson``). Takes the same filters as the audit log list.
+    Rows are read from a server side cursor and rendered in chunks, so
+    memory use does not grow with the size of the export.
+    """
+    serializer_class = AuditLogExportSerializer
+    permission_classes = (permissions.IsAdminUser,)
+    renderer_classes = (CSVRenderer, NDJSONRenderer)
+    filter_backends = (AuditLogFilter,)
+    pagination_class = None
+
+    def get_queryset(self):
+        return (
+            AuditLog.objects.select_related("user")
+            .only("id", "timestamp", "action", "model_name", "model_id", "user__username")
+            .order_by("id")
+        )
+
+    def get(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        renderer = request.accepted_renderer
+        response = StreamingHttpResponse(
+            renderer.stream(self.serialized_chunks(queryset), self.get_serializer().fields),
+            content_type=f"{renderer.media_type}; charset={renderer.charset}",
+        )
+        response["Content-Disposition"] = f'attachment; filename="audit_log.{renderer.format}"'
+        return response
+
+    def serialized_chunks(self, queryset):
+        chunk = []
+        for entry in queryset.iterator(chunk_size=EXPORT_CHUNK_SIZE):
+            chunk.append(entry)
+            if len(chunk) == EXPORT_CHUNK_SIZE:
+                yield self.get_serializer(chunk, many=True).data
+                chunk = []
+        if chunk:
+            yield self.get_serializer(chunk, many=True).data
+
+
+class ResponseCacheStats(InstrumentedViewMixin, generics.GenericAPIView):
+    """
+    Hit and miss counts of this process's anonymous response cache.
+    """
+    permission_classes = (permissions.IsAdminUser,)
+
+    def get(self, request, *args, **kwargs):
+        response_cache = get_response_cache()
+        if response_cache is None:
+            return Response({"enabled": False, "hits": 0, "misses": 0})
+        return Response(
+            {"enabled": True, "hits": response_cache.hits, "misses": response_cache.misses}
+        )
+
+
+class Metrics(InstrumentedViewMixin, generics.GenericAPIView):
+    """
+    Histograms of per-request phase timings and query counts by view, and
+    the counters of the highlight and response caches, for this process.
+    """
+    permission_classes = (permissions.IsAdminUser,)
+
+    def get(self, request, *args, **kwargs):
+        render_cache = get_render_cache()
+        response_cache = get_response_cache()
+        return Response({
+            "enabled": get_setting("INSTRUMENTATION"),
+            "views": metrics.snapshot(),
+            "highlight_cache": {"hits": render_cache.hits, "misses": render_cache.misses},
+            "response_cache": {
+                "hits": response_cache.hits if response_cache else 0,
+                "misses": response_cache.misses if response_cache else 0,
+            },
+        })
@@ -0,0 +1,79 @@
+"""
+Django's SQLite backend, tuned for a threaded server with concurrent writers.
+
+Two options are read from the database's OPTIONS on top of the ones passed
+to ``sqlite3.connect()``:
+
+* "pragmas", PRAGMAs run on every new connection. They are merged over
+  DEFAULT_PRAGMAS, and mapping one to None keeps SQLite's default. The
+  defaults switch to write-ahead logging, where readers never block the
+  writer nor the writer readers, and sync to disk at checkpoints instead
+  of every commit. Writers wait up to busy_timeout for the write lock, and
+  pages are read through a memory map and a larger page cache.
+* "transaction_mode", how `transaction.atomic` begins its transactions:
+  "DEFERRED" (the default of SQLite and Django), "IMMEDIATE" or
+  "EXCLUSIVE". A deferred transaction takes the write lock at its first
+  write. If another connection committed since the transaction first read,
+  SQLite fails that write at once with "database is locked", whatever the
+  busy timeout. An immediate transaction takes the write lock as it begins,
+  so writers queue for the lock instead of failing.
+
+With CONN_HEALTH_CHECKS, persistent connections are checked with a trivial
+query before being reused; Django's backend always reports them usable.
+"""
+from django.core.exceptions import ImproperlyConfigured
+from django.db.backends.sqlite3 import base
+
+DEFAULT_PRAGMAS = {
+    # Set first: the other pragmas do not depend on it, but it is the one
+    # that must succeed, and it persists in the database file.
+    "journal_mode": "wal",
+    # In WAL mode a commit stays durable across crashes of the process, only
+    # the last commits may roll back after a power loss.
+    "synchronous": "normal",
+    # Milliseconds a connection waits for a lock before "database is locked".
+    "busy_timeout": 5000,
+    "mmap_size": 256 * 1024 * 1024,
+    # Negative sizes are in KiB.
+    "cache_size": -64 * 1024,
+    "temp_store": "memory",
+}
+TRANSACTION_MODES = ("DEFERRED", "IMMEDIATE", "EXCLUSIVE")
+# Options of this backend rather than arguments of sqlite3.connect().
+BACKEND_OPTIONS = ("pragmas", "transaction_mode")
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    def __init__(self, settings_dict, *args, **kwargs):
+        super().__init__(settings_dict, *args, **kwargs)
+        options = settings_dict.get("OPTIONS", {})
+        pragmas = {**DEFAULT_PRAGMAS, **options.get("pragmas", {})}
+        self.pragmas = {name: value for name, value in pragmas.items() if value is not None}
+        self.transaction_mode = options.get("transaction_mode", "DEFERRED").upper()
+        if self.transaction_mode not in TRANSACTION_MODES:
+            raise ImproperlyConfigured(
+                f"transaction_mode must be one of {', '.join(TRANSACTION_MODES)}, "
+                f"not {self.transaction_mode!r}."
+            )
+
+    def get_connection_params(self):
+        params = super().get_connection_params()
+        for name in BACKEND_OPTIONS:
+            params.pop(name, None)
+        return params
+
+    def get_new_connection(self, conn_params):
+        conn = super().get_new_connection(conn_params)
+        for name, value in self.pragmas.items():
+            conn.execute(f"PRAGMA {name} = {value}")
+        return conn
+
+    def is_usable(self):
+        try:
+            self.connection.execute("SELECT 1")
+        except base.Database.Error:
+            return False
+        return True
+
+    def _start_transaction_under_autocommit(self):
+        self.cursor().execute(f"BEGIN {self.transaction_mode}")